@@ -1,18 +1,33 @@
 import os
 from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain.schema import HumanMessage, SystemMessage
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional
 import json
 
 from utils.extractjson import strip_json_markdown_block
+from utils.llm import HedgedLLM
+from utils.log import get_logger, log_payload
+
+logger = get_logger(__name__)
+
+PARSED_GOAL_FORMAT = """{
+                "main_objective": "clear objective statement",
+                "target_metrics": [{"metric": "name", "target": "value", "unit": "unit", "current": "starting value if stated, else null"}],
+                "timeline": "duration or specific dates",
+                "key_milestones": ["milestone1", "milestone2"],
+                "success_criteria": "how to measure success"
+            }"""
 
 class GoalParserAgent:
     def __init__(self):
-        self.llm = ChatGoogleGenerativeAI(
+        llm = ChatGoogleGenerativeAI(
             model="gemini-2.0-flash",
             google_api_key=os.getenv("GOOGLE_API_KEY"),
             temperature=0.1
         )
+        self.llm = HedgedLLM("goal_parser", llm)
+        # Packed calls take longer, so they get their own deadline and latency window
+        self.batch_llm = HedgedLLM("goal_parser_batch", llm)
     
     async def parse_goal(self, state: Dict[str, Any]) -> Dict[str, Any]:
         """Parse natural language goal into structured format"""
@@ -24,37 +39,70 @@ class GoalParserAgent:
         
         Return a JSON object string without using ```json with the following structure:
         {
-            "parsed_goal": {
-                "main_objective": "clear objective statement",
-                "target_metrics": [{"metric": "name", "target": "value", "unit": "unit"}],
-                "timeline": "duration or specific dates",
-                "key_milestones": ["milestone1", "milestone2"],
-                "success_criteria": "how to measure success"
-            }
+            "parsed_goal": """ + PARSED_GOAL_FORMAT + """
         }
         
         Plan type: """ + plan_type
         
         
-        print('Goal parsing system prompt:', system_prompt)
+        log_payload("goal_parser", "Goal parsing system prompt", system_prompt)
         
         messages = [
             SystemMessage(content=system_prompt),
             HumanMessage(content=f"Goal: {goal_description}")
         ]
-        print('Goal parsing messages:', messages)
+        log_payload("goal_parser", "Goal parsing messages", [message.content for message in messages])
         
         try:
             response = await self.llm.ainvoke(messages)
-            print('Goal parsing response:', strip_json_markdown_block(response.content))
-            parsed_data = json.loads(strip_json_markdown_block(response.content))
-            print('Parsed goal data:', parsed_data)
+            content = strip_json_markdown_block(response.content)
+            log_payload("goal_parser", "Goal parsing response", content)
+            parsed_data = json.loads(content)
             state["parsed_goal"] = parsed_data["parsed_goal"]
             state["status"] = "goal_parsed"
             
         except Exception as e:
-            print(f"Goal parsing failed: {str(e)}")
+            logger.exception("Goal parsing failed")
             state["error"] = f"Goal parsing failed: {str(e)}"
             state["status"] = "error"
         
         return state
+    
+    async def parse_goals_batch(self, goals: List[Dict[str, str]]) -> List[Optional[Dict[str, Any]]]:
+        """Parse several short goals ({"goal_description", "plan_type"}) in one LLM call; None where a goal was not parsed"""
+        
+        system_prompt = """You are a goal parsing agent. Parse each of the numbered goals into structured data.
+        
+        Return a JSON object string without using ```json with one entry per goal, keeping its index:
+        {
+            "parsed_goals": [
+                {
+                    "index": 0,
+                    "parsed_goal": """ + PARSED_GOAL_FORMAT + """
+                }
+            ]
+        }"""
+        
+        goal_list = "\n".join(
+            f"{index}. ({goal['plan_type']}) {goal['goal_description']}" for index, goal in enumerate(goals)
+        )
+        messages = [
+            SystemMessage(content=system_prompt),
+            HumanMessage(content=f"Goals:\n{goal_list}")
+        ]
+        log_payload("goal_parser", "Batch goal parsing messages", [message.content for message in messages])
+        
+        parsed: List[Optional[Dict[str, Any]]] = [None] * len(goals)
+        try:
+            response = await self.batch_llm.ainvoke(messages)
+            content = strip_json_markdown_block(response.content)
+            log_payload("goal_parser", "Batch goal parsing response", content)
+            for entry in json.loads(content)["parsed_goals"]:
+                index = entry.get("index")
+                if isinstance(index, int) and 0 <= index < len(goals) and entry.get("parsed_goal"):
+                    parsed[index] = entry["parsed_goal"]
+        except Exception:
+            # Goals left unparsed go through the regular per-plan parse step
+            logger.exception("Batch goal parsing failed")
+        
+        return parsed
@@ -0,0 +1,207 @@
+import os
+import uuid
+import asyncio
+from datetime import datetime, timedelta
+from typing import Dict, Any, List, Optional
+from bson import ObjectId
+from pymongo import ReturnDocument
+
+from db.connection import get_collection
+from db.versioning import touch_plan, DocumentNotFoundError
+from db.migrations import plan_id_filter
+from agents.tracker import TrackerAgent
+from utils.llm import llm_available
+from utils.ai_stack import planner_agent
+from utils.log import get_logger
+from utils import metrics
+
+logger = get_logger(__name__)
+
+# Plans at least this long get milestones up front and their tasks one milestone at a time
+HIERARCHICAL_PLANS_ENABLED = os.getenv("HIERARCHICAL_PLANS_ENABLED", "true").lower() == "true"
+HIERARCHICAL_PLAN_MIN_DAYS = int(os.getenv("HIERARCHICAL_PLAN_MIN_DAYS", "60"))
+MILESTONE_DAYS = int(os.getenv("MILESTONE_DAYS", "21"))
+# A milestone starting within this many days is current and gets its tasks
+MILESTONE_EXPAND_AHEAD_DAYS = float(os.getenv("MILESTONE_EXPAND_AHEAD_DAYS", "7"))
+# An expansion that has not finished after this long is presumed dead and may be taken over
+MILESTONE_CLAIM_TIMEOUT_SECONDS = int(os.getenv("MILESTONE_CLAIM_TIMEOUT_SECONDS", "600"))
+MILESTONE_EXPANSION_CONCURRENCY = int(os.getenv("MILESTONE_EXPANSION_CONCURRENCY", "2"))
+
+PENDING = "pending"
+EXPANDING = "expanding"
+EXPANDED = "expanded"
+
+# Background expansions by plan id, so opening a plan twice does not start a second one
+_expansions: Dict[str, asyncio.Task] = {}
+_expansion_slots = asyncio.Semaphore(MILESTONE_EXPANSION_CONCURRENCY)
+
+def hierarchical(start: datetime, end: datetime) -> bool:
+    """Whether a plan over this range is created as milestones with lazily generated tasks"""
+    return HIERARCHICAL_PLANS_ENABLED and (end - start).days >= HIERARCHICAL_PLAN_MIN_DAYS
+
+def milestone_documents(phases: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Milestones as stored on the plan, from the planner's phases"""
+    
+    return [
+        {
+            "id": f"m{index + 1}",
+            "title": phase["title"],
+            "milestone": phase["milestone"],
+            "focus": phase["focus"],
+            "start_date": phase["start"],
+            "end_date": phase["end"],
+            "state": PENDING,
+            "tasks_count": 0
+        }
+        for index, phase in enumerate(phases)
+    ]
+
+def milestone_phase(milestone: Dict[str, Any]) -> Dict[str, Any]:
+    """A stored milestone in the phase shape the planner plans tasks for"""
+    
+    return {
+        "title": milestone["title"],
+        "milestone": milestone.get("milestone", ""),
+        "focus": milestone.get("focus", ""),
+        "start": milestone["start_date"],
+        "end": milestone["end_date"]
+    }
+
+def due_milestones(milestones: List[Dict[str, Any]], now: datetime) -> List[Dict[str, Any]]:
+    """Milestones without tasks that have started or start within MILESTONE_EXPAND_AHEAD_DAYS"""
+    
+    ahead = now + timedelta(days=MILESTONE_EXPAND_AHEAD_DAYS)
+    return [milestone for milestone in milestones if milestone["state"] != EXPANDED and milestone["start_date"] <= ahead]
+
+def completion_percentage(tasks: List[Dict[str, Any]], milestones: Optional[List[Dict[str, Any]]]) -> float:
+    """Percentage of the plan completed; milestones count by their length, and those without tasks as not started"""
+    
+    if not milestones:
+        completed = sum(1 for task in tasks if task["status"] == "completed")
+        return completed / len(tasks) * 100 if tasks else 0
+    
+    total_days = done_days = 0.0
+    for milestone in milestones:
+        milestone_tasks = [task for task in tasks if task.get("milestone_id") == milestone["id"]]
+        # The planner returned nothing for this milestone, so there is nothing to complete
+        if milestone["state"] == EXPANDED and not milestone_tasks:
+            continue
+        days = max((milestone["end_date"] - milestone["start_date"]).days, 1)
+        total_days += days
+        if milestone_tasks:
+            done_days += days * sum(1 for task in milestone_tasks if task["status"] == "completed") / len(milestone_tasks)
+    return done_days / total_days * 100 if total_days else 0
+
+async def save_milestones(state: Dict[str, Any]) -> None:
+    """Store a new plan's milestones and parsed goal, which later expansions plan from"""
+    
+    await get_collection("plans").update_one(
+        {"_id": ObjectId(state["plan_id"])},
+        {"$set": {"milestones": state["milestones"], "parsed_goal": state.get("parsed_goal", {})}}
+    )
+
+class MilestoneExpander:
+    """Generates and saves the tasks of a hierarchical plan's milestones when they become current or are opened"""
+    
+    def __init__(self):
+        self.plans_collection = get_collection("plans")
+        self.tasks_collection = get_collection("tasks")
+        self.tracker = TrackerAgent()
+    
+    async def _claim(self, plan_id: str, milestone_id: str, claim: str, now: datetime) -> Optional[Dict[str, Any]]:
+        """Mark a milestone as being expanded, unless it has tasks or another live expansion holds it"""
+        
+        claimable = {"id": milestone_id, "$or": [
+            {"state": PENDING},
+            {"state": EXPANDING, "claimed_at": {"$lt": now - timedelta(seconds=MILESTONE_CLAIM_TIMEOUT_SECONDS)}}
+        ]}
+        return await self.plans_collection.find_one_and_update(
+            {"_id": ObjectId(plan_id), "milestones": {"$elemMatch": claimable}},
+            {"$set": {"milestones.$.state": EXPANDING, "milestones.$.claim": claim, "milestones.$.claimed_at": now}},
+            projection={"user_id": 1, "plan_type": 1, "parsed_goal": 1, "milestones": 1},
+            return_document=ReturnDocument.AFTER
+        )
+    
+    async def _current_state(self, plan_id: str, milestone_id: str) -> str:
+        plan = await self.plans_collection.find_one({"_id": ObjectId(plan_id)}, {"milestones": 1})
+        for milestone in (plan or {}).get("milestones") or []:
+            if milestone["id"] == milestone_id:
+                return milestone["state"]
+        raise DocumentNotFoundError(f"Milestone {milestone_id} of plan {plan_id} not found")
+    
+    async def expand(self, plan_id: str, milestone_id: str, now: Optional[datetime] = None) -> Dict[str, Any]:
+        """Generate and save one milestone's tasks; a milestone already expanded or being expanded is left alone"""
+        
+        now = now or datetime.utcnow()
+        claim = uuid.uuid4().hex
+        plan = await self._claim(plan_id, milestone_id, claim, now)
+        if plan is None:
+            return {"state": await self._current_state(plan_id, milestone_id), "tasks_created": 0}
+        
+        milestone = next(milestone for milestone in plan["milestones"] if milestone["id"] == milestone_id)
+        scope = {"plan_id": plan_id_filter(plan_id), "milestone_id": milestone_id}
+        try:
+            # Tasks left by an expansion that died after writing them are replaced
+            await self.tasks_collection.delete_many(scope)
+            planned_tasks = await planner_agent().plan_phase(
+                milestone_phase(milestone), plan.get("parsed_goal") or {}, plan.get("plan_type", "")
+            )
+            tasks = await self.tracker.insert_tasks(
+                {"plan_id": plan_id, "user_id": plan["user_id"]},
+                [{**task, "milestone_id": milestone_id} for task in planned_tasks]
+            )
+        except Exception:
+            await self.tasks_collection.delete_many(scope)
+            await self.plans_collection.update_one(
+                {"_id": ObjectId(plan_id), "milestones": {"$elemMatch": {"id": milestone_id, "claim": claim}}},
+                {"$set": {"milestones.$.state": PENDING}, "$unset": {"milestones.$.claim": "", "milestones.$.claimed_at": ""}}
+            )
+            raise
+        
+        result = await self.plans_collection.update_one(
+            {"_id": ObjectId(plan_id), "milestones": {"$elemMatch": {"id": milestone_id, "claim": claim}}},
+            {"$set": {"milestones.$.state": EXPANDED, "milestones.$.tasks_count": len(tasks), "milestones.$.expanded_at": now},
+             "$unset": {"milestones.$.claim": "", "milestones.$.claimed_at": ""}}
+        )
+        if not result.modified_count:
+            # The claim timed out and another expansion took the milestone over; its tasks stand
+            await self.tasks_collection.delete_many({"_id": {"$in": [ObjectId(task.id) for task in tasks]}})
+            return {"state": await self._current_state(plan_id, milestone_id), "tasks_created": 0}
+        
+        await touch_plan(plan_id)
+        metrics.incr("milestones.expanded")
+        metrics.incr("milestones.tasks_created", len(tasks))
+        logger.info("Milestone expanded", extra={"plan_id": plan_id, "milestone_id": milestone_id, "tasks": len(tasks)})
+        return {"state": EXPANDED, "tasks_created": len(tasks)}
+    
+    async def expand_due(self, plan_id: str, now: Optional[datetime] = None) -> int:
+        """Expand every milestone of the plan that has become current, in timeline order"""
+        
+        now = now or datetime.utcnow()
+        plan = await self.plans_collection.find_one({"_id": ObjectId(plan_id)}, {"milestones": 1})
+        created = 0
+        for milestone in due_milestones((plan or {}).get("milestones") or [], now):
+            created += (await self.expand(plan_id, milestone["id"], now))["tasks_created"]
+        return created
+
+async def _expand_in_background(plan_id: str) -> None:
+    async with _expansion_slots:
+        try:
+            await MilestoneExpander().expand_due(plan_id)
+        except Exception:
+            logger.exception("Milestone expansion failed", extra={"plan_id": plan_id})
+
+def schedule_due_expansions(plan: Dict[str, Any], now: Optional[datetime] = None) -> bool:
+    """Start expanding an open plan's current milestones without waiting; True when an expansion was started"""
+    
+    now = now or datetime.utcnow()
+    plan_id = str(plan["_id"])
+    if not plan.get("is_active", True) or plan["end_date"] < now or plan_id in _expansions:
+        return False
+    if not due_milestones(plan.get("milestones") or [], now) or not llm_available():
+        return False
+    
+    expansion = asyncio.create_task(_expand_in_background(plan_id))
+    _expansions[plan_id] = expansion
+    expansion.add_done_callback(lambda _: _expansions.pop(plan_id, None))
+    return True
@@ -0,0 +1,238 @@
+import os
+import re
+import math
+import hashlib
+from typing import Dict, Any, List, Optional, Tuple
+from datetime import datetime, timedelta
+
+from db.connection import get_collection
+from agents.template_planner import _normalize_unit, _parse_number, _format_number
+from utils.dates import parse_utc
+from utils.log import get_logger
+from utils import metrics
+
+logger = get_logger(__name__)
+
+PLAN_LIBRARY_ENABLED = os.getenv("PLAN_LIBRARY_ENABLED", "true").lower() == "true"
+# Share stored plans between users, or only reuse a user's own plans. Stored plans carry the user's goal,
+# task titles and descriptions verbatim, so sharing copies one user's goal content into other users' plans
+PLAN_LIBRARY_SHARED = os.getenv("PLAN_LIBRARY_SHARED", "false").lower() == "true"
+PLAN_LIBRARY_MIN_SIMILARITY = float(os.getenv("PLAN_LIBRARY_MIN_SIMILARITY", "0.85"))
+# A new plan this close to a stored one is not stored again
+PLAN_LIBRARY_DEDUP_SIMILARITY = float(os.getenv("PLAN_LIBRARY_DEDUP_SIMILARITY", "0.98"))
+# Stored plans are adapted to targets and timelines at most this many times larger or smaller
+PLAN_LIBRARY_MAX_SCALE = float(os.getenv("PLAN_LIBRARY_MAX_SCALE", "3"))
+PLAN_LIBRARY_CANDIDATES = int(os.getenv("PLAN_LIBRARY_CANDIDATES", "50"))
+
+DIMENSIONS = 1024
+SIGNATURE_BITS = 64
+BANDS = 8  # 8 bands of 8 bits: goals at cosine 0.9 share a band about 94% of the time
+
+STOP_WORDS = {"a", "an", "and", "the", "to", "of", "in", "on", "for", "by", "my", "i", "want", "with", "at", "per", "be", "is"}
+
+def _hash(text: str) -> int:
+    return int.from_bytes(hashlib.blake2b(text.encode(), digest_size=8).digest(), "big")
+
+def _tokens(text: str) -> List[str]:
+    words = re.findall(r"[a-z]+", (text or "").lower())
+    return [word[:-1] if len(word) > 3 and word.endswith("s") else word for word in words if word not in STOP_WORDS]
+
+def _primary_target(parsed_goal: Dict[str, Any]) -> Tuple[Optional[float], str]:
+    """The first numeric target and its unit, which the adapted plan is scaled by"""
+    
+    for metric in parsed_goal.get("target_metrics") or []:
+        target = _parse_number(metric.get("target"))
+        if target:
+            return abs(target), _normalize_unit(metric.get("unit") or "")
+    return None, ""
+
+def _features(parsed_goal: Dict[str, Any], duration_days: int) -> Dict[str, float]:
+    """Weighted features of a parsed goal: objective and metric words, units, and target and timeline magnitudes"""
+    
+    features: Dict[str, float] = {}
+    for token in _tokens(parsed_goal.get("main_objective", "")):
+        features[f"w:{token}"] = features.get(f"w:{token}", 0.0) + 1.0
+    for metric in parsed_goal.get("target_metrics") or []:
+        for token in _tokens(metric.get("metric", "")):
+            features[f"m:{token}"] = features.get(f"m:{token}", 0.0) + 1.0
+        unit = _normalize_unit(metric.get("unit") or "")
+        if unit:
+            features[f"u:{unit}"] = 2.0
+        target = _parse_number(metric.get("target"))
+        if target:
+            # Magnitudes in powers of two, so 300 and 320 pages look alike and 30 and 3000 do not
+            features[f"t:{round(math.log2(abs(target)))}"] = 1.0
+    features[f"d:{round(math.log2(max(duration_days, 1)))}"] = 1.0
+    return features
+
+def fingerprint(parsed_goal: Dict[str, Any], duration_days: int) -> Dict[str, float]:
+    """Unit-length hashed feature vector of a parsed goal, sparse as {dimension: weight}"""
+    
+    vector: Dict[str, float] = {}
+    for feature, weight in _features(parsed_goal, duration_days).items():
+        hashed = _hash(feature)
+        dimension = str(hashed % DIMENSIONS)
+        sign = 1.0 if hashed >> 63 else -1.0
+        vector[dimension] = vector.get(dimension, 0.0) + sign * weight
+    norm = math.sqrt(sum(weight * weight for weight in vector.values())) or 1.0
+    return {dimension: weight / norm for dimension, weight in vector.items() if weight}
+
+def cosine(left: Dict[str, float], right: Dict[str, float]) -> float:
+    if len(left) > len(right):
+        left, right = right, left
+    return sum(weight * right.get(dimension, 0.0) for dimension, weight in left.items())
+
+def lsh_bands(vector: Dict[str, float]) -> List[str]:
+    """SimHash signature of the vector split into band keys; similar vectors share at least one key"""
+    
+    totals = [0.0] * SIGNATURE_BITS
+    for dimension, weight in vector.items():
+        hashed = _hash(f"dim:{dimension}")
+        for bit in range(SIGNATURE_BITS):
+            totals[bit] += weight if hashed >> bit & 1 else -weight
+    signature = sum(1 << bit for bit, total in enumerate(totals) if total > 0)
+    width = SIGNATURE_BITS // BANDS
+    return [f"{band}:{signature >> (band * width) & ((1 << width) - 1):x}" for band in range(BANDS)]
+
+def _within_scale(ratio: float) -> bool:
+    return 1 / PLAN_LIBRARY_MAX_SCALE <= ratio <= PLAN_LIBRARY_MAX_SCALE
+
+def _rescale_text(text: str, old: Optional[float], new: Optional[float]) -> str:
+    if not text or old is None or new is None or old == new:
+        return text
+    return re.sub(rf"(?<![\d.]){re.escape(_format_number(old))}(?![\d.])", _format_number(new), text)
+
+class PlanLibrary:
+    """Stores the tasks of generated plans and adapts the closest stored plan to similar new goals"""
+    
+    def __init__(self):
+        self.collection = get_collection("plan_library")
+    
+    async def nearest(self, parsed_goal: Dict[str, Any], plan_type: str, user_id: str,
+                      duration_days: int) -> Tuple[Optional[Dict[str, Any]], float]:
+        """Closest stored plan by cosine similarity, among candidates sharing an LSH band"""
+        
+        vector = fingerprint(parsed_goal, duration_days)
+        query: Dict[str, Any] = {"plan_type": plan_type, "bands": {"$in": lsh_bands(vector)}}
+        if not PLAN_LIBRARY_SHARED:
+            query["user_id"] = user_id
+        
+        candidates = await self.collection.find(query, {"vector": 1}).limit(PLAN_LIBRARY_CANDIDATES).to_list(None)
+        best, best_similarity = None, 0.0
+        for candidate in candidates:
+            similarity = cosine(vector, candidate["vector"])
+            if similarity > best_similarity:
+                best, best_similarity = candidate, similarity
+        if best is None:
+            return None, 0.0
+        return await self.collection.find_one({"_id": best["_id"]}), best_similarity
+    
+    def adapt(self, entry: Dict[str, Any], parsed_goal: Dict[str, Any],
+              start: datetime, end: datetime) -> Optional[List[Dict[str, Any]]]:
+        """Shift a stored plan's tasks onto the new timeline and scale their targets; None when too far off"""
+        
+        total, unit = _primary_target(parsed_goal)
+        if unit != entry.get("unit", ""):
+            return None
+        scale = total / entry["total"] if total and entry.get("total") else 1.0
+        days = max((end - start).days, 1)
+        if not _within_scale(scale) or not _within_scale(days / max(entry["duration_days"], 1)):
+            return None
+        
+        tasks = []
+        for task in entry["tasks"]:
+            old_value = task.get("target_value")
+            new_value = round(old_value * scale, 2) if isinstance(old_value, (int, float)) else old_value
+            target_date = min(start + timedelta(days=max(1, round(task["offset"] * days))), end)
+            tasks.append({
+                **{key: value for key, value in task.items() if key != "offset"},
+                "title": _rescale_text(task.get("title", ""), old_value, new_value),
+                "description": _rescale_text(task.get("description", ""), old_value, new_value),
+                "target_value": new_value,
+                "target_date": target_date.date().isoformat()
+            })
+        return tasks
+    
+    async def plan_from_library(self, state: Dict[str, Any]) -> Dict[str, Any]:
+        """Reuse the closest stored plan when it is similar enough to the parsed goal"""
+        
+        if not PLAN_LIBRARY_ENABLED or state.get("status") == "error":
+            return state
+        
+        attempts = metrics.incr("planner.library.attempts")
+        try:
+            parsed_goal = state.get("parsed_goal") or {}
+            start = parse_utc(state["start_date"])
+            end = parse_utc(state["end_date"])
+            entry, similarity = await self.nearest(parsed_goal, state.get("plan_type", ""),
+                                                   state.get("user_id"), (end - start).days)
+            tasks = self.adapt(entry, parsed_goal, start, end) if entry and similarity >= PLAN_LIBRARY_MIN_SIMILARITY else None
+            if tasks:
+                total, _ = _primary_target(parsed_goal)
+                state["planned_tasks"] = tasks
+                state["plan_summary"] = _rescale_text(entry.get("plan_summary", ""), entry.get("total"), total)
+                state["library_entry_id"] = str(entry["_id"])
+                state["status"] = "plan_created"
+                metrics.incr("planner.library.hits")
+                await self.collection.update_one({"_id": entry["_id"]}, {"$inc": {"uses": 1}})
+                logger.info("Plan adapted from library", extra={
+                    "plan_id": state.get("plan_id"), "entry_id": str(entry["_id"]), "similarity": round(similarity, 3)
+                })
+        except Exception as e:
+            # The planner LLM is the fallback, so a library failure only costs the saved call
+            logger.warning("Plan library lookup failed: %s", e, extra={"plan_id": state.get("plan_id")})
+        
+        metrics.set_gauge("planner.library.hit_rate", metrics.get_counter("planner.library.hits") / attempts)
+        return state
+    
+    async def remember(self, state: Dict[str, Any]) -> None:
+        """Store the tasks of a successfully generated plan for reuse"""
+        
+        # A hierarchical plan only has the tasks of its first milestones so far
+        if not PLAN_LIBRARY_ENABLED or state.get("template_id") or state.get("library_entry_id") or state.get("milestones"):
+            return
+        tasks = state.get("planned_tasks") or []
+        parsed_goal = state.get("parsed_goal") or {}
+        if not tasks or not parsed_goal:
+            return
+        
+        start = parse_utc(state["start_date"])
+        end = parse_utc(state["end_date"])
+        days = max((end - start).days, 1)
+        plan_type = state.get("plan_type", "")
+        
+        entry, similarity = await self.nearest(parsed_goal, plan_type, state.get("user_id"), days)
+        if entry and similarity >= PLAN_LIBRARY_DEDUP_SIMILARITY:
+            return
+        
+        vector = fingerprint(parsed_goal, days)
+        total, unit = _primary_target(parsed_goal)
+        stored_tasks = []
+        for task in tasks:
+            # Dates are kept as a fraction of the timeline, so they can be stretched onto a new one
+            offset = (parse_utc(task["target_date"]) - start).days / days
+            stored_tasks.append({
+                "title": task.get("title", ""),
+                "description": task.get("description", ""),
+                "unit": task.get("unit"),
+                "target_value": task.get("target_value"),
+                "priority": task.get("priority", "medium"),
+                "offset": min(max(offset, 0.0), 1.0)
+            })
+        
+        await self.collection.insert_one({
+            "plan_type": plan_type,
+            "user_id": state.get("user_id"),
+            "source_plan_id": state.get("plan_id"),
+            "parsed_goal": parsed_goal,
+            "plan_summary": state.get("plan_summary", ""),
+            "unit": unit,
+            "total": total,
+            "duration_days": days,
+            "vector": vector,
+            "bands": lsh_bands(vector),
+            "tasks": stored_tasks,
+            "uses": 0,
+            "created_at": datetime.utcnow()
+        })
+        metrics.incr("planner.library.stored")
@@ -1,22 +1,112 @@
 import os
+import asyncio
 from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain.schema import HumanMessage, SystemMessage
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Callable, Optional
 from datetime import datetime, timedelta
 import json
 
-from utils.extractjson import strip_json_markdown_block
+from utils.dates import parse_utc
+from utils.extractjson import strip_json_markdown_block, JsonArrayStream
+from utils.llm import HedgedLLM
+from utils.log import get_logger, log_payload
+from agents.milestones import hierarchical, milestone_documents, milestone_phase, due_milestones, MILESTONE_DAYS, EXPANDED
+
+logger = get_logger(__name__)
+
+# Plans longer than this are planned segment by segment (map-reduce), unless they are hierarchical plans,
+# which take precedence: with hierarchical plans on, only plans between the two thresholds are segmented
+SEGMENT_THRESHOLD_DAYS = int(os.getenv("PLANNER_SEGMENT_THRESHOLD_DAYS", "120"))
+SEGMENT_DAYS = int(os.getenv("PLANNER_SEGMENT_DAYS", "30"))
+MAX_SEGMENT_CONCURRENCY = int(os.getenv("PLANNER_MAX_CONCURRENCY", "4"))
+# Hand tasks on in batches while the planner response is still streaming in
+PLANNER_STREAMING = os.getenv("PLANNER_STREAMING", "true").lower() == "true"
+TASK_STREAM_BATCH_SIZE = int(os.getenv("TASK_STREAM_BATCH_SIZE", "10"))
+# json: one object per task; compact: one array per task under a fixed column order, dates as day offsets
+PLANNER_OUTPUT_FORMAT = os.getenv("PLANNER_OUTPUT_FORMAT", "compact")
+
+JSON_TASKS_FORMAT = """"tasks": [
+                {
+                    "title": "Task title",
+                    "description": "Detailed description",
+                    "target_date": "YYYY-MM-DD",
+                    "unit": "measurement unit (pages, kg, USD, etc.)",
+                    "target_value": 0.0,
+                    "priority": "high|medium|low"
+                }
+            ]"""
+
+COMPACT_TASKS_FORMAT = """"rows": [
+                ["Task title", "Detailed description", 7, "pages", 20.0, "m"]
+            ]"""
+
+COMPACT_INSTRUCTIONS = """Each row is [title, description, day, unit, target_value, priority]. day is the target date as
+        the number of days after the {reference} (0 is the {reference} itself), unit is the measurement unit (pages, kg, USD, etc.)
+        or null, target_value is a number or null, and priority is h, m or l. Write the JSON without indentation."""
+
+PRIORITIES = {"h": "high", "m": "medium", "l": "low"}
+
+def compact_output() -> bool:
+    return PLANNER_OUTPUT_FORMAT == "compact"
+
+def tasks_format() -> str:
+    return COMPACT_TASKS_FORMAT if compact_output() else JSON_TASKS_FORMAT
+
+def tasks_key() -> str:
+    return "rows" if compact_output() else "tasks"
+
+def format_instructions(reference: str = "start date") -> str:
+    return COMPACT_INSTRUCTIONS.format(reference=reference) if compact_output() else ""
+
+def expand_rows(rows: List[List[Any]], start: datetime, end: datetime) -> List[Dict[str, Any]]:
+    """Expand compact rows into the planned task shape, with day offsets turned into dates within the plan"""
+    
+    tasks = []
+    for row in rows:
+        if not isinstance(row, list) or not row or not row[0]:
+            continue
+        title, description, day, unit, target_value, priority = (row + [None] * 6)[:6]
+        try:
+            target_date = start + timedelta(days=int(day))
+        except (TypeError, ValueError):
+            target_date = end
+        tasks.append({
+            "title": str(title),
+            "description": description or "",
+            "target_date": min(max(target_date, start), end).date().isoformat(),
+            "unit": unit,
+            "target_value": float(target_value) if isinstance(target_value, (int, float)) else None,
+            "priority": PRIORITIES.get(str(priority or "m").lower()[:1], "medium")
+        })
+    return tasks
+
+def decode_tasks(plan_data: Dict[str, Any], start: datetime, end: datetime) -> List[Dict[str, Any]]:
+    """Planned tasks from a planner response in the configured output format"""
+    
+    if compact_output():
+        return expand_rows(plan_data["rows"], start, end)
+    return plan_data["tasks"]
 
 class PlannerAgent:
     def __init__(self):
-        self.llm = ChatGoogleGenerativeAI(
+        self.llm = HedgedLLM("planner", ChatGoogleGenerativeAI(
             model="gemini-2.0-flash",
             google_api_key=os.getenv("GOOGLE_API_KEY"),
             temperature=0.3
-        )
+        ))
     
-    async def create_plan(self, state: Dict[str, Any]) -> Dict[str, Any]:
-        """Create detailed task plan based on parsed goal"""
+    async def create_plan(self, state: Dict[str, Any],
+                          on_tasks: Optional[Callable[[List[Dict[str, Any]]], None]] = None) -> Dict[str, Any]:
+        """Create detailed task plan based on parsed goal; on_tasks, if given, receives tasks in batches as they stream in"""
+        
+        start = parse_utc(state.get("start_date"))
+        end = parse_utc(state.get("end_date"))
+        
+        # Hierarchical plans come first; segmenting is the fallback for long plans they do not cover
+        if hierarchical(start, end):
+            return await self.create_milestone_plan(state)
+        if (end - start).days > SEGMENT_THRESHOLD_DAYS:
+            return await self.create_segmented_plan(state)
         
         parsed_goal = state.get("parsed_goal", {})
         start_date = state.get("start_date")
@@ -27,18 +117,10 @@ class PlannerAgent:
         
         Based on the parsed goal, create a list of specific, actionable tasks with the following structure:
         {
-            "tasks": [
-                {
-                    "title": "Task title",
-                    "description": "Detailed description",
-                    "target_date": "YYYY-MM-DD",
-                    "unit": "measurement unit (pages, kg, USD, etc.)",
-                    "target_value": 0.0,
-                    "priority": "high|medium|low"
-                }
-            ],
+            """ + tasks_format() + """,
             "plan_summary": "Overall plan summary"
         }
+        """ + format_instructions() + """
         
         Plan type: """ + plan_type + """
         Duration: """ + start_date + """ to """ + end_date + """
@@ -52,18 +134,252 @@ class PlannerAgent:
         ]
         
         try:
-            response = await self.llm.ainvoke(messages)
-            print('Planning response:', strip_json_markdown_block(response.content))
-            plan_data = json.loads(strip_json_markdown_block(response.content))
-            print('Parsed plan data:', plan_data)
+            if on_tasks is not None and PLANNER_STREAMING:
+                content = await self._stream_tasks(messages, on_tasks, start, end)
+            else:
+                response = await self.llm.ainvoke(messages)
+                content = strip_json_markdown_block(response.content)
+            log_payload("planner", "Planning response", content)
+            plan_data = json.loads(content)
             
-            state["planned_tasks"] = plan_data["tasks"]
+            state["planned_tasks"] = decode_tasks(plan_data, start, end)
             state["plan_summary"] = plan_data.get("plan_summary", "")
             state["status"] = "plan_created"
             
         except Exception as e:
-            print(f"Planning failed: {str(e)}")
+            logger.exception("Planning failed")
             state["error"] = f"Planning failed: {str(e)}"
             state["status"] = "error"
         
         return state
+    
+    async def _stream_tasks(self, messages: List[Any], on_tasks: Callable[[List[Dict[str, Any]]], None],
+                            start: datetime, end: datetime) -> str:
+        """Read the planner response as a stream, passing each batch of completed tasks on immediately"""
+        
+        stream = JsonArrayStream(tasks_key())
+        batch: List[Any] = []
+        async for chunk in self.llm.astream(messages):
+            batch.extend(stream.feed(chunk))
+            if len(batch) >= TASK_STREAM_BATCH_SIZE:
+                on_tasks(expand_rows(batch, start, end) if compact_output() else batch)
+                batch = []
+        if batch:
+            on_tasks(expand_rows(batch, start, end) if compact_output() else batch)
+        return strip_json_markdown_block(stream.text)
+    
+    async def create_segmented_plan(self, state: Dict[str, Any]) -> Dict[str, Any]:
+        """Plan a long timeline as a phase skeleton plus concurrently planned segments"""
+
+        parsed_goal = state.get("parsed_goal", {})
+        plan_type = state.get("plan_type", "")
+        start = parse_utc(state.get("start_date"))
+        end = parse_utc(state.get("end_date"))
+        
+        try:
+            phases = await self._create_skeleton(parsed_goal, plan_type, start, end)
+            
+            semaphore = asyncio.Semaphore(MAX_SEGMENT_CONCURRENCY)
+            segment_results = await asyncio.gather(*[
+                self.plan_phase(phase, parsed_goal, plan_type, semaphore)
+                for phase in phases
+            ])
+            
+            planned_tasks = [task for tasks in segment_results for task in tasks]
+            planned_tasks.sort(key=lambda task: task["target_date"])
+            
+            state["planned_tasks"] = planned_tasks
+            state["plan_summary"] = " ".join(
+                f"{phase['title']}: {phase['milestone']}" for phase in phases
+            )
+            state["status"] = "plan_created"
+        
+        except Exception as e:
+            logger.exception("Segmented planning failed")
+            state["error"] = f"Planning failed: {str(e)}"
+            state["status"] = "error"
+        
+        return state
+    
+    async def create_milestone_plan(self, state: Dict[str, Any]) -> Dict[str, Any]:
+        """Plan a timeline as milestones, generating tasks only for the milestones that are already current"""
+        
+        parsed_goal = state.get("parsed_goal", {})
+        plan_type = state.get("plan_type", "")
+        start = parse_utc(state.get("start_date"))
+        end = parse_utc(state.get("end_date"))
+        
+        try:
+            milestones = milestone_documents(
+                await self._create_skeleton(parsed_goal, plan_type, start, end, MILESTONE_DAYS)
+            )
+            # The first milestone is always current; later ones are expanded when they come up or are opened
+            current = due_milestones(milestones, max(datetime.utcnow(), start))
+            semaphore = asyncio.Semaphore(MAX_SEGMENT_CONCURRENCY)
+            results = await asyncio.gather(*[
+                self.plan_phase(milestone_phase(milestone), parsed_goal, plan_type, semaphore)
+                for milestone in current
+            ])
+            
+            planned_tasks = []
+            for milestone, tasks in zip(current, results):
+                milestone["state"] = EXPANDED
+                milestone["tasks_count"] = len(tasks)
+                planned_tasks.extend({**task, "milestone_id": milestone["id"]} for task in tasks)
+            planned_tasks.sort(key=lambda task: task["target_date"])
+            
+            state["planned_tasks"] = planned_tasks
+            state["milestones"] = milestones
+            state["plan_summary"] = " ".join(
+                f"{milestone['title']}: {milestone['milestone']}" for milestone in milestones
+            )
+            state["status"] = "plan_created"
+        
+        except Exception as e:
+            logger.exception("Milestone planning failed")
+            state["error"] = f"Planning failed: {str(e)}"
+            state["status"] = "error"
+        
+        return state
+    
+    async def _create_skeleton(self, parsed_goal: Dict[str, Any], plan_type: str,
+                               start: datetime, end: datetime, phase_days: int = SEGMENT_DAYS) -> List[Dict[str, Any]]:
+        """Ask for phase milestones covering the timeline, falling back to even segments"""
+        
+        phase_count = max(2, round((end - start).days / phase_days))
+        
+        system_prompt = """You are a planning agent. Split the goal's timeline into consecutive phases.
+        
+        Return JSON without markdown blocks:
+        {
+            "phases": [
+                {
+                    "title": "Phase title",
+                    "start_date": "YYYY-MM-DD",
+                    "end_date": "YYYY-MM-DD",
+                    "milestone": "What is achieved by the end of this phase",
+                    "focus": "What the tasks in this phase concentrate on"
+                }
+            ]
+        }
+        
+        Plan type: """ + plan_type + """
+        Duration: """ + start.date().isoformat() + """ to """ + end.date().isoformat() + """
+        Use about """ + str(phase_count) + """ phases. Phases must not overlap and must cover the whole duration."""
+        
+        messages = [
+            SystemMessage(content=system_prompt),
+            HumanMessage(content=f"Parsed Goal: {json.dumps(parsed_goal, indent=2)}")
+        ]
+        
+        try:
+            response = await self.llm.ainvoke(messages)
+            skeleton = json.loads(strip_json_markdown_block(response.content))
+            phases = self._validate_phases(skeleton["phases"], start, end)
+            if phases:
+                return phases
+        except Exception as e:
+            logger.warning("Plan skeleton failed, using even segments: %s", e)
+        
+        return self._even_phases(start, end, phase_count)
+    
+    def _validate_phases(self, raw_phases: List[Dict[str, Any]],
+                         start: datetime, end: datetime) -> List[Dict[str, Any]]:
+        """Parse phase dates and make the phases contiguous within the plan range"""
+        
+        phases = []
+        for raw in raw_phases:
+            phase_start = max(start, parse_utc(raw["start_date"]))
+            phase_end = min(end, parse_utc(raw["end_date"]))
+            if phase_end < phase_start:
+                continue
+            phases.append({
+                "title": raw.get("title", ""),
+                "milestone": raw.get("milestone", ""),
+                "focus": raw.get("focus", ""),
+                "start": phase_start,
+                "end": phase_end
+            })
+        
+        phases.sort(key=lambda phase: phase["start"])
+        if not phases:
+            return []
+        
+        # Close gaps so every day of the plan belongs to a phase
+        phases[0]["start"] = start
+        phases[-1]["end"] = end
+        for previous, current in zip(phases, phases[1:]):
+            current["start"] = max(current["start"], previous["end"])
+            if current["start"] > previous["end"]:
+                previous["end"] = current["start"]
+        
+        return [phase for phase in phases if phase["end"] >= phase["start"]]
+    
+    def _even_phases(self, start: datetime, end: datetime, phase_count: int) -> List[Dict[str, Any]]:
+        """Split the plan range into equally sized phases"""
+        
+        step = (end - start) / phase_count
+        return [
+            {
+                "title": f"Phase {index + 1}",
+                "milestone": "",
+                "focus": "",
+                "start": start + step * index,
+                "end": end if index == phase_count - 1 else start + step * (index + 1)
+            }
+            for index in range(phase_count)
+        ]
+    
+    async def plan_phase(self, phase: Dict[str, Any], parsed_goal: Dict[str, Any], plan_type: str,
+                         semaphore: Optional[asyncio.Semaphore] = None) -> List[Dict[str, Any]]:
+        """Generate the tasks of one phase, with target dates inside it"""
+        
+        tasks = await self._plan_segment(phase, parsed_goal, plan_type, semaphore or asyncio.Semaphore(1))
+        return self._clamp_tasks(tasks, phase["start"], phase["end"])
+    
+    async def _plan_segment(self, phase: Dict[str, Any], parsed_goal: Dict[str, Any],
+                            plan_type: str, semaphore: asyncio.Semaphore) -> List[Dict[str, Any]]:
+        """Generate the tasks of a single phase"""
+        
+        system_prompt = """You are a planning agent. Create the tasks for one phase of a longer plan.
+        
+        Return JSON without markdown blocks:
+        {
+            """ + tasks_format() + """
+        }
+        """ + format_instructions("phase start date") + """
+        
+        Plan type: """ + plan_type + """
+        Phase: """ + phase["title"] + """
+        Phase duration: """ + phase["start"].date().isoformat() + """ to """ + phase["end"].date().isoformat() + """
+        Phase milestone: """ + phase["milestone"] + """
+        Phase focus: """ + phase["focus"] + """
+        
+        Only create tasks for this phase. Make tasks specific, measurable, and time-bound,
+        and distribute them evenly across the phase."""
+        
+        messages = [
+            SystemMessage(content=system_prompt),
+            HumanMessage(content=f"Parsed Goal: {json.dumps(parsed_goal, indent=2)}")
+        ]
+        
+        async with semaphore:
+            response = await self.llm.ainvoke(messages)
+        
+        segment = json.loads(strip_json_markdown_block(response.content))
+        return decode_tasks(segment, phase["start"], phase["end"])
+    
+    def _clamp_tasks(self, tasks: List[Dict[str, Any]], start: datetime, end: datetime) -> List[Dict[str, Any]]:
+        """Drop malformed tasks and move target dates into the phase range"""
+        
+        clamped = []
+        for task in tasks:
+            if not task.get("title"):
+                continue
+            try:
+                target_date = parse_utc(task["target_date"])
+            except (KeyError, TypeError, ValueError):
+                target_date = end
+            target_date = min(max(target_date, start), end)
+            clamped.append({**task, "target_date": target_date.date().isoformat()})
+        return clamped
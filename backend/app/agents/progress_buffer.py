@@ -0,0 +1,187 @@
+import os
+import asyncio
+from typing import Dict, Any, List, Optional, Set
+from bson import ObjectId
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+from db.connection import get_collection
+from db.versioning import progress_update, touch_plan, version_stage
+from models.models import ProgressLog
+from agents.rescheduler import ReschedulerAgent, AUTO_RESCHEDULE
+from utils.log import get_logger
+from utils import metrics
+
+logger = get_logger(__name__)
+
+# Buffer structured progress in memory and write it in batches; reads may lag by up to the flush interval
+PROGRESS_WRITE_BEHIND = os.getenv("PROGRESS_WRITE_BEHIND", "false").lower() == "true"
+PROGRESS_FLUSH_MAX_EVENTS = int(os.getenv("PROGRESS_FLUSH_MAX_EVENTS", "500"))
+PROGRESS_FLUSH_INTERVAL_SECONDS = float(os.getenv("PROGRESS_FLUSH_INTERVAL_SECONDS", "2"))
+
+DUPLICATE_KEY = 11000
+
+class ProgressWriteBuffer:
+    """Collects progress events and flushes them with insert_many and one bulk_write per batch"""
+    
+    def __init__(self, max_events: int = PROGRESS_FLUSH_MAX_EVENTS,
+                 interval: float = PROGRESS_FLUSH_INTERVAL_SECONDS):
+        self.max_events = max_events
+        self.interval = interval
+        self.logs: List[Dict[str, Any]] = []
+        # Task updates coalesced per task: the latest absolute value, the deltas since it, and the latest status
+        self.task_updates: Dict[str, Dict[str, Any]] = {}
+        # Updates whose write failed or has an unknown outcome, by task, retried with the flush id they were sent with
+        self.retries: Dict[str, Dict[str, Any]] = {}
+        self.lock = asyncio.Lock()
+        self.flushing: Set[asyncio.Task] = set()
+    
+    def add(self, task_id: str, user_id: str, status: str,
+            value: Optional[float] = None, note: Optional[str] = None, delta: Optional[float] = None) -> str:
+        """Buffer one progress event for an existing task and return the id its log will be written with"""
+        
+        progress_log = ProgressLog(task_id=task_id, user_id=user_id, status=status, value=value, delta=delta, note=note)
+        log_id = ObjectId()
+        self.logs.append({"_id": log_id, **progress_log.dict(exclude={"id"})})
+        if value is not None or delta is not None:
+            if task_id in self.task_updates:
+                metrics.incr("progress_buffer.coalesced")
+            self._merge(task_id, {"value": value, "delta": delta or 0, "status": status})
+        
+        metrics.incr("progress_buffer.events")
+        metrics.set_gauge("progress_buffer.pending", len(self.logs))
+        if len(self.logs) >= self.max_events:
+            flush = asyncio.create_task(self.flush())
+            self.flushing.add(flush)
+            flush.add_done_callback(self.flushing.discard)
+        return str(log_id)
+    
+    def _merge(self, task_id: str, update: Dict[str, Any]) -> None:
+        # A newer absolute value replaces everything before it; newer deltas add up
+        pending = self.task_updates.get(task_id)
+        if pending is None or update["value"] is not None:
+            self.task_updates[task_id] = update
+        else:
+            self.task_updates[task_id] = {
+                "value": pending["value"], "delta": pending["delta"] + update["delta"], "status": update["status"]
+            }
+    
+    async def flush(self) -> int:
+        """Write everything buffered so far; failed batches are put back for the next flush"""
+        
+        async with self.lock:
+            logs, retries = self.logs, self.retries
+            # Newer events for a task with an unsettled update wait for it, so they are never merged into a retry
+            held = {task_id: update for task_id, update in self.task_updates.items() if task_id in retries}
+            fresh = {
+                task_id: {**update, "flush_id": ObjectId()}
+                for task_id, update in self.task_updates.items() if task_id not in retries
+            }
+            self.logs, self.task_updates, self.retries = [], held, {}
+            task_updates = {**retries, **fresh}
+            if not logs and not task_updates:
+                return 0
+            
+            try:
+                await self._write_logs(logs)
+            except asyncio.CancelledError:
+                # Cancelled mid-write, e.g. at shutdown: the batch goes back so close() still writes it
+                self.logs = logs + self.logs
+                self.retries = task_updates
+                raise
+            except Exception:
+                logger.exception("Progress buffer flush failed", extra={"events": len(logs)})
+                metrics.incr("progress_buffer.flush_failures")
+                # Logs keep their ids, so a retry cannot duplicate those already inserted
+                self.logs = logs + self.logs
+                self.retries = task_updates
+                return 0
+            finally:
+                metrics.set_gauge("progress_buffer.pending", len(self.logs))
+            
+            try:
+                failed = await self._write_tasks(task_updates)
+            except asyncio.CancelledError:
+                # The flush ids make the updates that did apply no-ops when written again
+                self.retries = task_updates
+                raise
+            if failed:
+                metrics.incr("progress_buffer.flush_failures")
+                self.retries = failed
+        
+        metrics.incr("progress_buffer.flushes")
+        await self._after_write(list(task_updates))
+        return len(logs)
+    
+    async def _write_logs(self, logs: List[Dict[str, Any]]) -> None:
+        if not logs:
+            return
+        try:
+            await get_collection("progress_logs").insert_many(logs, ordered=False)
+        except BulkWriteError as e:
+            # Already written by an earlier attempt
+            if any(error["code"] != DUPLICATE_KEY for error in e.details.get("writeErrors", [])):
+                raise
+    
+    async def _write_tasks(self, task_updates: Dict[str, Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+        """Apply coalesced task updates; returns the ones that failed and should be retried"""
+        
+        if not task_updates:
+            return {}
+        
+        task_ids = list(task_updates)
+        try:
+            await get_collection("tasks").bulk_write(
+                [self._task_update(task_id, task_updates[task_id]) for task_id in task_ids], ordered=False
+            )
+        except BulkWriteError as e:
+            errors = e.details.get("writeErrors", [])
+            logger.warning("Progress task updates failed: %s", errors[:1], extra={"failed": len(errors)})
+            return {task_ids[error["index"]]: task_updates[task_ids[error["index"]]] for error in errors}
+        except Exception:
+            # The outcome is unknown; the flush id makes the retry a no-op for updates that did apply
+            logger.exception("Progress task updates failed", extra={"tasks": len(task_ids)})
+            return task_updates
+        return {}
+    
+    @staticmethod
+    def _task_update(task_id: str, update: Dict[str, Any]) -> UpdateOne:
+        # Deltas are not idempotent, so the task records the last flush applied to it and skips it when sent again
+        flush_id = update["flush_id"]
+        return UpdateOne(
+            {"_id": ObjectId(task_id), "progress_flush_id": {"$ne": flush_id}},
+            progress_update(update["delta"], update["value"], update["status"])
+            + [{"$set": {"progress_flush_id": flush_id}}, version_stage()]
+        )
+    
+    async def _after_write(self, task_ids: List[str]) -> None:
+        """Advance plan versions and reschedule once per affected plan"""
+        
+        if not task_ids:
+            return
+        
+        tasks = await get_collection("tasks").find(
+            {"_id": {"$in": [ObjectId(task_id) for task_id in task_ids]}}, {"plan_id": 1}
+        ).to_list(None)
+        for plan_id in {str(task["plan_id"]) for task in tasks}:
+            await touch_plan(plan_id)
+            if AUTO_RESCHEDULE:
+                try:
+                    await ReschedulerAgent().reschedule_plan(plan_id)
+                except Exception:
+                    logger.exception("Rescheduling failed", extra={"plan_id": plan_id})
+    
+    async def run(self) -> None:
+        """Background loop that flushes on the time trigger"""
+        
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.flush()
+    
+    async def close(self) -> None:
+        """Flush what is left, e.g. on shutdown"""
+        
+        if self.flushing:
+            await asyncio.gather(*self.flushing, return_exceptions=True)
+        await self.flush()
+
+progress_buffer = ProgressWriteBuffer()
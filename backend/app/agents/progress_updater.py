@@ -5,17 +5,24 @@ from typing import Dict, Any
 import json
 from datetime import datetime
 from utils.extractjson import strip_json_markdown_block
+from utils.llm import HedgedLLM
 from db.connection import get_collection
 from models.models import ProgressLog, TaskStatus
+from agents.rescheduler import ReschedulerAgent, AUTO_RESCHEDULE
+from db.versioning import touch_plan, progress_update, update_versioned, DocumentNotFoundError
+from db.migrations import plan_ids_filter, migration_complete, TASK_OWNER_MIGRATION
 from bson import ObjectId
+from utils.log import get_logger, log_payload
+
+logger = get_logger(__name__)
 
 class ProgressUpdaterAgent:
     def __init__(self):
-        self.llm = ChatGoogleGenerativeAI(
+        self.llm = HedgedLLM("progress_updater", ChatGoogleGenerativeAI(
             model="gemini-2.0-flash",
             google_api_key=os.getenv("GOOGLE_API_KEY"),
             temperature=0.2
-        )
+        ))
         self.tasks_collection = get_collection("tasks")
         self.progress_collection = get_collection("progress_logs")
     
@@ -30,14 +37,15 @@ class ProgressUpdaterAgent:
             
             # Prepare context for AI analysis
             system_prompt = """You are a progress analysis agent. Analyze the user's input about their task progress and determine:
-            1. What progress value should be recorded
+            1. How much progress this update reports, as an amount to add to the current value
+               (e.g. "read 10 more pages" is 10; use a negative amount only for corrections)
             2. What status the task should have
             3. Generate an appropriate note summarizing the progress
             
             Return JSON without markdown blocks:
             {
                 "progress_analysis": {
-                    "new_value": 0.0,
+                    "delta_value": 0.0,
                     "new_status": "pending|in_progress|completed|skipped",
                     "confidence": 0.9,
                     "note": "Summary of progress update",
@@ -60,18 +68,24 @@ class ProgressUpdaterAgent:
             
             # Get AI analysis
             response = await self.llm.ainvoke(messages)
-            print('Progress analysis response:', strip_json_markdown_block(response.content))
-            analysis_data = json.loads(strip_json_markdown_block(response.content))
-            print('Parsed analysis data:', analysis_data)
+            content = strip_json_markdown_block(response.content)
+            log_payload("progress_updater", "Progress analysis response", content)
+            analysis_data = json.loads(content)
             
             progress_analysis = analysis_data["progress_analysis"]
             
+            # Update task, adding the delta on the server so concurrent updates are not lost
+            updated = await self._apply_update(task_id, progress_analysis)
+            progress_analysis["new_value"] = updated.get("current_value")
+            progress_analysis["new_status"] = updated.get("status")
+            
             # Create progress log
             progress_log = ProgressLog(
                 task_id=task_id,
                 user_id=user_id,
                 status=progress_analysis["new_status"],
                 value=progress_analysis["new_value"],
+                delta=progress_analysis.get("delta_value"),
                 note=progress_analysis["note"]
             )
             
@@ -79,17 +93,9 @@ class ProgressUpdaterAgent:
             result = await self.progress_collection.insert_one(
                 progress_log.dict(exclude={"id"})
             )
+            await touch_plan(task["plan_id"])
             
-            # Update task
-            update_data = {
-                "current_value": progress_analysis["new_value"],
-                "status": progress_analysis["new_status"]
-            }
-            
-            await self.tasks_collection.update_one(
-                {"_id": ObjectId(task_id)},
-                {"$set": update_data}
-            )
+            await self._reschedule_plans([str(task["plan_id"])])
             
             return {
                 "status": "success",
@@ -99,7 +105,7 @@ class ProgressUpdaterAgent:
             }
             
         except Exception as e:
-            print(f"Progress update failed: {str(e)}")
+            logger.exception("Progress update failed")
             return {
                 "error": f"Progress update failed: {str(e)}",
                 "status": "error"
@@ -111,17 +117,26 @@ class ProgressUpdaterAgent:
         try:
             # Get user's active tasks
             plans_collection = get_collection("plans")
-            user_plans = await plans_collection.find({"user_id": user_id, "is_active": True}).to_list(None)
-            plan_ids = [str(plan["_id"]) for plan in user_plans]
-            
-            if not plan_ids:
-                return {"error": "No active plans found", "status": "error"}
-            
-            # Get active tasks
-            tasks_cursor = self.tasks_collection.find({
-                "plan_id": {"$in": plan_ids},
-                "status": {"$in": ["pending", "in_progress"]}
-            })
+            if migration_complete(TASK_OWNER_MIGRATION):
+                # Range scan on (user_id, status); only the rare inactive plans need excluding
+                inactive_plan_ids = await plans_collection.distinct("_id", {"user_id": user_id, "is_active": False})
+                tasks_cursor = self.tasks_collection.find({
+                    "user_id": user_id,
+                    "status": {"$in": ["pending", "in_progress"]},
+                    "plan_id": {"$nin": inactive_plan_ids}
+                })
+            else:
+                user_plans = await plans_collection.find({"user_id": user_id, "is_active": True}, {"_id": 1}).to_list(None)
+                plan_ids = [str(plan["_id"]) for plan in user_plans]
+                
+                if not plan_ids:
+                    return {"error": "No active plans found", "status": "error"}
+                
+                # Get active tasks
+                tasks_cursor = self.tasks_collection.find({
+                    "plan_id": plan_ids_filter(plan_ids),
+                    "status": {"$in": ["pending", "in_progress"]}
+                })
             tasks = await tasks_cursor.to_list(None)
             
             # Prepare context
@@ -137,7 +152,7 @@ class ProgressUpdaterAgent:
                 "bulk_updates": [
                     {
                         "task_id": "task_id_here",
-                        "new_value": 0.0,
+                        "delta_value": 0.0,
                         "new_status": "pending|in_progress|completed|skipped",
                         "note": "What was accomplished",
                         "confidence": 0.9
@@ -146,6 +161,9 @@ class ProgressUpdaterAgent:
                 "summary": "Overall summary of updates"
             }
             
+            delta_value is the progress the update reports, to be added to the task's current value;
+            use a negative amount only for corrections.
+            
             Active Tasks:
             """ + tasks_context
             
@@ -163,12 +181,20 @@ class ProgressUpdaterAgent:
                 if update["confidence"] >= 0.7:  # Only process high-confidence updates
                     task_id = update["task_id"]
                     
+                    # Update task
+                    try:
+                        updated = await self._apply_update(task_id, update)
+                    except DocumentNotFoundError:
+                        logger.warning("Skipping update for unknown task: %s", task_id)
+                        continue
+                    
                     # Create progress log
                     progress_log = ProgressLog(
                         task_id=task_id,
                         user_id=user_id,
-                        status=update["new_status"],
-                        value=update["new_value"],
+                        status=updated.get("status", update["new_status"]),
+                        value=updated.get("current_value"),
+                        delta=update.get("delta_value"),
                         note=update["note"]
                     )
                     
@@ -176,17 +202,16 @@ class ProgressUpdaterAgent:
                         progress_log.dict(exclude={"id"})
                     )
                     
-                    # Update task
-                    await self.tasks_collection.update_one(
-                        {"_id": ObjectId(task_id)},
-                        {"$set": {
-                            "current_value": update["new_value"],
-                            "status": update["new_status"]
-                        }}
-                    )
-                    
                     updated_tasks.append(task_id)
             
+            tasks_by_id = {str(task["_id"]): task for task in tasks}
+            updated_plan_ids = {
+                str(tasks_by_id[task_id]["plan_id"]) for task_id in updated_tasks if task_id in tasks_by_id
+            }
+            for plan_id in updated_plan_ids:
+                await touch_plan(plan_id)
+            await self._reschedule_plans(list(updated_plan_ids))
+            
             return {
                 "status": "success",
                 "updated_tasks": updated_tasks,
@@ -195,8 +220,33 @@ class ProgressUpdaterAgent:
             }
             
         except Exception as e:
-            print(f"Bulk progress update failed: {str(e)}")
+            logger.exception("Bulk progress update failed")
             return {
                 "error": f"Bulk progress update failed: {str(e)}",
                 "status": "error"
             }
+    
+    async def _apply_update(self, task_id: str, analysis: Dict[str, Any]) -> Dict[str, Any]:
+        """Apply an analysed update in one server-side write and return the task's resulting value and status"""
+        
+        delta = analysis.get("delta_value")
+        # Older responses may still give an absolute value instead of a delta
+        value = analysis.get("new_value") if delta is None else None
+        return await update_versioned(
+            self.tasks_collection, ObjectId(task_id),
+            progress_update(delta=delta, value=value, status=analysis.get("new_status")),
+            projection={"current_value": 1, "status": 1}
+        )
+    
+    async def _reschedule_plans(self, plan_ids: list) -> None:
+        """Rebalance each affected plan once; never fails the progress update"""
+        
+        if not AUTO_RESCHEDULE:
+            return
+        
+        rescheduler = ReschedulerAgent()
+        for plan_id in set(plan_ids):
+            try:
+                await rescheduler.reschedule_plan(plan_id)
+            except Exception:
+                logger.exception("Rescheduling failed", extra={"plan_id": plan_id})
@@ -0,0 +1,158 @@
+import os
+from typing import Dict, Any, List, Optional
+from datetime import datetime, timedelta
+from bson import ObjectId
+from pymongo import UpdateOne
+
+from db.connection import get_collection
+from db.versioning import bump_version, touch_plan, version_filter
+from db.migrations import plan_id_filter
+
+AUTO_RESCHEDULE = os.getenv("AUTO_RESCHEDULE", "true").lower() == "true"
+RESCHEDULE_SKIP_WEEKENDS = os.getenv("RESCHEDULE_SKIP_WEEKENDS", "false").lower() == "true"
+# Overdue tasks without a measurable target are spread over at least this many days
+RESCHEDULE_CATCH_UP_DAYS = int(os.getenv("RESCHEDULE_CATCH_UP_DAYS", "7"))
+
+OPEN_STATUSES = ["pending", "in_progress"]
+
+def _midnight(value: datetime) -> datetime:
+    return datetime(value.year, value.month, value.day)
+
+def _fit_calendar(date: datetime, window_start: datetime) -> datetime:
+    """Move weekend dates back to the preceding Friday when configured"""
+    
+    if not RESCHEDULE_SKIP_WEEKENDS or date.weekday() < 5:
+        return date
+    friday = date - timedelta(days=date.weekday() - 4)
+    return friday if friday >= window_start else date
+
+def _measured(task: Dict[str, Any]) -> bool:
+    return isinstance(task.get("target_value"), (int, float)) and task["target_value"] > 0
+
+def _remaining(task: Dict[str, Any]) -> float:
+    return max(task["target_value"] - (task.get("current_value") or 0), 0)
+
+def _stretch(task: Dict[str, Any], projected: datetime, window_start: datetime) -> datetime:
+    """The later of a task's date and its projected date, so schedules only ever move out"""
+    
+    date = _fit_calendar(_midnight(projected), window_start)
+    return date if date > task["target_date"] else task["target_date"]
+
+def _project_unit(unit_tasks: List[Dict[str, Any]], open_tasks: List[Dict[str, Any]], plan_start: datetime,
+                  window_start: datetime, window_end: datetime) -> List[Dict[str, Any]]:
+    """Stretch one unit's open tasks to when the observed velocity finishes them, with the remaining
+    amount spread over the new dates; completed work and the remaining total stay as they are"""
+    
+    elapsed_days = max(1, (window_start - plan_start).days)
+    velocity = sum(min(task.get("current_value") or 0, task["target_value"]) for task in unit_tasks) / elapsed_days
+    remaining = sum(_remaining(task) for task in open_tasks)
+    # Without progress there is no velocity to project, and without remaining work nothing to move
+    if velocity <= 0 or remaining <= 0:
+        return []
+    
+    # At a pace that cannot finish by the end of the plan, the work is spread over the days left instead
+    days_left = (window_end - window_start).total_seconds() / 86400
+    pace = max(velocity, remaining / days_left) if days_left > 0 else None
+    
+    # Each task is due when the work up to and including it is done at that pace
+    effective, done = [], 0.0
+    for task in open_tasks:
+        done += _remaining(task)
+        projected = window_start + timedelta(days=done / pace) if pace else window_end
+        effective.append(max(min(projected, window_end), task["target_date"]))
+    if all(date == task["target_date"] for date, task in zip(effective, open_tasks)):
+        return []
+    
+    # The remaining amount follows the time each task now covers, so a task given more days gets more of it
+    spans = [
+        max((date - previous).total_seconds(), 0.0)
+        for previous, date in zip([window_start] + effective[:-1], effective)
+    ]
+    total_span = sum(spans) or 1.0
+    updates, assigned = [], 0.0
+    for index, (task, span) in enumerate(zip(open_tasks, spans)):
+        share = remaining - assigned if index == len(open_tasks) - 1 else round(remaining * span / total_span, 2)
+        assigned += share
+        fields = {}
+        target_date = _stretch(task, effective[index], window_start)
+        if target_date != task["target_date"]:
+            fields["target_date"] = target_date
+        target_value = round((task.get("current_value") or 0) + share, 2)
+        if abs(target_value - task["target_value"]) >= 0.01:
+            fields["target_value"] = target_value
+        if fields:
+            updates.append({"_id": task["_id"], "version": task.get("version", 0), "fields": fields})
+    return updates
+
+def compute_schedule(plan: Dict[str, Any], tasks: List[Dict[str, Any]],
+                     now: datetime) -> List[Dict[str, Any]]:
+    """Stretch the open tasks of a plan to the pace observed so far, never earlier than planned"""
+    
+    window_start = _midnight(max(now, plan["start_date"]))
+    window_end = _midnight(max(plan["end_date"], window_start))
+    open_tasks = sorted(
+        [task for task in tasks if task["status"] in OPEN_STATUSES],
+        key=lambda task: task["target_date"]
+    )
+    
+    updates, projected = [], set()
+    for unit in {task.get("unit") for task in open_tasks if _measured(task)}:
+        unit_open = [task for task in open_tasks if _measured(task) and task.get("unit") == unit]
+        unit_updates = _project_unit(
+            [task for task in tasks if _measured(task) and task.get("unit") == unit],
+            unit_open, plan["start_date"], window_start, window_end
+        )
+        if unit_updates:
+            projected.update(task["_id"] for task in unit_open)
+            updates.extend(unit_updates)
+    
+    # Overdue tasks the projection did not cover are spread over the next days, one a day at most
+    behind = [task for task in open_tasks if task["_id"] not in projected and task["target_date"] < window_start]
+    span = timedelta(days=max(RESCHEDULE_CATCH_UP_DAYS, len(behind)))
+    for index, task in enumerate(behind):
+        target_date = _fit_calendar(_midnight(window_start + span * (index + 1) / len(behind)), window_start)
+        updates.append({
+            "_id": task["_id"],
+            "version": task.get("version", 0),
+            "fields": {"target_date": min(target_date, window_end)}
+        })
+    
+    return updates
+
+class ReschedulerAgent:
+    def __init__(self):
+        self.plans_collection = get_collection("plans")
+        self.tasks_collection = get_collection("tasks")
+    
+    async def reschedule_plan(self, plan_id: str, now: Optional[datetime] = None) -> Dict[str, Any]:
+        """Deterministically reschedule the remaining tasks of a plan without an LLM call"""
+        
+        now = now or datetime.utcnow()
+        
+        plan = await self.plans_collection.find_one({"_id": ObjectId(plan_id)})
+        if not plan:
+            return {"status": "error", "error": "Plan not found"}
+        
+        tasks = await self.tasks_collection.find({"plan_id": plan_id_filter(plan_id)}).to_list(None)
+        updates = compute_schedule(plan, tasks, now)
+        
+        rescheduled = 0
+        if updates:
+            # Each move is conditional on the version it was computed from, so a concurrent edit wins
+            # and the task is reconsidered on the next run
+            result = await self.tasks_collection.bulk_write([
+                UpdateOne(
+                    {"_id": update["_id"], "version": version_filter(update["version"])},
+                    bump_version({"$set": {**update["fields"], "rescheduled_at": now}})
+                )
+                for update in updates
+            ], ordered=False)
+            rescheduled = result.modified_count
+            if rescheduled:
+                await touch_plan(plan_id)
+        
+        return {
+            "status": "success",
+            "plan_id": str(plan_id),
+            "tasks_rescheduled": rescheduled
+        }
@@ -0,0 +1,154 @@
+import os
+import re
+import math
+from typing import Dict, Any, List, Optional, Tuple
+from datetime import datetime, timedelta
+
+from utils.dates import parse_utc
+from utils import metrics
+
+TEMPLATE_PLANNER_ENABLED = os.getenv("TEMPLATE_PLANNER_ENABLED", "true").lower() == "true"
+TEMPLATE_MIN_CONFIDENCE = float(os.getenv("TEMPLATE_MIN_CONFIDENCE", "0.8"))
+
+# Parametric plans: a fixed amount of a unit, split into equal periods up to the end date
+PLAN_TEMPLATES = {
+    "study": {
+        "template_id": "study_linear",
+        "units": {"page", "chapter", "lesson", "hour", "word", "problem", "exercise", "video", "unit", "module"},
+        "keywords": {"read", "study", "finish", "complete", "learn", "practice", "review", "write"},
+        "period_days": 7,
+        "title": "Week {period}: {metric} ({amount} {unit})",
+        "description": "Work through {amount} {unit} towards: {objective}. Running total by the end of this week: {cumulative} of {total} {unit}."
+    },
+    "weight_loss": {
+        "template_id": "weight_loss_linear",
+        "units": {"kg", "kilogram", "lb", "lbs", "pound"},
+        "keywords": {"lose", "loss", "drop", "reduce", "shed", "cut"},
+        # The target may be a goal weight, so the amount is only taken when it is clearly a loss
+        "amount": "loss",
+        "period_days": 7,
+        "title": "Week {period}: Lose {amount} {unit}",
+        "description": "Keep a steady calorie deficit and regular exercise to lose {amount} {unit} this week. Running total: {cumulative} of {total} {unit}."
+    }
+}
+
+def _normalize_unit(unit: str) -> str:
+    unit = (unit or "").strip().lower().rstrip(".")
+    if unit.endswith("s") and unit not in {"lbs"}:
+        unit = unit[:-1]
+    return unit
+
+def _parse_number(value: Any) -> Optional[float]:
+    if isinstance(value, (int, float)):
+        return float(value)
+    match = re.search(r"-?\d+(?:\.\d+)?", str(value or "").replace(",", ""))
+    return float(match.group()) if match else None
+
+def _format_number(value: float) -> str:
+    return f"{value:g}"
+
+def _words(text: str) -> set:
+    return set(re.findall(r"[a-z]+", (text or "").lower()))
+
+def _loss_amount(metric: Dict[str, Any], target: float, keywords: set) -> Optional[float]:
+    """Amount to lose: current minus target when the current value is known, else the target if the metric names a loss"""
+    
+    current = _parse_number(metric.get("current"))
+    if current is not None:
+        return current - target
+    if (_words(metric.get("metric", "")) | _words(str(metric.get("target", "")))) & keywords:
+        return target
+    return None
+
+class TemplatePlanner:
+    def match(self, parsed_goal: Dict[str, Any], plan_type: str) -> Tuple[Optional[Dict[str, Any]], Dict[str, Any], float]:
+        """Classify a parsed goal against the plan type's template and extract its parameters"""
+        
+        template = PLAN_TEMPLATES.get(plan_type)
+        metrics_list = parsed_goal.get("target_metrics") or []
+        if not template or not metrics_list:
+            return None, {}, 0.0
+        
+        numeric = [
+            (metric, _parse_number(metric.get("target")))
+            for metric in metrics_list
+            if _parse_number(metric.get("target"))
+        ]
+        if not numeric:
+            return None, {}, 0.0
+        
+        metric, total = numeric[0]
+        if template.get("amount") == "loss":
+            total = _loss_amount(metric, total, template["keywords"])
+        # A negative or missing amount is a parse the template cannot express; the LLM planner handles it
+        if total is None or total <= 0:
+            return None, {}, 0.0
+        unit = _normalize_unit(metric.get("unit") or "")
+        text = _words(metric.get("metric", "")) | _words(parsed_goal.get("main_objective", ""))
+        
+        # A single numeric target is what a linear template can express; all three signals are needed to match
+        confidence = 0.4 if len(numeric) == 1 else 0.1
+        if unit in template["units"]:
+            confidence += 0.3
+        if text & template["keywords"]:
+            confidence += 0.2
+        
+        params = {
+            "metric": metric.get("metric") or "Progress",
+            "objective": parsed_goal.get("main_objective", ""),
+            "unit": metric.get("unit") or unit,
+            "total": total
+        }
+        return template, params, round(confidence, 2)
+    
+    def generate_tasks(self, template: Dict[str, Any], params: Dict[str, Any],
+                       start: datetime, end: datetime) -> List[Dict[str, Any]]:
+        """Fill the template into evenly sized periodic tasks"""
+        
+        total_days = max((end - start).days, 1)
+        periods = max(1, math.ceil(total_days / template["period_days"]))
+        per_period = round(params["total"] / periods, 2)
+        
+        tasks = []
+        cumulative = 0.0
+        for period in range(1, periods + 1):
+            amount = per_period if period < periods else round(params["total"] - cumulative, 2)
+            cumulative = round(cumulative + amount, 2)
+            target_date = min(start + timedelta(days=template["period_days"] * period), end)
+            values = {
+                **params,
+                "period": period,
+                "amount": _format_number(amount),
+                "cumulative": _format_number(cumulative),
+                "total": _format_number(params["total"])
+            }
+            tasks.append({
+                "title": template["title"].format(**values),
+                "description": template["description"].format(**values),
+                "target_date": target_date.date().isoformat(),
+                "unit": params["unit"],
+                "target_value": amount,
+                "priority": "medium"
+            })
+        return tasks
+    
+    async def plan_from_template(self, state: Dict[str, Any]) -> Dict[str, Any]:
+        """Generate tasks locally when a template matches the parsed goal confidently"""
+        
+        if not TEMPLATE_PLANNER_ENABLED or state.get("status") == "error":
+            return state
+        
+        template, params, confidence = self.match(state.get("parsed_goal") or {}, state.get("plan_type", ""))
+        attempts = metrics.incr("planner.template.attempts")
+        
+        if template and confidence >= TEMPLATE_MIN_CONFIDENCE:
+            start = parse_utc(state["start_date"])
+            end = parse_utc(state["end_date"])
+            state["planned_tasks"] = self.generate_tasks(template, params, start, end)
+            state["plan_summary"] = f"{params['objective']} ({_format_number(params['total'])} {params['unit']} by {end.date().isoformat()})"
+            state["template_id"] = template["template_id"]
+            state["status"] = "plan_created"
+            metrics.incr("planner.template.hits")
+        
+        metrics.set_gauge("planner.template.hit_rate", metrics.get_counter("planner.template.hits") / attempts)
+        return state
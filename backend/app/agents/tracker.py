@@ -1,39 +1,61 @@
-from typing import Dict, Any
+import asyncio
+from typing import Awaitable, Callable, Dict, Any, List, Optional
 from db.connection import get_collection
 from models.models import Task, ProgressLog
+from agents.rescheduler import ReschedulerAgent, AUTO_RESCHEDULE
+from agents.progress_buffer import progress_buffer, PROGRESS_WRITE_BEHIND
+from db.versioning import touch_plan, update_versioned, progress_update, DocumentNotFoundError, VersionConflictError
 from bson import ObjectId
 from datetime import datetime
+from utils.log import get_logger
+
+logger = get_logger(__name__)
 
 class TrackerAgent:
     def __init__(self):
         self.tasks_collection = get_collection("tasks")
         self.progress_collection = get_collection("progress_logs")
     
+    async def insert_tasks(self, state: Dict[str, Any], planned_tasks: List[Dict[str, Any]]) -> List[Task]:
+        """Write planned tasks of the state's plan in one round trip"""
+        
+        plan_id = state.get("plan_id", "")
+        tasks = [
+            Task(
+                plan_id=plan_id,
+                user_id=state.get("user_id"),
+                title=task_data["title"],
+                description=task_data.get("description", ""),
+                target_date=datetime.fromisoformat(task_data["target_date"]),
+                unit=task_data.get("unit"),
+                target_value=task_data.get("target_value"),
+                milestone_id=task_data.get("milestone_id")
+            )
+            for task_data in planned_tasks
+        ]
+        if not tasks:
+            return []
+        
+        result = await self.tasks_collection.insert_many(
+            [{**task.dict(exclude={"id"}), "plan_id": ObjectId(plan_id)} for task in tasks]
+        )
+        for task, inserted_id in zip(tasks, result.inserted_ids):
+            task.id = str(inserted_id)
+        return tasks
+    
     async def save_tasks(self, state: Dict[str, Any]) -> Dict[str, Any]:
         """Save planned tasks to MongoDB"""
         
-        planned_tasks = state.get("planned_tasks", [])
         plan_id = state.get("plan_id", "")
         
         try:
-            saved_tasks = []
+            # Tasks streamed in by the planner have been written already
+            if not state.get("tasks_streamed"):
+                saved_tasks = await self.insert_tasks(state, state.get("planned_tasks", []))
+                state["saved_tasks"] = [task.dict() for task in saved_tasks]
+                state["tasks_count"] = len(saved_tasks)
             
-            for task_data in planned_tasks:
-                task = Task(
-                    plan_id=plan_id,
-                    title=task_data["title"],
-                    description=task_data.get("description", ""),
-                    target_date=datetime.fromisoformat(task_data["target_date"]),
-                    unit=task_data.get("unit"),
-                    target_value=task_data.get("target_value")
-                )
-                
-                result = await self.tasks_collection.insert_one(task.dict(exclude={"id"}))
-                task.id = str(result.inserted_id)
-                saved_tasks.append(task)
-            
-            state["saved_tasks"] = [task.dict() for task in saved_tasks]
-            state["tasks_count"] = len(saved_tasks)
+            await touch_plan(plan_id)
             state["status"] = "tasks_saved"
             
         except Exception as e:
@@ -43,30 +65,102 @@ class TrackerAgent:
         return state
     
     async def log_progress(self, task_id: str, user_id: str, status: str, 
-                          value: float = None, note: str = None) -> str:
-        """Log progress for a specific task"""
+                          value: float = None, note: str = None,
+                          expected_version: Optional[int] = None, delta: float = None) -> str:
+        """Log progress for a specific task; a delta is added to the stored value on the server"""
+        
+        # Conditional updates need an answer now, so they always take the synchronous path
+        if PROGRESS_WRITE_BEHIND and expected_version is None:
+            # A point read on _id, so an unknown task fails now instead of being dropped at flush
+            if not await self.tasks_collection.count_documents({"_id": ObjectId(task_id)}, limit=1):
+                raise DocumentNotFoundError(f"Task {task_id} not found")
+            return progress_buffer.add(task_id, user_id, status, value, note, delta=delta)
         
         try:
+            # Update the task first, atomically and optionally conditional on its version,
+            # so a log is only written for a task that exists and records the version it produced
+            projection = {"plan_id": 1, "version": 1, "current_value": 1, "status": 1}
+            changes_value = value is not None or delta is not None
+            if changes_value:
+                task = await update_versioned(
+                    self.tasks_collection, ObjectId(task_id),
+                    progress_update(delta=delta, value=value, status=status),
+                    expected_version=expected_version, projection=projection
+                )
+                # Record what the update produced, which may differ from the request under concurrency
+                value, status = task.get("current_value"), task.get("status", status)
+            else:
+                task = await self.tasks_collection.find_one({"_id": ObjectId(task_id)}, projection)
+                if task is None:
+                    raise DocumentNotFoundError(f"Task {task_id} not found")
+                if expected_version is not None and task.get("version", 0) != expected_version:
+                    raise VersionConflictError(f"Task {task_id} is no longer at version {expected_version}")
+            
             progress_log = ProgressLog(
                 task_id=task_id,
                 user_id=user_id,
                 status=status,
                 value=value,
+                delta=delta,
                 note=note
             )
             
             result = await self.progress_collection.insert_one(
-                progress_log.dict(exclude={"id"})
+                {**progress_log.dict(exclude={"id"}), "task_version": task.get("version", 0)}
             )
             
-            # Update task current_value if value provided
-            if value is not None:
-                await self.tasks_collection.update_one(
-                    {"_id": ObjectId(task_id)},
-                    {"$set": {"current_value": value, "status": status}}
-                )
+            if changes_value:
+                await touch_plan(task["plan_id"])
+                await self._reschedule_after_progress(str(task["plan_id"]))
             
             return str(result.inserted_id)
             
+        except (DocumentNotFoundError, VersionConflictError):
+            raise
         except Exception as e:
             raise Exception(f"Progress logging failed: {str(e)}")
+    
+    async def _reschedule_after_progress(self, plan_id: str) -> None:
+        """Rebalance the remaining tasks of the plan; never fails the progress update"""
+        
+        if not AUTO_RESCHEDULE:
+            return
+        
+        try:
+            await ReschedulerAgent().reschedule_plan(plan_id)
+        except Exception:
+            logger.exception("Rescheduling failed", extra={"plan_id": plan_id})
+
+class StreamingTaskWriter:
+    """Writes batches of planned tasks in the background while the planner is still streaming"""
+    
+    def __init__(self, tracker: TrackerAgent, state: Dict[str, Any], ready: Callable[[], Awaitable[None]]):
+        self.tracker = tracker
+        self.state = state
+        self.ready = ready
+        self.writes: List[asyncio.Task] = []
+    
+    def add(self, planned_tasks: List[Dict[str, Any]]) -> None:
+        self.writes.append(asyncio.create_task(self._write(list(planned_tasks))))
+    
+    async def _write(self, planned_tasks: List[Dict[str, Any]]) -> List[Task]:
+        # Tasks must not be visible before their plan exists
+        await self.ready()
+        return await self.tracker.insert_tasks(self.state, planned_tasks)
+    
+    @property
+    def used(self) -> bool:
+        return bool(self.writes)
+    
+    async def finish(self) -> List[Task]:
+        """Wait for all batch writes, in the order the batches were planned"""
+        
+        batches = await asyncio.gather(*self.writes)
+        return [task for batch in batches for task in batch]
+    
+    async def abort(self) -> None:
+        """Stop outstanding writes; tasks already written are left to the caller to remove"""
+        
+        for write in self.writes:
+            write.cancel()
+        await asyncio.gather(*self.writes, return_exceptions=True)
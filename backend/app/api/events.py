@@ -0,0 +1,37 @@
+import os
+import json
+import asyncio
+from fastapi import APIRouter, Request, Depends
+from fastapi.responses import StreamingResponse
+from models.models import User
+from utils.auth import get_current_stream_user, require_user_access
+from utils.pubsub import pubsub
+
+router = APIRouter()
+
+HEARTBEAT_SECONDS = float(os.getenv("SSE_HEARTBEAT_SECONDS", "15"))
+
+@router.get("/events/{user_id}")
+async def stream_events(user_id: str, request: Request, current_user: User = Depends(get_current_stream_user)):
+    """Server-sent events for changes to a user's plans, tasks and progress logs"""
+    
+    require_user_access(current_user, user_id)
+    
+    async def event_stream():
+        queue = pubsub.subscribe(user_id)
+        try:
+            while not await request.is_disconnected():
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                yield f"event: {event['collection']}\ndata: {json.dumps(event, default=str)}\n\n"
+        finally:
+            pubsub.unsubscribe(user_id, queue)
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
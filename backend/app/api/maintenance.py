@@ -0,0 +1,35 @@
+from fastapi import APIRouter, HTTPException, Depends
+from typing import Dict, Any
+from db.archive import run_archive, working_set
+from db.overdue import run_overdue_sweep
+from models.models import User
+from utils.auth import get_current_admin_user
+
+router = APIRouter()
+
+@router.post("/maintenance/archive")
+async def archive_cold_data(current_user: User = Depends(get_current_admin_user)) -> Dict[str, Any]:
+    """Move inactive or finished plans and old progress logs to the archive collections"""
+    
+    try:
+        return await run_archive()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/maintenance/overdue-sweep")
+async def sweep_overdue_tasks(current_user: User = Depends(get_current_admin_user)) -> Dict[str, Any]:
+    """Flag overdue and at-risk tasks and rebuild the per-user summaries now"""
+    
+    try:
+        return await run_overdue_sweep()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/maintenance/storage")
+async def get_storage(current_user: User = Depends(get_current_admin_user)) -> Dict[str, Any]:
+    """Report the size of the hot collections and their indexes"""
+    
+    try:
+        return await working_set()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
@@ -1,16 +1,40 @@
-from fastapi import APIRouter, HTTPException
-from schemas.schemas import CreatePlanRequest, CreatePlanResponse, PlanStatusResponse, PlanResponse
+import os
+import json
+import asyncio
+from fastapi import APIRouter, HTTPException, Request, Response
+from fastapi.responses import StreamingResponse
+from schemas.schemas import CreatePlanRequest, CreatePlanResponse, PlanStatusResponse, PlanResponse, RescheduleResponse
+from schemas.schemas import BatchCreatePlanRequest, BatchPlanResult, MilestoneResponse, MilestoneExpandResponse
 from models.models import Plan
-from db.connection import get_collection
-from graph.workflow import PlanningWorkflow
+from db.connection import get_collection, get_dashboard_collection
+from agents.rescheduler import ReschedulerAgent
+from agents.milestones import MilestoneExpander, schedule_due_expansions, completion_percentage, EXPANDED
+from db.versioning import DocumentNotFoundError
+from graph.plan_queue import enqueue_plan, set_workflow_status
+from utils.llm import llm_available
+from utils.ai_stack import planning_workflow
+from utils.etag import make_etag, is_not_modified
+from utils.cache import response_cache
+from db.archive import archive_collection, find_one_with_archive, find_with_archive
+from db.migrations import plan_id_filter
 from bson import ObjectId
 from datetime import datetime
-from typing import List
+from typing import Any, AsyncIterator, Dict, List, Optional, Set
 
 router = APIRouter()
 
+BATCH_MAX_PLANS = int(os.getenv("BATCH_MAX_PLANS", "50"))
+# Workflows of one batch running at the same time, and so the batch's share of LLM calls in flight
+BATCH_PLAN_CONCURRENCY = int(os.getenv("BATCH_PLAN_CONCURRENCY", "4"))
+# Goals this short are parsed together, up to GOAL_PACK_SIZE per LLM call
+GOAL_PACK_SIZE = int(os.getenv("GOAL_PACK_SIZE", "4"))
+GOAL_PACK_MAX_CHARS = int(os.getenv("GOAL_PACK_MAX_CHARS", "400"))
+
+# Holds batch workflow tasks so they finish even if the client stops reading the stream
+_batch_runs: Set[asyncio.Task] = set()
+
 @router.post("/create", response_model=CreatePlanResponse)
-async def create_plan(request: CreatePlanRequest):
+async def create_plan(request: CreatePlanRequest, response: Response):
     """Create a new plan and trigger LangGraph workflow"""
     
     try:
@@ -26,12 +50,13 @@ async def create_plan(request: CreatePlanRequest):
             end_date=request.end_date
         )
         
-        # Save plan to MongoDB
-        result = await plans_collection.insert_one(plan.dict(exclude={"id"}))
-        plan_id = str(result.inserted_id)
+        # The id is generated here so the insert can run alongside goal parsing
+        plan_oid = ObjectId()
+        plan_id = str(plan_oid)
+        plan_insert = asyncio.create_task(plans_collection.insert_one({"_id": plan_oid, **plan.dict(exclude={"id"})}))
         
         # Execute LangGraph workflow
-        workflow = PlanningWorkflow()
+        workflow = planning_workflow()
         initial_state = {
             "goal_description": request.description,
             "plan_type": request.plan_type.value,
@@ -42,112 +67,384 @@ async def create_plan(request: CreatePlanRequest):
             "status": "initialized"
         }
         
-        workflow_result = await workflow.execute_planning(initial_state)
+        # While the AI service is degraded, queue the plan instead of holding the request
+        if not llm_available():
+            await plan_insert
+            await response_cache.invalidate(f"user:{request.user_id}")
+            await enqueue_plan(plan_id, initial_state)
+            response.status_code = 202
+            return CreatePlanResponse(
+                plan_id=plan_id,
+                message="AI planning is temporarily unavailable, the plan has been queued",
+                tasks_created=0,
+                status="queued"
+            )
+        
+        # Task writes inside the workflow wait for the insert, which usually finishes during the first LLM call
+        planning = asyncio.create_task(workflow.execute_planning(initial_state, plan_insert=plan_insert))
+        try:
+            await plan_insert
+        except Exception:
+            planning.cancel()
+            raise
+        await response_cache.invalidate(f"user:{request.user_id}")
+        workflow_result = await planning
+        
+        return await _finish_workflow(plan_id, workflow_result)
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/create/batch")
+async def create_plans_batch(request: BatchCreatePlanRequest):
+    """Create many plans at once, streaming one NDJSON result line per plan as its workflow finishes"""
+    
+    if not request.plans:
+        raise HTTPException(status_code=400, detail="No plans provided")
+    if len(request.plans) > BATCH_MAX_PLANS:
+        raise HTTPException(status_code=400, detail=f"At most {BATCH_MAX_PLANS} plans per batch")
+    
+    try:
+        plans_collection = get_collection("plans")
+        
+        # Save all plan documents in one round trip
+        plans = [
+            Plan(
+                user_id=plan_request.user_id,
+                title=plan_request.title,
+                plan_type=plan_request.plan_type,
+                description=plan_request.description,
+                start_date=plan_request.start_date,
+                end_date=plan_request.end_date
+            )
+            for plan_request in request.plans
+        ]
+        result = await plans_collection.insert_many([plan.dict(exclude={"id"}) for plan in plans])
+        plan_ids = [str(inserted_id) for inserted_id in result.inserted_ids]
+        for user_id in {plan_request.user_id for plan_request in request.plans}:
+            await response_cache.invalidate(f"user:{user_id}")
+    
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    
+    states = [
+        {
+            "goal_description": plan_request.description,
+            "plan_type": plan_request.plan_type.value,
+            "user_id": plan_request.user_id,
+            "plan_id": plan_id,
+            "start_date": plan_request.start_date.isoformat(),
+            "end_date": plan_request.end_date.isoformat(),
+            "status": "initialized"
+        }
+        for plan_request, plan_id in zip(request.plans, plan_ids)
+    ]
+    
+    async def result_lines() -> AsyncIterator[str]:
+        async for plan_result in _run_batch(states, request.pack_goals):
+            yield json.dumps(plan_result.dict()) + "\n"
+    
+    return StreamingResponse(result_lines(), media_type="application/x-ndjson")
+
+async def _run_batch(states: List[Dict[str, Any]], pack_goals: bool) -> AsyncIterator[BatchPlanResult]:
+    """Run the workflows of a batch under a shared concurrency limit, yielding results in completion order"""
+    
+    workflow = planning_workflow()
+    semaphore = asyncio.Semaphore(BATCH_PLAN_CONCURRENCY)
+    results: "asyncio.Queue[BatchPlanResult]" = asyncio.Queue()
+    
+    # Short goals are grouped so one LLM call parses several of them
+    entries = list(enumerate(states))
+    short = [entry for entry in entries if pack_goals and len(entry[1]["goal_description"]) <= GOAL_PACK_MAX_CHARS]
+    packed = {index for index, _ in short}
+    packs = [short[start:start + GOAL_PACK_SIZE] for start in range(0, len(short), GOAL_PACK_SIZE)]
+    packs += [[entry] for entry in entries if entry[0] not in packed]
+    
+    async def run_plan(index: int, state: Dict[str, Any], parsed_goal: Optional[Dict[str, Any]]) -> None:
+        async with semaphore:
+            plan_result = await _run_batch_plan(workflow, index, state, parsed_goal)
+        await results.put(plan_result)
+    
+    async def run_pack(pack: List[Any]) -> None:
+        parsed_goals = [None] * len(pack)
+        if len(pack) > 1 and llm_available():
+            async with semaphore:
+                parsed_goals = await workflow.goal_parser.parse_goals_batch([state for _, state in pack])
+        await asyncio.gather(*(
+            run_plan(index, state, parsed_goal) for (index, state), parsed_goal in zip(pack, parsed_goals)
+        ))
+    
+    for pack in packs:
+        runner = asyncio.create_task(run_pack(pack))
+        _batch_runs.add(runner)
+        runner.add_done_callback(_batch_runs.discard)
+    
+    for _ in states:
+        yield await results.get()
+
+async def _run_batch_plan(workflow: Any, index: int, state: Dict[str, Any],
+                          parsed_goal: Optional[Dict[str, Any]]) -> BatchPlanResult:
+    """Run one plan of a batch; failures are reported in the result instead of raised"""
+    
+    plan_id = state["plan_id"]
+    try:
+        # Plans still waiting when the AI service degrades are queued like single creates
+        if not llm_available():
+            await enqueue_plan(plan_id, state)
+            return BatchPlanResult(
+                index=index, plan_id=plan_id, status="queued",
+                message="AI planning is temporarily unavailable, the plan has been queued"
+            )
+        
+        if parsed_goal is not None:
+            workflow_result = await workflow.execute_with_parsed_goal(state, parsed_goal)
+        else:
+            workflow_result = await workflow.execute_planning(state)
         
-        if workflow_result.get("status") == "error":
-            raise HTTPException(status_code=500, detail=workflow_result.get("error"))
+        failed = workflow_result.get("status") == "error"
+        await set_workflow_status(plan_id, "failed" if failed else "completed")
+        if failed:
+            return BatchPlanResult(index=index, plan_id=plan_id, status="failed", message=workflow_result.get("error", ""))
         
-        return CreatePlanResponse(
+        return BatchPlanResult(
+            index=index,
             plan_id=plan_id,
-            message=workflow_result.get("message", "Plan created successfully"),
-            tasks_created=workflow_result.get("tasks_count", 0)
+            status="created",
+            tasks_created=workflow_result.get("tasks_count", 0),
+            message=workflow_result.get("message", "Plan created successfully")
         )
+    
+    except Exception as e:
+        return BatchPlanResult(index=index, plan_id=plan_id, status="failed", message=str(e))
+
+@router.post("/plans/{plan_id}/resume", response_model=CreatePlanResponse)
+async def resume_plan(plan_id: str):
+    """Resume a failed plan workflow from its last successful step"""
+    
+    try:
+        workflow = planning_workflow()
+        workflow_result = await workflow.resume_planning(plan_id)
         
+        return await _finish_workflow(plan_id, workflow_result)
+    
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+async def _finish_workflow(plan_id: str, workflow_result: dict) -> CreatePlanResponse:
+    """Record the workflow outcome on the plan document and build the response"""
+    
+    failed = workflow_result.get("status") == "error"
+    await set_workflow_status(plan_id, "failed" if failed else "completed")
+    
+    if failed:
+        # The plan is kept so the workflow can be resumed from its checkpoint
+        raise HTTPException(
+            status_code=500,
+            detail=workflow_result.get("error"),
+            headers={"X-Plan-Id": plan_id}
+        )
+    
+    return CreatePlanResponse(
+        plan_id=plan_id,
+        message=workflow_result.get("message", "Plan created successfully"),
+        tasks_created=workflow_result.get("tasks_count", 0)
+    )
+
 @router.get("/status/{plan_id}", response_model=PlanStatusResponse)
-async def get_plan_status(plan_id: str):
+async def get_plan_status(plan_id: str, request: Request, response: Response):
     """Get plan status and completion statistics"""
     
     try:
-        plans_collection = get_collection("plans")
-        tasks_collection = get_collection("tasks")
+        watermark = await find_one_with_archive("plans", {"_id": ObjectId(plan_id)}, {"version": 1})
+        version = watermark.get("version", 0) if watermark else None
+        if watermark:
+            etag = make_etag("status", plan_id, version)
+            if is_not_modified(request, etag):
+                return Response(status_code=304, headers={"ETag": etag})
+            response.headers["ETag"] = etag
+        
+        # Keyed by version, so a worker whose cache missed another worker's invalidation never serves an old body under a new ETag
+        return await response_cache.get_or_load(
+            f"status:{plan_id}:{version}", [f"plan:{plan_id}"], lambda: _load_plan_status(plan_id)
+        )
+        
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/plans/{plan_id}/reschedule", response_model=RescheduleResponse)
+async def reschedule_plan(plan_id: str):
+    """Stretch a plan's remaining tasks to the observed pace without an LLM call; dates only move later"""
+    
+    try:
+        rescheduler = ReschedulerAgent()
+        result = await rescheduler.reschedule_plan(plan_id)
+        
+        if result.get("status") == "error":
+            raise HTTPException(status_code=404, detail=result.get("error"))
         
-        # Get plan
-        plan = await plans_collection.find_one({"_id": ObjectId(plan_id)})
+        return RescheduleResponse(**result)
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/plans/{plan_id}/milestones", response_model=List[MilestoneResponse])
+async def get_plan_milestones(plan_id: str):
+    """Get the milestones of a hierarchical plan; opening them starts generating the tasks of current ones"""
+    
+    try:
+        plan = await find_one_with_archive(
+            "plans", {"_id": ObjectId(plan_id)}, {"milestones": 1, "is_active": 1, "end_date": 1}
+        )
         if not plan:
             raise HTTPException(status_code=404, detail="Plan not found")
         
-        # Get tasks statistics
-        tasks = await tasks_collection.find({"plan_id": plan_id}).to_list(None)
+        milestones = plan.get("milestones") or []
+        if milestones:
+            schedule_due_expansions(plan)
+        return [MilestoneResponse(**milestone) for milestone in milestones]
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/plans/{plan_id}/milestones/{milestone_id}/expand", response_model=MilestoneExpandResponse)
+async def expand_milestone(plan_id: str, milestone_id: str):
+    """Generate a milestone's tasks now, e.g. when the user opens it before it comes up"""
+    
+    if not llm_available():
+        raise HTTPException(status_code=503, detail="AI planning is temporarily unavailable")
+    
+    try:
+        result = await MilestoneExpander().expand(plan_id, milestone_id)
+        return MilestoneExpandResponse(plan_id=plan_id, milestone_id=milestone_id, **result)
+    
+    except DocumentNotFoundError:
+        raise HTTPException(status_code=404, detail="Milestone not found")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/plans/user/{user_id}", response_model=List[PlanResponse])
+async def get_user_plans(user_id: str, request: Request, response: Response, include_archived: bool = False):
+    """Get all plans for a specific user with completion statistics"""
+    
+    try:
+        plans_collection = get_dashboard_collection("plans")
+        
+        # Validate against the versions of the user's active plans only
+        versions = await plans_collection.find(
+            {"user_id": user_id, "is_active": True}, {"version": 1}
+        ).to_list(None)
+        if include_archived:
+            versions += await archive_collection("plans", dashboard=True).find(
+                {"user_id": user_id, "is_active": True}, {"version": 1}
+            ).to_list(None)
+        etag = make_etag("plans", user_id, include_archived, sorted((str(plan["_id"]), plan.get("version", 0)) for plan in versions))
+        if is_not_modified(request, etag):
+            return Response(status_code=304, headers={"ETag": etag})
+        response.headers["ETag"] = etag
+        
+        # The ETag covers every plan version, so it keys the cached body to exactly those versions
+        cache_key = f"plans:user:{user_id}:{etag}"
+        return await response_cache.get_or_load(
+            cache_key, [f"user:{user_id}"], lambda: _load_user_plans(user_id, include_archived)
+        )
+        
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+async def _load_plan_status(plan_id: str) -> PlanStatusResponse:
+    """Compute the completion statistics of a plan"""
+    
+    # Get plan
+    plan = await find_one_with_archive("plans", {"_id": ObjectId(plan_id)})
+    if not plan:
+        raise HTTPException(status_code=404, detail="Plan not found")
+    
+    # Get tasks statistics
+    tasks = await find_with_archive("tasks", {"plan_id": plan_id_filter(plan_id)})
+    total_tasks = len(tasks)
+    completed_tasks = sum(1 for task in tasks if task["status"] == "completed")
+    pending_tasks = total_tasks - completed_tasks
+    
+    milestones = plan.get("milestones") or []
+    completion_rate = completion_percentage(tasks, milestones)
+    
+    # Calculate days remaining
+    end_date = plan["end_date"]
+    days_remaining = max(0, (end_date - datetime.utcnow()).days)
+    
+    return PlanStatusResponse(
+        plan_id=plan_id,
+        title=plan["title"],
+        completion_rate=round(completion_rate, 2),
+        days_remaining=days_remaining,
+        total_tasks=total_tasks,
+        completed_tasks=completed_tasks,
+        pending_tasks=pending_tasks,
+        milestones_pending=sum(1 for milestone in milestones if milestone["state"] != EXPANDED)
+    )
+
+async def _load_user_plans(user_id: str, include_archived: bool = False) -> List[PlanResponse]:
+    """Load a user's active plans with completion statistics, optionally including archived history"""
+    
+    plans_collection = get_dashboard_collection("plans")
+    tasks_collection = get_dashboard_collection("tasks")
+    
+    # Get user's plans
+    plans_cursor = plans_collection.find({"user_id": user_id, "is_active": True})
+    plans = [(plan, tasks_collection) for plan in await plans_cursor.to_list(None)]
+    if include_archived:
+        archived = await archive_collection("plans", dashboard=True).find({"user_id": user_id, "is_active": True}).to_list(None)
+        plans += [(plan, archive_collection("tasks", dashboard=True)) for plan in archived]
+    
+    if not plans:
+        return []
+    
+    plan_responses = []
+    
+    for plan, tasks_collection in plans:
+        plan_id = str(plan["_id"])
+        
+        # Get tasks statistics for this plan
+        tasks = await tasks_collection.find({"plan_id": plan_id_filter(plan_id)}).to_list(None)
         total_tasks = len(tasks)
         completed_tasks = sum(1 for task in tasks if task["status"] == "completed")
         pending_tasks = total_tasks - completed_tasks
         
-        completion_rate = (completed_tasks / total_tasks * 100) if total_tasks > 0 else 0
+        milestones = plan.get("milestones") or []
+        completion_rate = completion_percentage(tasks, milestones)
         
         # Calculate days remaining
         end_date = plan["end_date"]
         days_remaining = max(0, (end_date - datetime.utcnow()).days)
         
-        return PlanStatusResponse(
+        plan_response = PlanResponse(
             plan_id=plan_id,
+            user_id=plan["user_id"],
             title=plan["title"],
+            plan_type=plan["plan_type"],
+            description=plan.get("description"),
+            start_date=plan["start_date"],
+            end_date=plan["end_date"],
             completion_rate=round(completion_rate, 2),
             days_remaining=days_remaining,
             total_tasks=total_tasks,
             completed_tasks=completed_tasks,
-            pending_tasks=pending_tasks
+            pending_tasks=pending_tasks,
+            milestones_pending=sum(1 for milestone in milestones if milestone["state"] != EXPANDED),
+            created_at=plan["created_at"],
+            is_active=plan["is_active"]
         )
-        
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
-
-@router.get("/plans/user/{user_id}", response_model=List[PlanResponse])
-async def get_user_plans(user_id: str):
-    """Get all plans for a specific user with completion statistics"""
+        plan_responses.append(plan_response)
     
-    try:
-        plans_collection = get_collection("plans")
-        tasks_collection = get_collection("tasks")
-        
-        # Get user's plans
-        plans_cursor = plans_collection.find({"user_id": user_id, "is_active": True})
-        plans = await plans_cursor.to_list(None)
-        
-        if not plans:
-            return []
-        
-        plan_responses = []
-        
-        for plan in plans:
-            plan_id = str(plan["_id"])
-            
-            # Get tasks statistics for this plan
-            tasks = await tasks_collection.find({"plan_id": plan_id}).to_list(None)
-            total_tasks = len(tasks)
-            completed_tasks = sum(1 for task in tasks if task["status"] == "completed")
-            pending_tasks = total_tasks - completed_tasks
-            
-            completion_rate = (completed_tasks / total_tasks * 100) if total_tasks > 0 else 0
-            
-            # Calculate days remaining
-            end_date = plan["end_date"]
-            days_remaining = max(0, (end_date - datetime.utcnow()).days)
-            
-            plan_response = PlanResponse(
-                plan_id=plan_id,
-                user_id=plan["user_id"],
-                title=plan["title"],
-                plan_type=plan["plan_type"],
-                description=plan.get("description"),
-                start_date=plan["start_date"],
-                end_date=plan["end_date"],
-                completion_rate=round(completion_rate, 2),
-                days_remaining=days_remaining,
-                total_tasks=total_tasks,
-                completed_tasks=completed_tasks,
-                pending_tasks=pending_tasks,
-                created_at=plan["created_at"],
-                is_active=plan["is_active"]
-            )
-            plan_responses.append(plan_response)
-        
-        # Sort by creation date (newest first)
-        plan_responses.sort(key=lambda x: x.created_at, reverse=True)
-        
-        return plan_responses
-        
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+    # Sort by creation date (newest first)
+    plan_responses.sort(key=lambda x: x.created_at, reverse=True)
+    
+    return plan_responses
@@ -6,12 +6,16 @@ from schemas.schemas import (
 )
 from db.connection import get_collection
 from agents.tracker import TrackerAgent
-from agents.progress_updater import ProgressUpdaterAgent
+from db.versioning import DocumentNotFoundError, VersionConflictError
+from utils import ai_stack
+from utils.llm import llm_available
 from bson import ObjectId
 from datetime import datetime
 
 router = APIRouter()
 
+DEGRADED_MESSAGE = "AI analysis is temporarily unavailable, please log progress with the structured form"
+
 @router.post("/progress", response_model=ProgressResponse)
 async def log_progress(request: ProgressRequest):
     """Log progress for a specific task"""
@@ -23,7 +27,9 @@ async def log_progress(request: ProgressRequest):
             user_id=request.user_id,
             status=request.status.value,
             value=request.value,
-            note=request.note
+            note=request.note,
+            expected_version=request.expected_version,
+            delta=request.delta
         )
         
         return ProgressResponse(
@@ -31,6 +37,10 @@ async def log_progress(request: ProgressRequest):
             progress_id=progress_id
         )
         
+    except DocumentNotFoundError:
+        raise HTTPException(status_code=404, detail="Task not found")
+    except VersionConflictError as e:
+        raise HTTPException(status_code=409, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -38,8 +48,16 @@ async def log_progress(request: ProgressRequest):
 async def ai_update_progress(request: AIProgressUpdateRequest):
     """Update progress using AI analysis of natural language input"""
     
+    if not llm_available():
+        return AIProgressUpdateResponse(
+            status="degraded",
+            error=DEGRADED_MESSAGE,
+            task_updated=False,
+            fallback="/api/progress"
+        )
+    
     try:
-        progress_updater = ProgressUpdaterAgent()
+        progress_updater = ai_stack.progress_updater()
         result = await progress_updater.analyze_and_update_progress(
             task_id=request.task_id,
             user_input=request.user_input,
@@ -70,8 +88,16 @@ async def ai_update_progress(request: AIProgressUpdateRequest):
 async def bulk_ai_update_progress(request: BulkProgressUpdateRequest):
     """Update multiple tasks using AI analysis of natural language input"""
     
+    if not llm_available():
+        return BulkProgressUpdateResponse(
+            status="degraded",
+            error=DEGRADED_MESSAGE,
+            total_updates=0,
+            fallback="/api/progress"
+        )
+    
     try:
-        progress_updater = ProgressUpdaterAgent()
+        progress_updater = ai_stack.progress_updater()
         result = await progress_updater.bulk_progress_update(
             user_id=request.user_id,
             progress_updates=request.progress_updates
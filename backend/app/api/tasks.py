@@ -1,64 +1,103 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Request, Response
 from typing import List
-from schemas.schemas import TaskResponse, TaskUpdate
-from db.connection import get_collection
+from schemas.schemas import TaskResponse, TaskUpdate, UserTaskSummaryResponse
+from db.connection import get_collection, get_dashboard_collection
+from db.versioning import touch_plan, update_versioned, DocumentNotFoundError, VersionConflictError
+from utils.etag import make_etag, is_not_modified, version_etag, if_match_version
+from utils.cache import response_cache
+from db.archive import find_one_with_archive, find_with_archive
+from db.migrations import plan_id_filter, plan_ids_filter, migration_complete, TASK_OWNER_MIGRATION
+from agents.milestones import schedule_due_expansions
 from bson import ObjectId
 
 router = APIRouter()
 
+# Fields returned by a task update, plus plan_id for the plan watermark
+TASK_RESPONSE_PROJECTION = {
+    "plan_id": 1, "title": 1, "description": 1, "target_date": 1, "status": 1, "unit": 1,
+    "target_value": 1, "current_value": 1, "memo": 1, "milestone_id": 1, "version": 1, "due_state": 1
+}
+
 @router.get("/tasks/{plan_id}", response_model=List[TaskResponse])
-async def get_tasks(plan_id: str):
+async def get_tasks(plan_id: str, request: Request, response: Response):
     """Get all tasks for a specific plan"""
     
     try:
-        tasks_collection = get_collection("tasks")
-        
-        # Find tasks for the plan
-        tasks_cursor = tasks_collection.find({"plan_id": plan_id})
-        tasks = await tasks_cursor.to_list(None)
-        
-        if not tasks:
-            return []
-        
-        # Convert to response format
-        task_responses = []
-        for task in tasks:
-            task_response = TaskResponse(
-                id=str(task["_id"]),
-                title=task["title"],
-                description=task.get("description"),
-                target_date=task["target_date"],
-                status=task["status"],
-                unit=task.get("unit"),
-                target_value=task.get("target_value"),
-                current_value=task.get("current_value", 0),
-                memo=task.get("memo")
-            )
-            task_responses.append(task_response)
-        
-        return task_responses
+        # The plan version changes with every task write, so it validates the whole list
+        plan = await find_one_with_archive(
+            "plans", {"_id": ObjectId(plan_id)},
+            {"version": 1, "milestones": 1, "is_active": 1, "end_date": 1}
+        )
+        if plan and plan.get("milestones"):
+            # Opening a plan generates the tasks of milestones that have come up; the version bump refreshes the list
+            schedule_due_expansions(plan)
+        version = plan.get("version", 0) if plan else None
+        if plan:
+            etag = make_etag("tasks", plan_id, version)
+            if is_not_modified(request, etag):
+                return Response(status_code=304, headers={"ETag": etag})
+            response.headers["ETag"] = etag
+        
+        # Keyed by version, so a worker whose cache missed another worker's invalidation never serves an old body under a new ETag
+        return await response_cache.get_or_load(
+            f"tasks:{plan_id}:{version}", [f"plan:{plan_id}"], lambda: _load_plan_tasks(plan_id)
+        )
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+async def _load_plan_tasks(plan_id: str) -> List[TaskResponse]:
+    """Load the tasks of a plan in response format"""
+    
+    # Find tasks for the plan, from the archive once the plan has been archived
+    tasks = await find_with_archive("tasks", {"plan_id": plan_id_filter(plan_id)})
+    
+    if not tasks:
+        return []
+    
+    # Convert to response format
+    task_responses = []
+    for task in tasks:
+        task_response = TaskResponse(
+            id=str(task["_id"]),
+            title=task["title"],
+            description=task.get("description"),
+            target_date=task["target_date"],
+            status=task["status"],
+            unit=task.get("unit"),
+            target_value=task.get("target_value"),
+            current_value=task.get("current_value", 0),
+            memo=task.get("memo"),
+            milestone_id=task.get("milestone_id"),
+            version=task.get("version", 0),
+            due_state=task.get("due_state")
+        )
+        task_responses.append(task_response)
+    
+    return task_responses
+
 @router.get("/tasks/user/{user_id}", response_model=List[TaskResponse])
 async def get_user_tasks(user_id: str):
     """Get all tasks for a specific user across all plans"""
     
     try:
-        plans_collection = get_collection("plans")
-        tasks_collection = get_collection("tasks")
-        
-        # Get user's plans
-        user_plans = await plans_collection.find({"user_id": user_id}).to_list(None)
-        plan_ids = [str(plan["_id"]) for plan in user_plans]
-        
-        if not plan_ids:
-            return []
-        
-        # Get tasks for all user plans
-        tasks_cursor = tasks_collection.find({"plan_id": {"$in": plan_ids}})
-        tasks = await tasks_cursor.to_list(None)
+        plans_collection = get_dashboard_collection("plans")
+        tasks_collection = get_dashboard_collection("tasks")
+        
+        if migration_complete(TASK_OWNER_MIGRATION):
+            # Every task carries its owner, so this is one range scan on the user_id index
+            tasks = await tasks_collection.find({"user_id": user_id}).to_list(None)
+        else:
+            # Get user's plans
+            user_plans = await plans_collection.find({"user_id": user_id}, {"_id": 1}).to_list(None)
+            plan_ids = [str(plan["_id"]) for plan in user_plans]
+            
+            if not plan_ids:
+                return []
+            
+            # Get tasks for all user plans
+            tasks_cursor = tasks_collection.find({"plan_id": plan_ids_filter(plan_ids)})
+            tasks = await tasks_cursor.to_list(None)
         
         # Convert to response format
         task_responses = []
@@ -72,18 +111,42 @@ async def get_user_tasks(user_id: str):
                 unit=task.get("unit"),
                 target_value=task.get("target_value"),
                 current_value=task.get("current_value", 0),
-                memo=task.get("memo")
+                memo=task.get("memo"),
+                milestone_id=task.get("milestone_id"),
+                version=task.get("version", 0),
+                due_state=task.get("due_state")
             )
             task_responses.append(task_response)
         
         return task_responses
+    
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/tasks/user/{user_id}/summary", response_model=UserTaskSummaryResponse)
+async def get_user_task_summary(user_id: str):
+    """Get a user's overdue and upcoming tasks, as last written by the overdue sweeper"""
+    
+    try:
+        summary = await get_dashboard_collection("user_task_summaries").find_one({"_id": user_id})
+        if not summary:
+            return UserTaskSummaryResponse(user_id=user_id)
+        
+        return UserTaskSummaryResponse(
+            user_id=user_id,
+            overdue_count=summary.get("overdue_count", 0),
+            upcoming_count=summary.get("upcoming_count", 0),
+            overdue=summary.get("overdue", []),
+            upcoming=summary.get("upcoming", []),
+            generated_at=summary.get("generated_at")
+        )
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.patch("/tasks/{task_id}", response_model=TaskResponse)
-async def update_task(task_id: str, task_update: TaskUpdate):
-    """Update a task's status, progress, and memo"""
+async def update_task(task_id: str, task_update: TaskUpdate, request: Request, response: Response):
+    """Update a task's status, progress, and memo; If-Match makes the update conditional on the task version"""
     
     try:
         tasks_collection = get_collection("tasks")
@@ -100,17 +163,19 @@ async def update_task(task_id: str, task_update: TaskUpdate):
         if not update_data:
             raise HTTPException(status_code=400, detail="No update data provided")
         
-        # Update the task
-        result = await tasks_collection.update_one(
-            {"_id": ObjectId(task_id)},
-            {"$set": update_data}
-        )
-        
-        if result.matched_count == 0:
+        # Update the task and read it back in one atomic round trip
+        try:
+            updated_task = await update_versioned(
+                tasks_collection, ObjectId(task_id), {"$set": update_data},
+                expected_version=if_match_version(request), projection=TASK_RESPONSE_PROJECTION
+            )
+        except DocumentNotFoundError:
             raise HTTPException(status_code=404, detail="Task not found")
+        except VersionConflictError:
+            raise HTTPException(status_code=412, detail="Task was modified by another request")
         
-        # Get the updated task
-        updated_task = await tasks_collection.find_one({"_id": ObjectId(task_id)})
+        await touch_plan(updated_task["plan_id"])
+        response.headers["ETag"] = version_etag(updated_task["version"])
         
         return TaskResponse(
             id=str(updated_task["_id"]),
@@ -121,8 +186,13 @@ async def update_task(task_id: str, task_update: TaskUpdate):
             unit=updated_task.get("unit"),
             target_value=updated_task.get("target_value"),
             current_value=updated_task.get("current_value", 0),
-            memo=updated_task.get("memo")
+            memo=updated_task.get("memo"),
+            milestone_id=updated_task.get("milestone_id"),
+            version=updated_task["version"],
+            due_state=updated_task.get("due_state")
         )
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -0,0 +1,37 @@
+from fastapi import APIRouter, HTTPException, Request, Depends
+from fastapi.responses import StreamingResponse
+from typing import Dict
+from db.transfer import export_user_data, import_user_data, gzip_stream
+from models.models import User
+from utils.auth import get_current_active_user, require_user_access
+
+router = APIRouter()
+
+@router.get("/export/{user_id}")
+async def export_user(user_id: str, gzip: bool = False, current_user: User = Depends(get_current_active_user)):
+    """Stream a user's plans, tasks and progress logs as NDJSON, optionally gzip-compressed"""
+    
+    require_user_access(current_user, user_id)
+    stream = export_user_data(user_id)
+    filename = f"planner-{user_id}.ndjson"
+    if gzip:
+        stream = gzip_stream(stream)
+        filename += ".gz"
+    
+    return StreamingResponse(
+        stream,
+        media_type="application/gzip" if gzip else "application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+@router.post("/import/{user_id}")
+async def import_user(user_id: str, request: Request, current_user: User = Depends(get_current_active_user)) -> Dict[str, int]:
+    """Import an export (plain or gzip NDJSON request body) into a user's account with new ids"""
+    
+    require_user_access(current_user, user_id)
+    try:
+        return await import_user_data(user_id, request.stream())
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
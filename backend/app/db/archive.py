@@ -0,0 +1,210 @@
+import os
+import asyncio
+from datetime import datetime, timedelta
+from typing import Dict, Any, List, Optional
+from pymongo import ReplaceOne, DeleteOne
+from db.connection import get_collection, get_dashboard_collection, get_database
+from db.migrations import plan_ids_filter
+from db.versioning import version_filter
+from utils.cache import response_cache
+from utils.log import get_logger
+from utils import metrics
+
+logger = get_logger(__name__)
+
+ARCHIVE_ENABLED = os.getenv("ARCHIVE_ENABLED", "false").lower() == "true"
+ARCHIVE_INTERVAL_SECONDS = int(os.getenv("ARCHIVE_INTERVAL_SECONDS", str(24 * 3600)))
+# Plans whose end date passed this long ago move to cold storage, as do soft-deleted plans
+ARCHIVE_FINISHED_AFTER_DAYS = int(os.getenv("ARCHIVE_FINISHED_AFTER_DAYS", "90"))
+PROGRESS_LOG_RETENTION_DAYS = int(os.getenv("PROGRESS_LOG_RETENTION_DAYS", "180"))
+ARCHIVE_PLAN_BATCH_SIZE = int(os.getenv("ARCHIVE_PLAN_BATCH_SIZE", "50"))
+ARCHIVE_LOG_BATCH_SIZE = int(os.getenv("ARCHIVE_LOG_BATCH_SIZE", "1000"))
+# Documents that keep changing while being moved are left in place after this many copies, for the next run
+ARCHIVE_MOVE_ATTEMPTS = int(os.getenv("ARCHIVE_MOVE_ATTEMPTS", "3"))
+
+HOT_COLLECTIONS = ["plans", "tasks", "progress_logs"]
+
+def archive_collection(name: str, dashboard: bool = False):
+    """Cold counterpart of a hot collection"""
+    return get_dashboard_collection(f"{name}_archive") if dashboard else get_collection(f"{name}_archive")
+
+async def find_one_with_archive(name: str, query: Dict[str, Any], projection: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+    """Read from the hot collection, falling back to the archive for history"""
+    
+    document = await get_dashboard_collection(name).find_one(query, projection)
+    if document is None:
+        document = await archive_collection(name, dashboard=True).find_one(query, projection)
+        if document is not None:
+            metrics.incr("archive.reads")
+    return document
+
+async def find_with_archive(name: str, query: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Like find_one_with_archive for lists; an archived parent has all its children archived"""
+    
+    documents = await get_dashboard_collection(name).find(query).to_list(None)
+    if not documents:
+        documents = await archive_collection(name, dashboard=True).find(query).to_list(None)
+        if documents:
+            metrics.incr("archive.reads")
+    return documents
+
+async def _copy(name: str, documents: List[Dict[str, Any]], now: datetime) -> None:
+    # Upserts keep the copy idempotent if a run is interrupted before the delete
+    if documents:
+        await archive_collection(name).bulk_write([
+            ReplaceOne({"_id": document["_id"]}, {**document, "archived_at": now}, upsert=True)
+            for document in documents
+        ], ordered=False)
+
+async def _move(name: str, documents: List[Dict[str, Any]], now: datetime) -> int:
+    """Copy documents to the archive and delete each one only if it is still the version copied"""
+    
+    collection = get_collection(name)
+    moved = 0
+    for _ in range(ARCHIVE_MOVE_ATTEMPTS):
+        if not documents:
+            break
+        await _copy(name, documents, now)
+        result = await collection.bulk_write([
+            DeleteOne({"_id": document["_id"], "version": version_filter(document.get("version", 0))})
+            for document in documents
+        ], ordered=False)
+        moved += result.deleted_count
+        if result.deleted_count == len(documents):
+            break
+        # Written to since the copy: copy the current version again
+        documents = await collection.find({"_id": {"$in": [document["_id"] for document in documents]}}).to_list(None)
+    return moved
+
+async def archive_plans(now: Optional[datetime] = None) -> Dict[str, int]:
+    """Move inactive and long-finished plans, with their tasks and progress logs, to the archive"""
+    
+    now = now or datetime.utcnow()
+    cutoff = now - timedelta(days=ARCHIVE_FINISHED_AFTER_DAYS)
+    query = {
+        "$or": [{"is_active": False}, {"end_date": {"$lt": cutoff}}],
+        "workflow_status": {"$nin": ["planning", "queued"]}
+    }
+    plans_collection = get_collection("plans")
+    tasks_collection = get_collection("tasks")
+    moved = {"plans": 0, "tasks": 0, "progress_logs": 0}
+    # Batches advance by _id, so a plan left in place below is not picked up again in this run
+    after: Optional[Any] = None
+    
+    while True:
+        batch_query = {**query, "_id": {"$gt": after}} if after is not None else query
+        plans = await plans_collection.find(batch_query).sort("_id", 1).limit(ARCHIVE_PLAN_BATCH_SIZE).to_list(None)
+        if not plans:
+            break
+        after = plans[-1]["_id"]
+        
+        plan_ids = [str(plan["_id"]) for plan in plans]
+        tasks = await tasks_collection.find({"plan_id": plan_ids_filter(plan_ids)}).to_list(None)
+        logs = await get_collection("progress_logs").find(
+            {"task_id": {"$in": [str(task["_id"]) for task in tasks]}}
+        ).to_list(None)
+        
+        # Children first and the plan last, so an interrupted batch is picked up again next run
+        moved["progress_logs"] += await _move("progress_logs", logs, now)
+        moved["tasks"] += await _move("tasks", tasks, now)
+        # Logs written between the read above and the task deletes
+        moved["progress_logs"] += await _move_logs_of([str(task["_id"]) for task in tasks], now)
+        
+        # A plan with tasks that kept changing stays hot with them until the next run
+        remaining = {
+            str(plan_id) for plan_id in await tasks_collection.distinct("plan_id", {"plan_id": plan_ids_filter(plan_ids)})
+        }
+        moved["plans"] += await _move("plans", [plan for plan in plans if str(plan["_id"]) not in remaining], now)
+        
+        for plan in plans:
+            await response_cache.invalidate(f"plan:{plan['_id']}", f"user:{plan['user_id']}")
+    
+    return moved
+
+async def archive_orphaned_logs(now: Optional[datetime] = None) -> int:
+    """Move progress logs written for tasks after they were archived, e.g. by a write-behind flush"""
+    
+    now = now or datetime.utcnow()
+    # The previous run's tasks are covered, whether it was scheduled or started by hand
+    since = now - timedelta(seconds=ARCHIVE_INTERVAL_SECONDS * 2)
+    moved = 0
+    
+    archived = archive_collection("tasks").find({"archived_at": {"$gte": since}}, {"_id": 1})
+    task_ids: List[str] = []
+    async for task in archived:
+        task_ids.append(str(task["_id"]))
+        if len(task_ids) >= ARCHIVE_LOG_BATCH_SIZE:
+            moved += await _move_logs_of(task_ids, now)
+            task_ids = []
+    if task_ids:
+        moved += await _move_logs_of(task_ids, now)
+    return moved
+
+async def _move_logs_of(task_ids: List[str], now: datetime) -> int:
+    if not task_ids:
+        return 0
+    logs = await get_collection("progress_logs").find({"task_id": {"$in": task_ids}}).to_list(None)
+    return await _move("progress_logs", logs, now)
+
+async def archive_progress_logs(now: Optional[datetime] = None) -> int:
+    """Move progress logs older than the retention period to the archive"""
+    
+    now = now or datetime.utcnow()
+    cutoff = now - timedelta(days=PROGRESS_LOG_RETENTION_DAYS)
+    logs_collection = get_collection("progress_logs")
+    moved = 0
+    
+    while True:
+        logs = await logs_collection.find({"created_at": {"$lt": cutoff}}).limit(ARCHIVE_LOG_BATCH_SIZE).to_list(None)
+        if not logs:
+            break
+        moved += await _move("progress_logs", logs, now)
+    
+    return moved
+
+async def working_set() -> Dict[str, Dict[str, int]]:
+    """Document, data and index sizes of the hot collections"""
+    
+    footprint = {}
+    for name in HOT_COLLECTIONS:
+        stats = await get_database()[name].aggregate([{"$collStats": {"storageStats": {}}}]).to_list(None)
+        storage = stats[0]["storageStats"] if stats else {}
+        footprint[name] = {
+            "count": storage.get("count", 0),
+            "data_bytes": storage.get("size", 0),
+            "index_bytes": storage.get("totalIndexSize", 0)
+        }
+    return footprint
+
+def _total_bytes(footprint: Dict[str, Dict[str, int]]) -> int:
+    return sum(stats["data_bytes"] + stats["index_bytes"] for stats in footprint.values())
+
+async def run_archive(now: Optional[datetime] = None) -> Dict[str, Any]:
+    """Run one archival pass and report how much of the hot working set it reclaimed"""
+    
+    before = await working_set()
+    now = now or datetime.utcnow()
+    moved = await archive_plans(now)
+    moved["progress_logs"] += await archive_orphaned_logs(now)
+    moved["progress_logs"] += await archive_progress_logs(now)
+    after = await working_set()
+    
+    # Data plus index bytes is what competes for cache; on-disk storage is only released by compact
+    reclaimed = max(0, _total_bytes(before) - _total_bytes(after))
+    for name, count in moved.items():
+        metrics.incr(f"archive.{name}", count)
+    metrics.incr("archive.reclaimed_bytes", reclaimed)
+    metrics.set_gauge("archive.hot_working_set_bytes", _total_bytes(after))
+    
+    logger.info("Archive pass finished", extra={"moved": moved, "reclaimed_bytes": reclaimed})
+    return {"moved": moved, "reclaimed_bytes": reclaimed, "before": before, "after": after}
+
+async def run_archiver() -> None:
+    """Background loop that periodically archives cold data"""
+    
+    while True:
+        try:
+            await run_archive()
+        except Exception:
+            logger.exception("Archive pass failed")
+        await asyncio.sleep(ARCHIVE_INTERVAL_SECONDS)
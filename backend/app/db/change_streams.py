@@ -0,0 +1,121 @@
+import os
+import asyncio
+from collections import OrderedDict
+from typing import Dict, Any, Optional
+from bson import ObjectId
+from pymongo.errors import OperationFailure
+from db.connection import get_database, get_collection
+from utils.pubsub import PubSub
+from utils import metrics
+from utils.log import get_logger
+
+logger = get_logger(__name__)
+
+# Change streams need a replica set or Atlas; a standalone server is detected at startup and disables the watcher
+REALTIME_ENABLED = os.getenv("REALTIME_ENABLED", "false").lower() == "true"
+CHANGE_STREAM_RETRY_SECONDS = float(os.getenv("CHANGE_STREAM_RETRY_SECONDS", "5"))
+
+WATCHED_COLLECTIONS = ["tasks", "plans", "progress_logs"]
+# Fields clients react to; updates carry only those that changed, so the server never looks up whole documents
+EVENT_FIELDS = [
+    "user_id", "plan_id", "task_id", "title", "status", "current_value", "target_value", "target_date",
+    "due_state", "value", "delta", "is_active", "version", "created_at", "updated_at"
+]
+OWNER_CACHE_SIZE = 10000
+# Raised by a $changeStream on a standalone server
+CHANGE_STREAM_UNSUPPORTED = 40573
+
+class ChangeStreamWatcher:
+    """Single change stream over the watched collections, published per user"""
+    
+    def __init__(self, pubsub: PubSub):
+        self.pubsub = pubsub
+        self.resume_token = None
+        # Owning user by "collection:id", for updates that do not carry user_id
+        self.owners: "OrderedDict[str, str]" = OrderedDict()
+    
+    async def run(self) -> None:
+        pipeline = [
+            {"$match": {
+                "ns.coll": {"$in": WATCHED_COLLECTIONS},
+                "operationType": {"$in": ["insert", "update", "replace"]}
+            }},
+            {"$project": {
+                "ns": 1, "operationType": 1, "documentKey": 1,
+                **{f"fullDocument.{field}": 1 for field in EVENT_FIELDS},
+                **{f"updateDescription.updatedFields.{field}": 1 for field in EVENT_FIELDS}
+            }}
+        ]
+        
+        while True:
+            try:
+                async with get_database().watch(pipeline, resume_after=self.resume_token) as stream:
+                    async for change in stream:
+                        self.resume_token = stream.resume_token
+                        await self._dispatch(change)
+            except asyncio.CancelledError:
+                raise
+            except OperationFailure as e:
+                if e.code == CHANGE_STREAM_UNSUPPORTED:
+                    logger.warning("Change streams need a replica set; real-time events are disabled: %s", e)
+                    return
+                # e.g. the resume token fell off the oplog; restart from the current position
+                logger.warning("Change stream failed, restarting without resume token: %s", e)
+                self.resume_token = None
+                metrics.incr("realtime.stream_restarts")
+                await asyncio.sleep(CHANGE_STREAM_RETRY_SECONDS)
+            except Exception as e:
+                logger.warning("Change stream interrupted: %s", e)
+                metrics.incr("realtime.stream_restarts")
+                await asyncio.sleep(CHANGE_STREAM_RETRY_SECONDS)
+    
+    async def _dispatch(self, change: Dict[str, Any]) -> None:
+        collection = change["ns"]["coll"]
+        document_id = change["documentKey"]["_id"]
+        if change["operationType"] == "update":
+            document = change.get("updateDescription", {}).get("updatedFields") or {}
+        else:
+            document = change.get("fullDocument") or {}
+        if not document:
+            return
+        
+        # Skip the owner lookup when nobody is listening
+        if not self.pubsub.subscribers:
+            return
+        
+        user_id = await self._owner(collection, document_id, document)
+        if not user_id:
+            return
+        
+        self.pubsub.publish(user_id, {
+            "collection": collection,
+            "operation": change["operationType"],
+            "id": str(document_id),
+            "document": document
+        })
+    
+    async def _owner(self, collection: str, document_id: ObjectId, document: Dict[str, Any]) -> Optional[str]:
+        """Find the user an event belongs to; updates and tasks not yet backfilled are resolved by a point read"""
+        
+        key = f"{collection}:{document_id}"
+        user_id = document.get("user_id")
+        if not user_id and key in self.owners:
+            self.owners.move_to_end(key)
+            return self.owners[key]
+        
+        if not user_id:
+            stored = await get_collection(collection).find_one({"_id": document_id}, {"user_id": 1, "plan_id": 1})
+            if not stored:
+                return None
+            user_id = stored.get("user_id")
+            if not user_id and collection == "tasks":
+                plan = await get_collection("plans").find_one({"_id": ObjectId(str(stored["plan_id"]))}, {"user_id": 1})
+                user_id = plan and plan["user_id"]
+            if not user_id:
+                return None
+        
+        self.owners[key] = user_id
+        self.owners.move_to_end(key)
+        if len(self.owners) > OWNER_CACHE_SIZE:
+            self.owners.popitem(last=False)
+        return user_id
@@ -1,10 +1,51 @@
 import os
 from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorDatabase, AsyncIOMotorCollection
+from pymongo.read_preferences import Primary, SecondaryPreferred
 from dotenv import load_dotenv
-from typing import Optional
+from typing import Optional, Dict, Any, Union
 
 load_dotenv()
 
+from db.monitoring import PoolMetricsListener
+from utils.profiling import CommandTimingListener, PROFILING_CONFIGURED
+from utils.log import get_logger
+
+logger = get_logger(__name__)
+
+def _env_int(name: str) -> Optional[int]:
+    value = os.getenv(name)
+    return int(value) if value else None
+
+def _env_bool(name: str, default: bool) -> bool:
+    return os.getenv(name, str(default)).lower() == "true"
+
+def client_options() -> Dict[str, Any]:
+    """Connection pool, timeout, compression and retry settings from the environment"""
+    
+    options = {
+        "maxPoolSize": _env_int("MONGO_MAX_POOL_SIZE") or 100,
+        "minPoolSize": _env_int("MONGO_MIN_POOL_SIZE") or 0,
+        "maxIdleTimeMS": _env_int("MONGO_MAX_IDLE_TIME_MS"),
+        "waitQueueTimeoutMS": _env_int("MONGO_WAIT_QUEUE_TIMEOUT_MS"),
+        "serverSelectionTimeoutMS": _env_int("MONGO_SERVER_SELECTION_TIMEOUT_MS") or 5000,
+        "connectTimeoutMS": _env_int("MONGO_CONNECT_TIMEOUT_MS") or 10000,
+        "socketTimeoutMS": _env_int("MONGO_SOCKET_TIMEOUT_MS"),
+        "retryReads": _env_bool("MONGO_RETRY_READS", True),
+        "retryWrites": _env_bool("MONGO_RETRY_WRITES", True),
+        # zstd needs the zstandard package and snappy needs python-snappy; zlib is built in
+        "compressors": os.getenv("MONGO_COMPRESSORS") or None,
+        "event_listeners": [PoolMetricsListener()] + ([CommandTimingListener()] if PROFILING_CONFIGURED else [])
+    }
+    return {key: value for key, value in options.items() if value is not None}
+
+def dashboard_read_preference() -> Union[Primary, SecondaryPreferred]:
+    """Read preference for dashboard reads, which tolerate bounded staleness"""
+    
+    if os.getenv("DASHBOARD_READ_PREFERENCE", "primary") == "secondaryPreferred":
+        # MongoDB requires maxStalenessSeconds to be at least 90
+        return SecondaryPreferred(max_staleness=max(90, _env_int("DASHBOARD_MAX_STALENESS_SECONDS") or 90))
+    return Primary()
+
 class MongoDB:
     client: Optional[AsyncIOMotorClient] = None
     database: Optional[AsyncIOMotorDatabase] = None
@@ -13,15 +54,15 @@ db = MongoDB()
 
 async def init_db() -> None:
     """Initialize MongoDB connection"""
-    db.client = AsyncIOMotorClient(os.getenv("uri"))
+    db.client = AsyncIOMotorClient(os.getenv("uri"), **client_options())
     db.database = db.client.agentic_planner
-    print("Connected to MongoDB Atlas")
+    logger.info("Connected to MongoDB Atlas")
 
 async def close_db() -> None:
     """Close MongoDB connection"""
     if db.client:
         db.client.close()
-        print("Disconnected from MongoDB")
+        logger.info("Disconnected from MongoDB")
 
 def get_database() -> AsyncIOMotorDatabase:
     """Get database instance"""
@@ -30,3 +71,7 @@ def get_database() -> AsyncIOMotorDatabase:
 def get_collection(name: str) -> AsyncIOMotorCollection:
     """Get collection by name"""
     return db.database[name]
+
+def get_dashboard_collection(name: str) -> AsyncIOMotorCollection:
+    """Get collection by name for dashboard reads, honouring DASHBOARD_READ_PREFERENCE"""
+    return db.database.get_collection(name, read_preference=dashboard_read_preference())
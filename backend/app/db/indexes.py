@@ -0,0 +1,33 @@
+import os
+from db.connection import get_collection
+
+WORKFLOW_CHECKPOINT_TTL_SECONDS = int(os.getenv("WORKFLOW_CHECKPOINT_TTL_SECONDS", str(7 * 24 * 3600)))
+
+async def ensure_indexes() -> None:
+    """Create the indexes the application relies on"""
+    
+    # Abandoned planning checkpoints are garbage-collected by TTL
+    await get_collection("workflow_checkpoints").create_index(
+        "updated_at", expireAfterSeconds=WORKFLOW_CHECKPOINT_TTL_SECONDS
+    )
+    
+    # Plan lists, ETag watermarks and per-plan task lookups
+    await get_collection("plans").create_index([("user_id", 1), ("is_active", 1)])
+    await get_collection("tasks").create_index("plan_id")
+    
+    # User-wide task lists and open-task lookups, served from the denormalized user_id
+    await get_collection("tasks").create_index([("user_id", 1), ("status", 1), ("target_date", 1)])
+    
+    # Overdue sweeps range-scan open tasks by due date; flagged tasks are few, so their index is sparse
+    await get_collection("tasks").create_index([("status", 1), ("target_date", 1)])
+    await get_collection("tasks").create_index("due_state", sparse=True)
+    
+    # Archival sweeps by age, and history reads from the archive
+    await get_collection("progress_logs").create_index("created_at")
+    await get_collection("progress_logs").create_index("task_id")
+    await get_collection("plans_archive").create_index("user_id")
+    await get_collection("tasks_archive").create_index("plan_id")
+    await get_collection("tasks_archive").create_index("archived_at")
+    
+    # Plan library candidates: one multikey entry per LSH band
+    await get_collection("plan_library").create_index([("plan_type", 1), ("bands", 1)])
@@ -0,0 +1,40 @@
+import os
+import socket
+import uuid
+from datetime import datetime, timedelta
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from db.connection import get_collection
+
+# Identifies this process as a lease holder
+HOLDER_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+class Lease:
+    """A named lease in the leases collection, held by at most one process until it expires"""
+    
+    def __init__(self, name: str, ttl_seconds: float):
+        self.name = name
+        self.ttl = timedelta(seconds=ttl_seconds)
+        self.collection = get_collection("leases")
+    
+    async def acquire(self) -> bool:
+        """Take the lease if it is free or expired, or extend it if this process already holds it"""
+        
+        now = datetime.utcnow()
+        try:
+            lease = await self.collection.find_one_and_update(
+                {"_id": self.name, "$or": [{"holder": HOLDER_ID}, {"expires_at": {"$lt": now}}]},
+                {"$set": {"holder": HOLDER_ID, "expires_at": now + self.ttl, "renewed_at": now}},
+                upsert=True, return_document=ReturnDocument.AFTER
+            )
+        except DuplicateKeyError:
+            # Another process holds an unexpired lease, so the filter missed and the upsert collided
+            return False
+        return lease is not None and lease["holder"] == HOLDER_ID
+    
+    async def release(self) -> None:
+        """Give the lease up early so another process need not wait for it to expire"""
+        
+        await self.collection.update_one(
+            {"_id": self.name, "holder": HOLDER_ID}, {"$set": {"expires_at": datetime.utcnow()}}
+        )
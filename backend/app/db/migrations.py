@@ -0,0 +1,117 @@
+import os
+import asyncio
+from datetime import datetime
+from typing import Any, Dict, List, Set
+from bson import ObjectId
+from pymongo import UpdateOne
+from db.connection import get_collection
+from utils.log import get_logger
+
+logger = get_logger(__name__)
+
+MIGRATIONS_ON_STARTUP = os.getenv("MIGRATIONS_ON_STARTUP", "true").lower() == "true"
+MIGRATION_BATCH_SIZE = int(os.getenv("MIGRATION_BATCH_SIZE", "500"))
+
+# Tasks carry their owner's user_id and an ObjectId plan_id instead of a stringified one
+TASK_OWNER_MIGRATION = "tasks_user_id_typed_plan_id"
+
+_completed: Set[str] = set()
+
+def migration_complete(name: str) -> bool:
+    """Whether this process has seen the migration finish; stays False until checked"""
+    return name in _completed
+
+def plan_id_filter(plan_id: Any) -> Any:
+    """Match a plan's tasks whether plan_id is stored typed or, before the backfill, as a string"""
+    
+    if migration_complete(TASK_OWNER_MIGRATION):
+        return ObjectId(str(plan_id))
+    return {"$in": [ObjectId(str(plan_id)), str(plan_id)]}
+
+def plan_ids_filter(plan_ids: List[Any]) -> Dict[str, Any]:
+    typed = [ObjectId(str(plan_id)) for plan_id in plan_ids]
+    if migration_complete(TASK_OWNER_MIGRATION):
+        return {"$in": typed}
+    return {"$in": typed + [str(plan_id) for plan_id in plan_ids]}
+
+async def load_completed_migrations() -> None:
+    """Remember which migrations have already finished, e.g. on another worker"""
+    
+    async for migration in get_collection("migrations").find({"completed_at": {"$ne": None}}, {"_id": 1}):
+        _completed.add(migration["_id"])
+
+async def _mark_complete(name: str, stats: Dict[str, int]) -> None:
+    await get_collection("migrations").update_one(
+        {"_id": name}, {"$set": {"completed_at": datetime.utcnow(), "stats": stats}}, upsert=True
+    )
+    _completed.add(name)
+
+async def _backfill_task_owners(collection_name: str) -> int:
+    """Type plan_id and copy the plan's user_id onto tasks, one batch at a time"""
+    
+    tasks_collection = get_collection(collection_name)
+    pending = {"$or": [{"user_id": {"$exists": False}}, {"plan_id": {"$type": "string"}}]}
+    converted = 0
+    last_id = None
+    
+    while True:
+        # Walk forward by _id so tasks that cannot be converted are not selected again
+        query = {**pending, "_id": {"$gt": last_id}} if last_id else pending
+        tasks = await tasks_collection.find(query, {"plan_id": 1}).sort("_id", 1).limit(MIGRATION_BATCH_SIZE).to_list(None)
+        if not tasks:
+            break
+        last_id = tasks[-1]["_id"]
+        
+        plan_ids = {ObjectId(str(task["plan_id"])) for task in tasks if ObjectId.is_valid(str(task["plan_id"]))}
+        owners = {}
+        for plans_name in ("plans", "plans_archive"):
+            async for plan in get_collection(plans_name).find({"_id": {"$in": list(plan_ids)}}, {"user_id": 1}):
+                owners[plan["_id"]] = plan["user_id"]
+        
+        updates = []
+        for task in tasks:
+            plan_id = ObjectId(str(task["plan_id"])) if ObjectId.is_valid(str(task["plan_id"])) else task["plan_id"]
+            # Orphaned tasks get an explicit null owner
+            fields = {"plan_id": plan_id, "user_id": owners.get(plan_id)}
+            # Only replace the string plan_id it was read with, in case of a concurrent write
+            updates.append(UpdateOne({"_id": task["_id"], "plan_id": task["plan_id"]}, {"$set": fields}))
+        
+        await tasks_collection.bulk_write(updates, ordered=False)
+        converted += len(updates)
+        logger.info("Backfilled task owners", extra={"collection": collection_name, "converted": converted})
+    
+    return converted
+
+async def migrate_task_owners() -> Dict[str, int]:
+    """Online backfill of user_id and typed plan_id on hot and archived tasks"""
+    
+    stats = {name: await _backfill_task_owners(name) for name in ("tasks", "tasks_archive")}
+    await _mark_complete(TASK_OWNER_MIGRATION, stats)
+    return stats
+
+async def run_migrations() -> None:
+    """Run pending data migrations in the background; safe to repeat and to run on several workers"""
+    
+    try:
+        await load_completed_migrations()
+        if not migration_complete(TASK_OWNER_MIGRATION):
+            stats = await migrate_task_owners()
+            logger.info("Task owner migration finished", extra={"stats": stats})
+    except Exception:
+        logger.exception("Migrations failed")
+
+if __name__ == "__main__":
+    # python -m db.migrations, from backend/app
+    from db.connection import init_db, close_db
+    from utils.log import setup_logging, shutdown_logging
+    
+    async def main() -> None:
+        setup_logging()
+        await init_db()
+        try:
+            print(await migrate_task_owners())
+        finally:
+            await close_db()
+            shutdown_logging()
+    
+    asyncio.run(main())
@@ -0,0 +1,62 @@
+import threading
+from pymongo import monitoring
+
+from utils import metrics
+
+class PoolMetricsListener(monitoring.ConnectionPoolListener):
+    """Exports connection pool usage so pool starvation is visible in /metrics"""
+    
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.waiting = 0
+        self.checked_out = 0
+        self.open_connections = 0
+    
+    def _update(self, waiting: int = 0, checked_out: int = 0, open_connections: int = 0) -> None:
+        with self.lock:
+            self.waiting += waiting
+            self.checked_out += checked_out
+            self.open_connections += open_connections
+            metrics.set_gauge("mongo.pool.wait_queue", self.waiting)
+            metrics.set_gauge("mongo.pool.checked_out", self.checked_out)
+            metrics.set_gauge("mongo.pool.open_connections", self.open_connections)
+    
+    def connection_check_out_started(self, event):
+        self._update(waiting=1)
+    
+    def connection_checked_out(self, event):
+        self._update(waiting=-1, checked_out=1)
+        duration = getattr(event, "duration", None)  # pymongo >= 4.7
+        if duration is not None:
+            metrics.incr("mongo.pool.wait_seconds_total", duration)
+    
+    def connection_check_out_failed(self, event):
+        self._update(waiting=-1)
+        if event.reason == monitoring.ConnectionCheckOutFailedReason.TIMEOUT:
+            metrics.incr("mongo.pool.wait_timeouts")
+        else:
+            metrics.incr("mongo.pool.check_out_failures")
+    
+    def connection_checked_in(self, event):
+        self._update(checked_out=-1)
+    
+    def connection_created(self, event):
+        self._update(open_connections=1)
+    
+    def connection_closed(self, event):
+        self._update(open_connections=-1)
+    
+    def pool_created(self, event):
+        pass
+    
+    def pool_ready(self, event):
+        pass
+    
+    def pool_cleared(self, event):
+        metrics.incr("mongo.pool.cleared")
+    
+    def pool_closed(self, event):
+        pass
+    
+    def connection_ready(self, event):
+        pass
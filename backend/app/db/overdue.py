@@ -0,0 +1,176 @@
+import os
+import asyncio
+from datetime import datetime, timedelta
+from typing import Dict, Any, List, Optional, Set
+from pymongo import ReplaceOne
+from db.connection import get_collection
+from db.lease import Lease
+from db.versioning import touch_plan
+from db.migrations import migration_complete, load_completed_migrations, TASK_OWNER_MIGRATION
+from utils.log import get_logger
+from utils import metrics
+
+logger = get_logger(__name__)
+
+OVERDUE_SWEEP_ENABLED = os.getenv("OVERDUE_SWEEP_ENABLED", "true").lower() == "true"
+OVERDUE_SWEEP_INTERVAL_SECONDS = int(os.getenv("OVERDUE_SWEEP_INTERVAL_SECONDS", "300"))
+OVERDUE_SWEEP_BATCH_SIZE = int(os.getenv("OVERDUE_SWEEP_BATCH_SIZE", "500"))
+# Open tasks due within this many days are at risk
+AT_RISK_DAYS = float(os.getenv("AT_RISK_DAYS", "2"))
+# How far ahead the per-user summary lists upcoming tasks
+UPCOMING_DAYS = float(os.getenv("UPCOMING_DAYS", "7"))
+SUMMARY_MAX_TASKS = int(os.getenv("SUMMARY_MAX_TASKS", "20"))
+
+OPEN_STATUSES = ["pending", "in_progress"]
+OVERDUE = "overdue"
+AT_RISK = "at_risk"
+
+async def _flag(query: Dict[str, Any], due_state: str) -> int:
+    """Set due_state on the tasks matching query, one index range batch at a time"""
+    
+    tasks_collection = get_collection("tasks")
+    flagged = 0
+    
+    while True:
+        tasks = await tasks_collection.find(
+            {**query, "due_state": {"$ne": due_state}}, {"plan_id": 1}
+        ).limit(OVERDUE_SWEEP_BATCH_SIZE).to_list(None)
+        if not tasks:
+            break
+        
+        # Re-check the query so a task completed since the read is left alone. due_state is derived, so
+        # the task version (the If-Match precondition) stays; touch_plan below still advances the list ETag
+        result = await tasks_collection.update_many(
+            {**query, "_id": {"$in": [task["_id"] for task in tasks]}},
+            {"$set": {"due_state": due_state}}
+        )
+        flagged += result.modified_count
+        for plan_id in {str(task["plan_id"]) for task in tasks}:
+            await touch_plan(plan_id)
+        if len(tasks) < OVERDUE_SWEEP_BATCH_SIZE:
+            break
+    
+    return flagged
+
+async def _clear_stale(at_risk_before: datetime) -> int:
+    """Unflag tasks that were finished or rescheduled after being flagged"""
+    
+    tasks_collection = get_collection("tasks")
+    stale = {
+        "due_state": {"$in": [OVERDUE, AT_RISK]},
+        "$or": [{"status": {"$nin": OPEN_STATUSES}}, {"target_date": {"$gte": at_risk_before}}]
+    }
+    cleared = 0
+    
+    while True:
+        tasks = await tasks_collection.find(stale, {"plan_id": 1}).limit(OVERDUE_SWEEP_BATCH_SIZE).to_list(None)
+        if not tasks:
+            break
+        
+        result = await tasks_collection.update_many(
+            {**stale, "_id": {"$in": [task["_id"] for task in tasks]}},
+            {"$unset": {"due_state": ""}}
+        )
+        cleared += result.modified_count
+        for plan_id in {str(task["plan_id"]) for task in tasks}:
+            await touch_plan(plan_id)
+        if len(tasks) < OVERDUE_SWEEP_BATCH_SIZE:
+            break
+    
+    return cleared
+
+async def flag_due_tasks(now: Optional[datetime] = None) -> Dict[str, int]:
+    """Mark open tasks past their target date as overdue and those due soon as at risk"""
+    
+    now = now or datetime.utcnow()
+    at_risk_before = now + timedelta(days=AT_RISK_DAYS)
+    
+    # Both are range scans on the (status, target_date) index
+    counts = {
+        OVERDUE: await _flag({"status": {"$in": OPEN_STATUSES}, "target_date": {"$lt": now}}, OVERDUE),
+        AT_RISK: await _flag(
+            {"status": {"$in": OPEN_STATUSES}, "target_date": {"$gte": now, "$lt": at_risk_before}}, AT_RISK
+        ),
+        "cleared": await _clear_stale(at_risk_before)
+    }
+    return counts
+
+def _brief(field: str) -> Dict[str, Any]:
+    listed = {"$filter": {"input": f"${field}", "cond": {"$ne": ["$$this", None]}}}
+    return {"$slice": [listed, SUMMARY_MAX_TASKS]}
+
+async def write_summaries(now: Optional[datetime] = None) -> int:
+    """Rebuild the per-user upcoming and overdue summaries read by the dashboard"""
+    
+    now = now or datetime.utcnow()
+    # Stored dates have millisecond precision; truncate so the stale-summary cleanup spares this run
+    now = now.replace(microsecond=now.microsecond // 1000 * 1000)
+    upcoming_before = now + timedelta(days=UPCOMING_DAYS)
+    task = {"id": {"$toString": "$_id"}, "plan_id": {"$toString": "$plan_id"}, "title": "$title",
+            "target_date": "$target_date", "status": "$status"}
+    is_overdue = {"$lt": ["$target_date", now]}
+    
+    pipeline = [
+        {"$match": {"status": {"$in": OPEN_STATUSES}, "target_date": {"$lt": upcoming_before}, "user_id": {"$ne": None}}},
+        {"$sort": {"target_date": 1}},
+        {"$group": {
+            "_id": "$user_id",
+            "overdue_count": {"$sum": {"$cond": [is_overdue, 1, 0]}},
+            "upcoming_count": {"$sum": {"$cond": [is_overdue, 0, 1]}},
+            "overdue": {"$push": {"$cond": [is_overdue, task, None]}},
+            "upcoming": {"$push": {"$cond": [is_overdue, None, task]}}
+        }},
+        {"$project": {"overdue_count": 1, "upcoming_count": 1, "overdue": _brief("overdue"), "upcoming": _brief("upcoming")}}
+    ]
+    
+    summaries_collection = get_collection("user_task_summaries")
+    batch: List[ReplaceOne] = []
+    users: Set[str] = set()
+    async for summary in get_collection("tasks").aggregate(pipeline, allowDiskUse=True):
+        users.add(summary["_id"])
+        batch.append(ReplaceOne({"_id": summary["_id"]}, {**summary, "generated_at": now}, upsert=True))
+        if len(batch) >= OVERDUE_SWEEP_BATCH_SIZE:
+            await summaries_collection.bulk_write(batch, ordered=False)
+            batch = []
+    if batch:
+        await summaries_collection.bulk_write(batch, ordered=False)
+    
+    # Users with nothing due any more
+    await summaries_collection.delete_many({"generated_at": {"$lt": now}})
+    return len(users)
+
+async def run_overdue_sweep(now: Optional[datetime] = None) -> Dict[str, Any]:
+    """Run one sweep: flag due tasks, then rebuild the per-user summaries"""
+    
+    now = now or datetime.utcnow()
+    flagged = await flag_due_tasks(now)
+    if not migration_complete(TASK_OWNER_MIGRATION):
+        await load_completed_migrations()
+    # Tasks without an owner are not in the summaries until the owner backfill has finished
+    users = await write_summaries(now) if migration_complete(TASK_OWNER_MIGRATION) else 0
+    
+    for name, count in flagged.items():
+        metrics.incr(f"overdue_sweep.{name}", count)
+    metrics.set_gauge("overdue_sweep.users", users)
+    logger.info("Overdue sweep finished", extra={"flagged": flagged, "users": users})
+    return {"flagged": flagged, "users": users}
+
+async def run_overdue_sweeper() -> None:
+    """Background loop that sweeps on the replica holding the sweeper lease"""
+    
+    # The lease outlives a missed pass, so leadership only moves when the holder stops renewing it
+    lease = Lease("overdue_sweeper", ttl_seconds=OVERDUE_SWEEP_INTERVAL_SECONDS * 3)
+    try:
+        while True:
+            try:
+                if await lease.acquire():
+                    await run_overdue_sweep()
+            except Exception:
+                logger.exception("Overdue sweep failed")
+            await asyncio.sleep(OVERDUE_SWEEP_INTERVAL_SECONDS)
+    finally:
+        # Hand over on shutdown instead of leaving the other replicas to wait out the lease
+        try:
+            await lease.release()
+        except Exception as e:
+            logger.warning("Lease release failed: %s", e)
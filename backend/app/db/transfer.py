@@ -0,0 +1,211 @@
+"""Streaming export and import of a user's plans, tasks and progress logs.
+
+The export is NDJSON: a header line followed by one {"type", "doc"} line per
+document, plans first, then tasks, then progress logs, with documents in
+MongoDB extended JSON. Memory stays constant in the number of documents,
+apart from the plan and task id maps that import keeps for remapping.
+
+CLI, from backend/app:
+    python -m db.transfer export USER_ID user.ndjson.gz
+    python -m db.transfer import USER_ID user.ndjson.gz
+"""
+import os
+import sys
+import zlib
+import asyncio
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, List, Optional
+from bson import ObjectId, json_util
+from bson.json_util import RELAXED_JSON_OPTIONS
+from db.connection import get_collection
+from db.migrations import plan_ids_filter
+from utils.cache import response_cache
+from utils.log import get_logger
+
+logger = get_logger(__name__)
+
+EXPORT_FORMAT = "agentic-planner-export"
+EXPORT_VERSION = 1
+TRANSFER_BATCH_SIZE = int(os.getenv("TRANSFER_BATCH_SIZE", "1000"))
+
+PARENTS = {"tasks": ["plans"], "progress_logs": ["tasks"]}
+
+def _line(record_type: str, document: Dict[str, Any]) -> str:
+    return json_util.dumps({"type": record_type, "doc": document}, json_options=RELAXED_JSON_OPTIONS) + "\n"
+
+async def _cursor_lines(collection_name: str, record_type: str, query: Dict[str, Any]) -> AsyncIterator[bytes]:
+    """Stream one collection in cursor batches, one encoded chunk per batch"""
+    
+    cursor = get_collection(collection_name).find(query).batch_size(TRANSFER_BATCH_SIZE)
+    chunk: List[str] = []
+    async for document in cursor:
+        chunk.append(_line(record_type, document))
+        if len(chunk) >= TRANSFER_BATCH_SIZE:
+            yield "".join(chunk).encode()
+            chunk = []
+    if chunk:
+        yield "".join(chunk).encode()
+
+async def export_user_data(user_id: str) -> AsyncIterator[bytes]:
+    """Stream a user's plans, tasks and progress logs, hot and archived, as NDJSON"""
+    
+    header = {"type": "header", "format": EXPORT_FORMAT, "version": EXPORT_VERSION,
+              "user_id": user_id, "exported_at": datetime.utcnow().isoformat()}
+    yield (json_util.dumps(header) + "\n").encode()
+    
+    plan_ids = []
+    for collection_name in ("plans", "plans_archive"):
+        async for plan in get_collection(collection_name).find({"user_id": user_id}, {"_id": 1}):
+            plan_ids.append(plan["_id"])
+    
+    for collection_name in ("plans", "plans_archive"):
+        async for chunk in _cursor_lines(collection_name, "plan", {"user_id": user_id}):
+            yield chunk
+    if plan_ids:
+        for collection_name in ("tasks", "tasks_archive"):
+            async for chunk in _cursor_lines(collection_name, "task", {"plan_id": plan_ids_filter(plan_ids)}):
+                yield chunk
+    for collection_name in ("progress_logs", "progress_logs_archive"):
+        async for chunk in _cursor_lines(collection_name, "progress_log", {"user_id": user_id}):
+            yield chunk
+
+async def gzip_stream(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    """Compress a byte stream into gzip format on the fly"""
+    
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    async for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+async def _decoded_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    """Split a plain or gzip byte stream into lines, detecting gzip from its magic bytes"""
+    
+    decompressor = None
+    buffer = b""
+    first = True
+    async for chunk in chunks:
+        if first and chunk:
+            first = False
+            if chunk[:2] == b"\x1f\x8b":
+                decompressor = zlib.decompressobj(47)
+        data = decompressor.decompress(chunk) if decompressor else chunk
+        buffer += data
+        lines = buffer.split(b"\n")
+        buffer = lines.pop()
+        for line in lines:
+            if line.strip():
+                yield line
+    if buffer.strip():
+        yield buffer
+
+class _Importer:
+    """Remaps ids and writes documents with batched insert_many"""
+    
+    def __init__(self, user_id: str):
+        self.user_id = user_id
+        self.plan_ids: Dict[Any, ObjectId] = {}
+        self.task_ids: Dict[str, str] = {}
+        self.pending: Dict[str, List[Dict[str, Any]]] = {"plans": [], "tasks": [], "progress_logs": []}
+        self.stats = {"plans": 0, "tasks": 0, "progress_logs": 0, "skipped": 0}
+    
+    async def add(self, record_type: str, document: Dict[str, Any]) -> None:
+        old_id = document.pop("_id", None)
+        document["_id"] = ObjectId()
+        # Imported documents are hot again
+        document.pop("archived_at", None)
+        
+        if record_type == "plan":
+            self.plan_ids[str(old_id)] = document["_id"]
+            document["user_id"] = self.user_id
+            await self._queue("plans", document)
+        elif record_type == "task":
+            plan_id = self.plan_ids.get(str(document.get("plan_id")))
+            if plan_id is None:
+                self.stats["skipped"] += 1
+                return
+            self.task_ids[str(old_id)] = str(document["_id"])
+            document.update({"plan_id": plan_id, "user_id": self.user_id})
+            await self._queue("tasks", document)
+        elif record_type == "progress_log":
+            task_id = self.task_ids.get(str(document.get("task_id")))
+            if task_id is None:
+                self.stats["skipped"] += 1
+                return
+            document.update({"task_id": task_id, "user_id": self.user_id})
+            await self._queue("progress_logs", document)
+        else:
+            self.stats["skipped"] += 1
+    
+    async def _queue(self, collection_name: str, document: Dict[str, Any]) -> None:
+        self.pending[collection_name].append(document)
+        if len(self.pending[collection_name]) >= TRANSFER_BATCH_SIZE:
+            await self._flush(collection_name)
+    
+    async def _flush(self, collection_name: str) -> None:
+        # Parents are written before children so no task is visible without its plan
+        for parent in PARENTS.get(collection_name, []):
+            await self._flush(parent)
+        documents = self.pending[collection_name]
+        if documents:
+            await get_collection(collection_name).insert_many(documents, ordered=False)
+            self.stats[collection_name] += len(documents)
+            self.pending[collection_name] = []
+    
+    async def finish(self) -> Dict[str, int]:
+        for collection_name in self.pending:
+            await self._flush(collection_name)
+        return self.stats
+
+async def import_user_data(user_id: str, chunks: AsyncIterator[bytes]) -> Dict[str, int]:
+    """Import an export stream for a user, giving every document a new id"""
+    
+    importer = _Importer(user_id)
+    header_seen = False
+    async for line in _decoded_lines(chunks):
+        record = json_util.loads(line)
+        if not header_seen:
+            if record.get("type") != "header" or record.get("format") != EXPORT_FORMAT:
+                raise ValueError("Not an agentic planner export")
+            if record.get("version", 0) > EXPORT_VERSION:
+                raise ValueError(f"Unsupported export version {record.get('version')}")
+            header_seen = True
+            continue
+        await importer.add(record.get("type"), record.get("doc") or {})
+    
+    stats = await importer.finish()
+    await response_cache.invalidate(f"user:{user_id}")
+    logger.info("User data imported", extra={"user_id": user_id, "stats": stats})
+    return stats
+
+async def file_chunks(path: str, size: int = 1 << 16) -> AsyncIterator[bytes]:
+    with open(path, "rb") as file:
+        while chunk := file.read(size):
+            yield chunk
+
+async def _main(argv: List[str]) -> Optional[Dict[str, int]]:
+    from db.connection import init_db, close_db
+    
+    if len(argv) != 3 or argv[0] not in ("export", "import"):
+        sys.exit(__doc__)
+    command, user_id, path = argv
+    
+    await init_db()
+    try:
+        if command == "export":
+            stream = export_user_data(user_id)
+            if path.endswith(".gz"):
+                stream = gzip_stream(stream)
+            with open(path, "wb") as file:
+                async for chunk in stream:
+                    file.write(chunk)
+            return None
+        return await import_user_data(user_id, file_chunks(path))
+    finally:
+        await close_db()
+
+if __name__ == "__main__":
+    result = asyncio.run(_main(sys.argv[1:]))
+    if result is not None:
+        print(result)
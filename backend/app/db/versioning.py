@@ -0,0 +1,96 @@
+from typing import Dict, Any, List, Optional, Union
+from datetime import datetime
+from bson import ObjectId
+from pymongo import ReturnDocument
+from motor.motor_asyncio import AsyncIOMotorCollection
+from db.connection import get_collection
+from utils.cache import response_cache
+
+class DocumentNotFoundError(LookupError):
+    pass
+
+class VersionConflictError(Exception):
+    """The document changed since the version the client based its update on"""
+    pass
+
+def bump_version(update: Dict[str, Any]) -> Dict[str, Any]:
+    """Add the version increment and updated_at watermark to a task or plan update"""
+    
+    return {
+        **update,
+        "$inc": {**update.get("$inc", {}), "version": 1},
+        "$set": {**update.get("$set", {}), "updated_at": datetime.utcnow()}
+    }
+
+def version_filter(version: int) -> Any:
+    """Query value matching a document at this version; documents written before versioning count as version 0"""
+    return {"$in": [0, None]} if version == 0 else version
+
+def version_stage() -> Dict[str, Any]:
+    """bump_version for update pipelines, which cannot use $inc"""
+    
+    return {"$set": {
+        "version": {"$add": [{"$ifNull": ["$version", 0]}, 1]},
+        "updated_at": datetime.utcnow()
+    }}
+
+def progress_update(delta: Optional[float] = None, value: Optional[float] = None,
+                    status: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Update pipeline applying progress on the server: an optional absolute value plus a delta
+    added to the stored current_value, with the status derived from the result in the same write"""
+    
+    base = value if value is not None else {"$ifNull": ["$current_value", 0]}
+    reached = {"$and": [
+        {"$ne": [{"$ifNull": ["$target_value", None]}, None]},
+        {"$gte": ["$current_value", "$target_value"]}
+    ]}
+    
+    if status in ("completed", "skipped"):
+        # An explicit finish (or skip) stands regardless of the value
+        derived_status: Any = status
+    elif status:
+        derived_status = {"$cond": [reached, "completed", status]}
+    else:
+        derived_status = {"$cond": [
+            {"$eq": ["$status", "skipped"]},
+            "skipped",
+            {"$cond": [reached, "completed", {"$cond": [{"$gt": ["$current_value", 0]}, "in_progress", "pending"]}]}
+        ]}
+    
+    return [
+        {"$set": {"current_value": {"$add": [base, delta or 0]}}},
+        {"$set": {"status": derived_status}}
+    ]
+
+async def touch_plan(plan_id: str) -> None:
+    """Advance a plan's version and drop its cached reads after a write to the plan or any of its tasks"""
+    
+    plan = await get_collection("plans").find_one_and_update(
+        {"_id": ObjectId(plan_id)}, bump_version({}), projection={"user_id": 1}
+    )
+    
+    tags = [f"plan:{plan_id}"]
+    if plan:
+        tags.append(f"user:{plan['user_id']}")
+    await response_cache.invalidate(*tags)
+
+async def update_versioned(collection: AsyncIOMotorCollection, document_id: ObjectId,
+                           update: Union[Dict[str, Any], List[Dict[str, Any]]],
+                           expected_version: Optional[int] = None,
+                           projection: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Apply an update in one round trip and return the document after it; with
+    expected_version the write only happens if nobody changed the document since"""
+    
+    query: Dict[str, Any] = {"_id": document_id}
+    if expected_version is not None:
+        query["version"] = version_filter(expected_version)
+    
+    versioned = update + [version_stage()] if isinstance(update, list) else bump_version(update)
+    document = await collection.find_one_and_update(
+        query, versioned, projection=projection, return_document=ReturnDocument.AFTER
+    )
+    if document is None:
+        if expected_version is not None and await collection.count_documents({"_id": document_id}, limit=1):
+            raise VersionConflictError(f"Document {document_id} is no longer at version {expected_version}")
+        raise DocumentNotFoundError(f"Document {document_id} not found")
+    return document
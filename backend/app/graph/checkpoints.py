@@ -0,0 +1,30 @@
+from typing import Dict, Any, Optional
+from datetime import datetime
+from db.connection import get_collection
+
+class WorkflowCheckpointer:
+    """Persists PlanningState after each successful node, keyed by plan id"""
+    
+    def __init__(self):
+        self.collection = get_collection("workflow_checkpoints")
+    
+    async def save(self, plan_id: str, node: Optional[str], state: Dict[str, Any]) -> None:
+        """Store the state produced by a node (None for the initial state)"""
+        
+        await self.collection.update_one(
+            {"_id": plan_id},
+            {"$set": {
+                "last_node": node,
+                "state": {key: value for key, value in state.items() if key != "resume_from"},
+                "updated_at": datetime.utcnow()
+            }},
+            upsert=True
+        )
+    
+    async def load(self, plan_id: str) -> Optional[Dict[str, Any]]:
+        """Get the latest checkpoint of a plan"""
+        return await self.collection.find_one({"_id": plan_id})
+    
+    async def clear(self, plan_id: str) -> None:
+        """Remove the checkpoint once the workflow has completed"""
+        await self.collection.delete_one({"_id": plan_id})
@@ -0,0 +1,68 @@
+import os
+import asyncio
+from typing import Dict, Any
+from bson import ObjectId
+from db.connection import get_collection
+from graph.checkpoints import WorkflowCheckpointer
+from utils.llm import llm_available
+from utils.ai_stack import planning_workflow
+from utils.log import get_logger
+
+logger = get_logger(__name__)
+
+PLAN_QUEUE_POLL_SECONDS = float(os.getenv("PLAN_QUEUE_POLL_SECONDS", "15"))
+PLAN_QUEUE_BATCH_SIZE = int(os.getenv("PLAN_QUEUE_BATCH_SIZE", "5"))
+
+async def set_workflow_status(plan_id: str, workflow_status: str) -> None:
+    """Record the planning workflow status on the plan document"""
+    
+    await get_collection("plans").update_one(
+        {"_id": ObjectId(plan_id)},
+        {"$set": {"workflow_status": workflow_status}}
+    )
+
+async def enqueue_plan(plan_id: str, initial_state: Dict[str, Any]) -> None:
+    """Defer planning until the AI service is available again"""
+    
+    await WorkflowCheckpointer().save(plan_id, None, initial_state)
+    await set_workflow_status(plan_id, "queued")
+
+async def drain_queued_plans() -> int:
+    """Run queued plan workflows while the AI service admits calls"""
+    
+    plans_collection = get_collection("plans")
+    drained = 0
+    
+    while drained < PLAN_QUEUE_BATCH_SIZE and llm_available():
+        # Claim the oldest queued plan so only one worker runs it
+        plan = await plans_collection.find_one_and_update(
+            {"workflow_status": "queued"},
+            {"$set": {"workflow_status": "planning"}},
+            sort=[("created_at", 1)]
+        )
+        if not plan:
+            break
+        
+        plan_id = str(plan["_id"])
+        result = await planning_workflow().resume_planning(plan_id)
+        
+        if result.get("status") != "error":
+            await set_workflow_status(plan_id, "completed")
+        elif not llm_available():
+            await set_workflow_status(plan_id, "queued")
+            break
+        else:
+            await set_workflow_status(plan_id, "failed")
+        drained += 1
+    
+    return drained
+
+async def run_plan_queue() -> None:
+    """Background loop that drains queued plans"""
+    
+    while True:
+        await asyncio.sleep(PLAN_QUEUE_POLL_SECONDS)
+        try:
+            await drain_queued_plans()
+        except Exception:
+            logger.exception("Plan queue drain failed")
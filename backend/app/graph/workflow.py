@@ -1,8 +1,19 @@
+import asyncio
 from langgraph.graph import StateGraph, END
-from typing import Dict, Any, TypedDict
+from typing import Dict, Any, TypedDict, Callable, Optional
 from agents.goal_parser import GoalParserAgent
 from agents.planner import PlannerAgent
-from agents.tracker import TrackerAgent
+from agents.tracker import TrackerAgent, StreamingTaskWriter
+from agents.template_planner import TemplatePlanner
+from agents.plan_library import PlanLibrary
+from agents.milestones import save_milestones
+from graph.checkpoints import WorkflowCheckpointer
+from db.migrations import plan_id_filter
+from utils.log import get_logger, log_payload
+
+logger = get_logger(__name__)
+
+NODES = ["parse_goal", "match_template", "match_library", "create_plan", "save_tasks"]
 
 class PlanningState(TypedDict):
     goal_description: str
@@ -15,6 +26,12 @@ class PlanningState(TypedDict):
     planned_tasks: list
     saved_tasks: list
     tasks_count: int
+    tasks_streamed: bool
+    milestones: list
+    template_id: str
+    library_entry_id: str
+    plan_summary: str
+    resume_from: str
     status: str
     error: str
 
@@ -22,7 +39,12 @@ class PlanningWorkflow:
     def __init__(self):
         self.goal_parser = GoalParserAgent()
         self.planner = PlannerAgent()
+        self.template_planner = TemplatePlanner()
+        self.plan_library = PlanLibrary()
         self.tracker = TrackerAgent()
+        self.checkpointer = WorkflowCheckpointer()
+        # Plan inserts still in flight, by plan id; task writes wait for them
+        self.plan_inserts: Dict[str, asyncio.Task] = {}
         self.workflow = self._build_workflow()
     
     def _build_workflow(self) -> StateGraph:
@@ -31,31 +53,187 @@ class PlanningWorkflow:
         workflow = StateGraph(PlanningState)
         
         # Add nodes
-        workflow.add_node("parse_goal", self.goal_parser.parse_goal)
-        workflow.add_node("create_plan", self.planner.create_plan)
-        workflow.add_node("save_tasks", self.tracker.save_tasks)
+        workflow.add_node("parse_goal", self._checkpointed("parse_goal", self.goal_parser.parse_goal))
+        workflow.add_node("match_template", self._checkpointed("match_template", self.template_planner.plan_from_template))
+        workflow.add_node("match_library", self._checkpointed("match_library", self.plan_library.plan_from_library))
+        workflow.add_node("create_plan", self._checkpointed("create_plan", self._create_plan))
+        workflow.add_node("save_tasks", self._checkpointed("save_tasks", self._save_tasks))
         
-        # Add edges
-        workflow.add_edge("parse_goal", "create_plan")
-        workflow.add_edge("create_plan", "save_tasks")
+        # Add edges; a failed node ends the run so it can be resumed from its checkpoint
+        workflow.add_conditional_edges(
+            "parse_goal",
+            self._continue_unless_error("match_template"),
+            {"match_template": "match_template", END: END}
+        )
+        workflow.add_conditional_edges(
+            "match_template",
+            self._route_after_template,
+            {"match_library": "match_library", "save_tasks": "save_tasks", END: END}
+        )
+        workflow.add_conditional_edges(
+            "match_library",
+            self._route_after_library,
+            {"create_plan": "create_plan", "save_tasks": "save_tasks", END: END}
+        )
+        workflow.add_conditional_edges(
+            "create_plan",
+            self._continue_unless_error("save_tasks"),
+            {"save_tasks": "save_tasks", END: END}
+        )
         workflow.add_edge("save_tasks", END)
         
-        # Set entry point
-        workflow.set_entry_point("parse_goal")
+        # Set entry point; resumed runs start at the node after the last checkpoint
+        workflow.set_conditional_entry_point(
+            self._route_entry,
+            {node: node for node in NODES}
+        )
         
         return workflow.compile()
     
-    async def execute_planning(self, initial_state: Dict[str, Any]) -> Dict[str, Any]:
-        """Execute the complete planning workflow"""
+    def _checkpointed(self, node: str, step: Callable) -> Callable:
+        """Wrap a node so its resulting state is persisted when it succeeds"""
+        
+        async def run(state: Dict[str, Any]) -> Dict[str, Any]:
+            state = await step(state)
+            if state.get("status") != "error":
+                try:
+                    await self.checkpointer.save(state["plan_id"], node, state)
+                except Exception as e:
+                    logger.warning("Checkpoint save failed: %s", e, extra={"plan_id": state["plan_id"], "node": node})
+            return state
+        
+        return run
+    
+    async def _plan_ready(self, plan_id: str) -> None:
+        insert = self.plan_inserts.get(plan_id)
+        if insert is not None:
+            # Shielded so one waiter being cancelled does not cancel the insert for the others
+            await asyncio.shield(insert)
+    
+    async def _create_plan(self, state: Dict[str, Any]) -> Dict[str, Any]:
+        """Plan the tasks, writing them in batches while the planner response streams in"""
+        
+        writer = StreamingTaskWriter(self.tracker, state, lambda: self._plan_ready(state["plan_id"]))
+        state = await self.planner.create_plan(state, on_tasks=writer.add)
+        if not writer.used:
+            return state
         
         try:
-            print('aaaa', initial_state)
+            if state.get("status") == "error":
+                raise RuntimeError(state.get("error"))
+            saved_tasks = await writer.finish()
+            state["saved_tasks"] = [task.dict() for task in saved_tasks]
+            state["tasks_count"] = len(saved_tasks)
+            state["tasks_streamed"] = True
+        except Exception as e:
+            # A partly written plan is removed, so a resumed run starts from no tasks
+            await writer.abort()
+            await self.tracker.tasks_collection.delete_many({"plan_id": plan_id_filter(state["plan_id"])})
+            if state.get("status") != "error":
+                state["error"] = f"Task saving failed: {str(e)}"
+                state["status"] = "error"
+        return state
+    
+    async def _save_tasks(self, state: Dict[str, Any]) -> Dict[str, Any]:
+        try:
+            await self._plan_ready(state["plan_id"])
+            if state.get("milestones"):
+                await save_milestones(state)
+        except Exception as e:
+            return {**state, "error": f"Plan saving failed: {str(e)}", "status": "error"}
+        return await self.tracker.save_tasks(state)
+    
+    def _continue_unless_error(self, next_node: str) -> Callable:
+        def route(state: Dict[str, Any]) -> str:
+            return END if state.get("status") == "error" else next_node
+        return route
+    
+    def _route_entry(self, state: Dict[str, Any]) -> str:
+        return state.get("resume_from") or "parse_goal"
+    
+    def _route_after_template(self, state: Dict[str, Any]) -> str:
+        """Skip the planner LLM call when a template already produced the tasks"""
+        if state.get("status") == "error":
+            return END
+        return "save_tasks" if state.get("template_id") else "match_library"
+    
+    def _route_after_library(self, state: Dict[str, Any]) -> str:
+        """Skip the planner LLM call when a stored plan was adapted"""
+        if state.get("status") == "error":
+            return END
+        return "save_tasks" if state.get("library_entry_id") else "create_plan"
+    
+    def _resume_node(self, last_node: Optional[str], state: Dict[str, Any]) -> Optional[str]:
+        """Get the node that follows the last successful one, None when the run had finished"""
+        
+        if last_node is None:
+            return "parse_goal"
+        if last_node == "parse_goal":
+            return "match_template"
+        if last_node == "match_template":
+            return self._route_after_template(state)
+        if last_node == "match_library":
+            return self._route_after_library(state)
+        if last_node == "create_plan":
+            return "save_tasks"
+        return None
+    
+    async def execute_with_parsed_goal(self, initial_state: Dict[str, Any], parsed_goal: Dict[str, Any]) -> Dict[str, Any]:
+        """Run the workflow for a goal that was already parsed, e.g. in a packed batch call"""
+        
+        state = {**initial_state, "parsed_goal": parsed_goal, "status": "goal_parsed"}
+        await self.checkpointer.save(state["plan_id"], "parse_goal", state)
+        return await self.execute_planning({**state, "resume_from": "match_template"})
+    
+    async def execute_planning(self, initial_state: Dict[str, Any],
+                               plan_insert: Optional[asyncio.Task] = None) -> Dict[str, Any]:
+        """Execute the complete planning workflow; plan_insert is the plan document's insert, if still running"""
+        
+        if plan_insert is not None:
+            self.plan_inserts[initial_state["plan_id"]] = plan_insert
+        try:
+            log_payload("workflow", "Planning workflow started", initial_state, plan_id=initial_state["plan_id"])
+            if not initial_state.get("resume_from"):
+                await self.checkpointer.save(initial_state["plan_id"], None, initial_state)
             result = await self.workflow.ainvoke(initial_state)
+            if result.get("status") != "error":
+                await self.checkpointer.clear(initial_state["plan_id"])
+                try:
+                    await self.plan_library.remember(result)
+                except Exception as e:
+                    logger.warning("Storing plan in library failed: %s", e, extra={"plan_id": initial_state["plan_id"]})
             return result
         except Exception as e:
-            print('aaaa', e)
+            logger.exception("Planning workflow failed", extra={"plan_id": initial_state.get("plan_id")})
             return {
                 **initial_state,
                 "error": f"Workflow execution failed: {str(e)}",
                 "status": "error"
             }
+        finally:
+            self.plan_inserts.pop(initial_state["plan_id"], None)
+    
+    async def resume_planning(self, plan_id: str) -> Dict[str, Any]:
+        """Resume a failed workflow from the node after its last checkpoint"""
+        
+        checkpoint = await self.checkpointer.load(plan_id)
+        if not checkpoint:
+            return {"plan_id": plan_id, "error": "No checkpoint found for plan", "status": "error"}
+        
+        state = checkpoint["state"]
+        resume_from = self._resume_node(checkpoint["last_node"], state)
+        if resume_from is None:
+            await self.checkpointer.clear(plan_id)
+            return state
+        
+        # Tasks from an interrupted save are written again from the checkpointed plan
+        if resume_from in ("create_plan", "save_tasks"):
+            await self.tracker.tasks_collection.delete_many({"plan_id": plan_id_filter(plan_id)})
+        
+        return await self.execute_planning({
+            **state,
+            "resume_from": resume_from,
+            "tasks_streamed": False,
+            "status": "resumed",
+            "error": ""
+        })
@@ -1,16 +1,52 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+import asyncio
 from contextlib import asynccontextmanager
 from db.connection import init_db, close_db
-from api import plans, tasks, progress_simple as progress, auth
+from db.indexes import ensure_indexes
+from api import plans, tasks, progress_simple as progress, auth, events, maintenance, transfer
+from graph.plan_queue import run_plan_queue
+from db.change_streams import ChangeStreamWatcher, REALTIME_ENABLED
+from db.archive import run_archiver, ARCHIVE_ENABLED
+from db.overdue import run_overdue_sweeper, OVERDUE_SWEEP_ENABLED
+from db.migrations import run_migrations, MIGRATIONS_ON_STARTUP
+from agents.progress_buffer import progress_buffer, PROGRESS_WRITE_BEHIND
+from utils.pubsub import pubsub
+from utils.ai_stack import preload_ai_stack, PRELOAD_AI_STACK
+from utils import metrics
+from utils.log import setup_logging, shutdown_logging
+from utils.profiling import ProfilingMiddleware, PROFILING_CONFIGURED
+
+setup_logging()
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup
     await init_db()
+    await ensure_indexes()
+    background_tasks = [asyncio.create_task(run_plan_queue())]
+    if MIGRATIONS_ON_STARTUP:
+        background_tasks.append(asyncio.create_task(run_migrations()))
+    if REALTIME_ENABLED:
+        background_tasks.append(asyncio.create_task(ChangeStreamWatcher(pubsub).run()))
+    if PRELOAD_AI_STACK:
+        background_tasks.append(asyncio.create_task(preload_ai_stack()))
+    if ARCHIVE_ENABLED:
+        background_tasks.append(asyncio.create_task(run_archiver()))
+    if OVERDUE_SWEEP_ENABLED:
+        background_tasks.append(asyncio.create_task(run_overdue_sweeper()))
+    if PROGRESS_WRITE_BEHIND:
+        background_tasks.append(asyncio.create_task(progress_buffer.run()))
     yield
     # Shutdown
+    for task in background_tasks:
+        task.cancel()
+    # Wait for the cancellations to land, so nothing is still writing while the buffer is flushed below
+    await asyncio.gather(*background_tasks, return_exceptions=True)
+    # Buffered progress must reach the database before the connection closes
+    await progress_buffer.close()
     await close_db()
+    shutdown_logging()
 
 app = FastAPI(
     title="Agentic Planner API",
@@ -26,13 +62,19 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "X-Profile-Id"],
 )
+if PROFILING_CONFIGURED:
+    app.add_middleware(ProfilingMiddleware)
 
 # Include routers
 app.include_router(auth.router, prefix="/api/auth", tags=["auth"])
 app.include_router(plans.router, prefix="/api", tags=["plans"])
 app.include_router(tasks.router, prefix="/api", tags=["tasks"])  
 app.include_router(progress.router, prefix="/api", tags=["progress"])
+app.include_router(events.router, prefix="/api", tags=["events"])
+app.include_router(maintenance.router, prefix="/api", tags=["maintenance"])
+app.include_router(transfer.router, prefix="/api", tags=["transfer"])
 
 @app.get("/")
 async def root():
@@ -41,3 +83,7 @@ async def root():
 @app.get("/health")
 async def health_check():
     return {"status": "healthy"}
+
+@app.get("/metrics")
+async def get_metrics():
+    return metrics.snapshot()
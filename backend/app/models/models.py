@@ -21,6 +21,7 @@ class User(BaseModel):
     email: str
     hashed_password: str
     is_active: bool = True
+    is_admin: bool = False  # Set in the database; ADMIN_USERNAMES also grants it
     created_at: datetime = Field(default_factory=datetime.utcnow)
 
 class Plan(BaseModel):
@@ -33,10 +34,14 @@ class Plan(BaseModel):
     end_date: datetime
     created_at: datetime = Field(default_factory=datetime.utcnow)
     is_active: bool = True
+    workflow_status: str = "planning"  # planning, queued, completed, failed
+    version: int = 0  # Incremented by every write to the plan or its tasks
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
 
 class Task(BaseModel):
     id: Optional[str] = Field(None, alias="_id")
-    plan_id: str
+    plan_id: str  # Stored as an ObjectId
+    user_id: Optional[str] = None  # Copied from the plan for user-wide task queries
     title: str
     description: Optional[str] = None
     target_date: datetime
@@ -44,8 +49,11 @@ class Task(BaseModel):
     unit: Optional[str] = None  # e.g., "pages", "kg", "USD"
     target_value: Optional[float] = None
     current_value: Optional[float] = 0
+    milestone_id: Optional[str] = None  # Milestone of a hierarchical plan the task was generated for
     memo: Optional[str] = None
     created_at: datetime = Field(default_factory=datetime.utcnow)
+    version: int = 0
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
 
 class ProgressLog(BaseModel):
     id: Optional[str] = Field(None, alias="_id")
@@ -53,6 +61,7 @@ class ProgressLog(BaseModel):
     user_id: str
     date: datetime = Field(default_factory=datetime.utcnow)
     status: TaskStatus
-    value: Optional[float] = None
+    value: Optional[float] = None  # Task value after this update
+    delta: Optional[float] = None  # Progress added by this update, when given as a delta
     note: Optional[str] = None
     created_at: datetime = Field(default_factory=datetime.utcnow)
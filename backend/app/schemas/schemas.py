@@ -39,6 +39,18 @@ class CreatePlanResponse(BaseModel):
     plan_id: str
     message: str
     tasks_created: int
+    status: str = "created"  # created, queued
+
+class BatchCreatePlanRequest(BaseModel):
+    plans: List[CreatePlanRequest]
+    pack_goals: bool = True  # Parse several short goals in one LLM call
+
+class BatchPlanResult(BaseModel):
+    index: int  # Position in the request
+    plan_id: str
+    status: str  # created, queued, failed
+    tasks_created: int = 0
+    message: str
 
 class TaskResponse(BaseModel):
     id: str
@@ -50,6 +62,9 @@ class TaskResponse(BaseModel):
     target_value: Optional[float]
     current_value: Optional[float]
     memo: Optional[str] = None
+    milestone_id: Optional[str] = None  # Set on tasks of hierarchical plans
+    version: int = 0
+    due_state: Optional[str] = None  # overdue or at_risk, set by the overdue sweeper
 
 class TaskUpdate(BaseModel):
     status: Optional[TaskStatus] = None
@@ -60,8 +75,25 @@ class ProgressRequest(BaseModel):
     task_id: str
     user_id: str
     status: TaskStatus
-    value: Optional[float] = None
+    value: Optional[float] = None  # Absolute value; prefer delta so concurrent updates add up
+    delta: Optional[float] = None  # Progress since the last update, added on the server
     note: Optional[str] = None
+    expected_version: Optional[int] = None  # Task version the update is based on; 409 if it changed
+
+class DueTaskBrief(BaseModel):
+    id: str
+    plan_id: str
+    title: str
+    target_date: datetime
+    status: TaskStatus
+
+class UserTaskSummaryResponse(BaseModel):
+    user_id: str
+    overdue_count: int = 0
+    upcoming_count: int = 0
+    overdue: List[DueTaskBrief] = []
+    upcoming: List[DueTaskBrief] = []  # Due within UPCOMING_DAYS
+    generated_at: Optional[datetime] = None  # None until the sweeper has run
 
 class ProgressResponse(BaseModel):
     message: str
@@ -75,6 +107,23 @@ class PlanStatusResponse(BaseModel):
     total_tasks: int
     completed_tasks: int
     pending_tasks: int
+    milestones_pending: int = 0  # Milestones whose tasks have not been generated yet
+
+class MilestoneResponse(BaseModel):
+    id: str
+    title: str
+    milestone: str  # What is achieved by the end of the milestone
+    focus: str
+    start_date: datetime
+    end_date: datetime
+    state: str  # pending, expanding, expanded
+    tasks_count: int = 0
+
+class MilestoneExpandResponse(BaseModel):
+    plan_id: str
+    milestone_id: str
+    state: str
+    tasks_created: int = 0
 
 class AIProgressUpdateRequest(BaseModel):
     task_id: str
@@ -87,6 +136,7 @@ class AIProgressUpdateResponse(BaseModel):
     analysis: Optional[dict] = None
     task_updated: bool = False
     error: Optional[str] = None
+    fallback: Optional[str] = None  # Endpoint to use while AI analysis is unavailable
 
 class BulkProgressUpdateRequest(BaseModel):
     user_id: str
@@ -98,6 +148,13 @@ class BulkProgressUpdateResponse(BaseModel):
     summary: str = ""
     total_updates: int = 0
     error: Optional[str] = None
+    fallback: Optional[str] = None
+
+class RescheduleResponse(BaseModel):
+    status: str
+    plan_id: Optional[str] = None
+    tasks_rescheduled: int = 0
+    error: Optional[str] = None
 
 class PlanResponse(BaseModel):
     plan_id: str
@@ -112,5 +169,6 @@ class PlanResponse(BaseModel):
     total_tasks: int
     completed_tasks: int
     pending_tasks: int
+    milestones_pending: int = 0
     created_at: datetime
     is_active: bool
@@ -0,0 +1,42 @@
+import os
+import time
+import asyncio
+import importlib
+from typing import Any
+
+from utils import metrics
+from utils.log import get_logger
+
+logger = get_logger(__name__)
+
+# LangGraph and the Gemini client take seconds to import, so they are loaded on
+# first AI use (or preloaded in the background) instead of at worker startup
+PRELOAD_AI_STACK = os.getenv("PRELOAD_AI_STACK", "true").lower() == "true"
+
+AI_MODULES = ["graph.workflow", "agents.progress_updater"]
+
+def planning_workflow() -> Any:
+    """Create a PlanningWorkflow, importing the graph on first use"""
+    from graph.workflow import PlanningWorkflow
+    return PlanningWorkflow()
+
+def planner_agent() -> Any:
+    """Create a PlannerAgent, importing it on first use"""
+    from agents.planner import PlannerAgent
+    return PlannerAgent()
+
+def progress_updater() -> Any:
+    """Create a ProgressUpdaterAgent, importing it on first use"""
+    from agents.progress_updater import ProgressUpdaterAgent
+    return ProgressUpdaterAgent()
+
+async def preload_ai_stack() -> None:
+    """Import the AI modules in a worker thread once the app is already serving"""
+    
+    started = time.perf_counter()
+    try:
+        for module in AI_MODULES:
+            await asyncio.to_thread(importlib.import_module, module)
+        metrics.set_gauge("startup.ai_stack_import_seconds", time.perf_counter() - started)
+    except Exception as e:
+        logger.warning("AI stack preload failed: %s", e)
@@ -3,11 +3,12 @@ from datetime import datetime, timedelta
 from typing import Optional
 from jose import JWTError, jwt
 from passlib.context import CryptContext
-from fastapi import HTTPException, status, Depends
+from fastapi import HTTPException, status, Depends, Query
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from db.connection import get_collection
 from models.models import User
 from schemas.schemas import TokenData
+from utils.profiling import phase
 
 # Password hashing
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
@@ -16,9 +17,12 @@ pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key-here")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
+# Usernames allowed to run maintenance and act on other users' data, besides users flagged is_admin
+ADMIN_USERNAMES = {name.strip() for name in os.getenv("ADMIN_USERNAMES", "").split(",") if name.strip()}
 
 # Security scheme
 security = HTTPBearer()
+optional_security = HTTPBearer(auto_error=False)
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Verify a password against its hash"""
@@ -68,27 +72,59 @@ async def authenticate_user(email: str, password: str) -> Optional[User]:
 
 async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)) -> User:
     """Get current user from JWT token"""
+    return await user_from_token(credentials.credentials)
+
+async def user_from_token(token: str) -> User:
+    """Get the user a JWT token was issued to"""
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
-    try:
-        payload = jwt.decode(credentials.credentials, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = payload.get("sub")
-        if username is None:
+    with phase("auth"):
+        try:
+            payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+            username: str = payload.get("sub")
+            if username is None:
+                raise credentials_exception
+            token_data = TokenData(username=username)
+        except JWTError:
             raise credentials_exception
-        token_data = TokenData(username=username)
-    except JWTError:
-        raise credentials_exception
-    
-    user = await get_user_by_username(username=token_data.username)
-    if user is None:
-        raise credentials_exception
-    return user
+        
+        user = await get_user_by_username(username=token_data.username)
+        if user is None:
+            raise credentials_exception
+        return user
 
 async def get_current_active_user(current_user: User = Depends(get_current_user)) -> User:
     """Get current active user"""
     if not current_user.is_active:
         raise HTTPException(status_code=400, detail="Inactive user")
     return current_user
+
+async def get_current_stream_user(
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(optional_security),
+    token: Optional[str] = Query(None)
+) -> User:
+    """Get current active user for a stream; EventSource cannot set headers, so the token may come as ?token="""
+    if credentials is None and token is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Not authenticated",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return await get_current_active_user(await user_from_token(credentials.credentials if credentials else token))
+
+def is_admin(user: User) -> bool:
+    return user.is_admin or user.username in ADMIN_USERNAMES
+
+async def get_current_admin_user(current_user: User = Depends(get_current_active_user)) -> User:
+    """Get current active user, who must be an admin"""
+    if not is_admin(current_user):
+        raise HTTPException(status_code=403, detail="Admin access required")
+    return current_user
+
+def require_user_access(current_user: User, user_id: str) -> None:
+    """Allow a user to act on their own data only, and admins on anyone's"""
+    if current_user.id != user_id and not is_admin(current_user):
+        raise HTTPException(status_code=403, detail="Not allowed to access another user's data")
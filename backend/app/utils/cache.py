@@ -0,0 +1,146 @@
+import os
+import json
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+from fastapi.encoders import jsonable_encoder
+
+from utils import metrics
+from utils.log import get_logger
+
+logger = get_logger(__name__)
+
+try:
+    import redis.asyncio as redis
+except ImportError:
+    redis = None
+
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "memory")  # memory, redis, none
+CACHE_URL = os.getenv("CACHE_URL", "redis://localhost:6379/0")
+CACHE_TTL_SECONDS = int(os.getenv("CACHE_TTL_SECONDS", "60"))
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "1000"))
+
+class MemoryCache:
+    """Per-process LRU with TTL; invalidation only reaches this worker"""
+    
+    def __init__(self, max_entries: int = CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.entries: "OrderedDict[str, Tuple[Any, float, float]]" = OrderedDict()
+        self.tags: Dict[str, Set[str]] = {}
+    
+    async def get(self, key: str) -> Optional[Tuple[Any, float]]:
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        value, stored_at, expires_at = entry
+        if time.time() >= expires_at:
+            del self.entries[key]
+            self._forget_key(key)
+            return None
+        self.entries.move_to_end(key)
+        return value, stored_at
+    
+    async def set(self, key: str, value: Any, tags: List[str], ttl: int) -> None:
+        now = time.time()
+        self.entries[key] = (value, now, now + ttl)
+        self.entries.move_to_end(key)
+        for tag in tags:
+            self.tags.setdefault(tag, set()).add(key)
+        while len(self.entries) > self.max_entries:
+            evicted, _ = self.entries.popitem(last=False)
+            self._forget_key(evicted)
+    
+    def _forget_key(self, key: str) -> None:
+        for tag in [tag for tag, keys in self.tags.items() if key in keys]:
+            self.tags[tag].discard(key)
+            if not self.tags[tag]:
+                del self.tags[tag]
+    
+    async def invalidate_tags(self, tags: List[str]) -> None:
+        for tag in tags:
+            for key in self.tags.pop(tag, set()):
+                self.entries.pop(key, None)
+
+class RedisCache:
+    """Shared cache over any Redis-protocol client (redis.asyncio or a compatible stand-in)"""
+    
+    def __init__(self, client: Any, prefix: str = "cache:"):
+        self.client = client
+        self.prefix = prefix
+    
+    async def get(self, key: str) -> Optional[Tuple[Any, float]]:
+        raw = await self.client.get(self.prefix + key)
+        if raw is None:
+            return None
+        entry = json.loads(raw)
+        return entry["value"], entry["stored_at"]
+    
+    async def set(self, key: str, value: Any, tags: List[str], ttl: int) -> None:
+        pipe = self.client.pipeline()
+        pipe.set(self.prefix + key, json.dumps({"value": value, "stored_at": time.time()}), ex=ttl)
+        for tag in tags:
+            pipe.sadd(self.prefix + "tag:" + tag, key)
+            pipe.expire(self.prefix + "tag:" + tag, ttl)
+        await pipe.execute()
+    
+    async def invalidate_tags(self, tags: List[str]) -> None:
+        for tag in tags:
+            tag_key = self.prefix + "tag:" + tag
+            keys = await self.client.smembers(tag_key)
+            names = [self.prefix + (key.decode() if isinstance(key, bytes) else key) for key in keys]
+            await self.client.delete(tag_key, *names)
+
+class ResponseCache:
+    """Read-through cache for JSON-able responses with tag-based invalidation"""
+    
+    def __init__(self, backend: Any = None, ttl: int = CACHE_TTL_SECONDS):
+        self.backend = backend
+        self.ttl = ttl
+    
+    async def get_or_load(self, key: str, tags: List[str], loader: Callable[[], Awaitable[Any]]) -> Any:
+        if self.backend is None:
+            return await loader()
+        
+        try:
+            cached = await self.backend.get(key)
+        except Exception as e:
+            logger.warning("Cache read failed: %s", e)
+            cached = None
+        
+        requests = metrics.incr("cache.requests")
+        if cached is not None:
+            value, stored_at = cached
+            hits = metrics.incr("cache.hits")
+            metrics.set_gauge("cache.hit_ratio", hits / requests)
+            metrics.set_gauge("cache.last_hit_staleness_seconds", time.time() - stored_at)
+            return value
+        
+        metrics.set_gauge("cache.hit_ratio", metrics.get_counter("cache.hits") / requests)
+        value = jsonable_encoder(await loader())
+        try:
+            await self.backend.set(key, value, tags, self.ttl)
+        except Exception as e:
+            logger.warning("Cache write failed: %s", e)
+        return value
+    
+    async def invalidate(self, *tags: str) -> None:
+        if self.backend is None:
+            return
+        try:
+            await self.backend.invalidate_tags(list(tags))
+            metrics.incr("cache.invalidations", len(tags))
+        except Exception as e:
+            logger.warning("Cache invalidation failed: %s", e)
+
+def create_cache() -> ResponseCache:
+    """Build the response cache from settings"""
+    
+    if CACHE_BACKEND == "redis":
+        if redis is None:
+            raise RuntimeError("CACHE_BACKEND=redis requires the redis package")
+        return ResponseCache(RedisCache(redis.from_url(CACHE_URL)))
+    if CACHE_BACKEND == "memory":
+        return ResponseCache(MemoryCache())
+    return ResponseCache(None)
+
+response_cache = create_cache()
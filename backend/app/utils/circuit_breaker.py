@@ -0,0 +1,94 @@
+import time
+from collections import deque
+from typing import Deque
+
+from utils import metrics
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+_STATE_GAUGE = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+class CircuitOpenError(Exception):
+    pass
+
+class CircuitBreaker:
+    """Count-based circuit breaker that treats slow calls as failures"""
+    
+    def __init__(self, name: str, failure_rate_threshold: float = 0.5, window_size: int = 20,
+                 min_calls: int = 10, open_seconds: float = 30.0, half_open_max_calls: int = 1):
+        self.name = name
+        self.failure_rate_threshold = failure_rate_threshold
+        self.min_calls = min_calls
+        self.open_seconds = open_seconds
+        self.half_open_max_calls = half_open_max_calls
+        self.outcomes: Deque[bool] = deque(maxlen=window_size)
+        self.state = CLOSED
+        self.opened_at = 0.0
+        self.probes_in_flight = 0
+        self._set_state(CLOSED)
+    
+    def _set_state(self, state: str) -> None:
+        self.state = state
+        metrics.set_gauge(f"circuit.{self.name}.state", _STATE_GAUGE[state])
+    
+    def _cooled_down(self) -> bool:
+        return time.monotonic() - self.opened_at >= self.open_seconds
+    
+    def rejects_requests(self) -> bool:
+        """Check, without taking a probe slot, whether a call would be rejected right now"""
+        
+        if self.state == OPEN:
+            return not self._cooled_down()
+        if self.state == HALF_OPEN:
+            return self.probes_in_flight >= self.half_open_max_calls
+        return False
+    
+    def allow_request(self) -> bool:
+        """Admit a call; in half-open state only a limited number of probes get through"""
+        
+        if self.state == OPEN and self._cooled_down():
+            self._set_state(HALF_OPEN)
+            self.probes_in_flight = 0
+        
+        if self.state == OPEN or (self.state == HALF_OPEN and self.probes_in_flight >= self.half_open_max_calls):
+            metrics.incr(f"circuit.{self.name}.rejected")
+            return False
+        
+        if self.state == HALF_OPEN:
+            self.probes_in_flight += 1
+        return True
+    
+    def record_success(self, slow: bool = False) -> None:
+        if slow:
+            self.record_failure()
+            return
+        
+        if self.state == HALF_OPEN:
+            self.outcomes.clear()
+            self.probes_in_flight = 0
+            self._set_state(CLOSED)
+        self.outcomes.append(True)
+    
+    def record_failure(self) -> None:
+        if self.state == HALF_OPEN:
+            self._trip()
+            return
+        
+        self.outcomes.append(False)
+        failures = self.outcomes.count(False)
+        if len(self.outcomes) >= self.min_calls and failures / len(self.outcomes) >= self.failure_rate_threshold:
+            self._trip()
+    
+    def release(self) -> None:
+        """Give back a probe slot for a call that ended without an outcome (e.g. cancelled)"""
+        if self.state == HALF_OPEN and self.probes_in_flight > 0:
+            self.probes_in_flight -= 1
+    
+    def _trip(self) -> None:
+        self.opened_at = time.monotonic()
+        self.probes_in_flight = 0
+        self.outcomes.clear()
+        self._set_state(OPEN)
+        metrics.incr(f"circuit.{self.name}.opened")
@@ -0,0 +1,12 @@
+from datetime import datetime, timezone
+
+def parse_utc(value: str) -> datetime:
+    """Parse an ISO date or datetime as naive UTC, comparable with utcnow() and dates read from MongoDB"""
+    
+    # API dates come from toISOString() with a "Z", which fromisoformat only accepts from Python 3.11
+    if isinstance(value, str) and value.endswith("Z"):
+        value = value[:-1] + "+00:00"
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
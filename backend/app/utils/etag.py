@@ -0,0 +1,33 @@
+import hashlib
+from datetime import datetime
+from typing import Optional
+from fastapi import HTTPException, Request
+
+def make_etag(*parts) -> str:
+    """Build a weak ETag from version watermarks and the current day (for day-relative fields)"""
+    
+    raw = "|".join(str(part) for part in (*parts, datetime.utcnow().date()))
+    return 'W/"' + hashlib.sha1(raw.encode()).hexdigest()[:20] + '"'
+
+def is_not_modified(request: Request, etag: str) -> bool:
+    """Check the request's If-None-Match header against an ETag"""
+    
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    return header.strip() == "*" or etag in [value.strip() for value in header.split(",")]
+
+def version_etag(version: int) -> str:
+    """Strong ETag for one document's version, for use with If-Match"""
+    return f'"{version}"'
+
+def if_match_version(request: Request) -> Optional[int]:
+    """Get the version required by the If-Match header, None when the write is unconditional"""
+    
+    header = request.headers.get("if-match")
+    if not header or header.strip() == "*":
+        return None
+    try:
+        return int(header.strip().removeprefix("W/").strip('"'))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="If-Match must be a task version ETag")
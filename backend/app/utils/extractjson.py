@@ -1,3 +1,8 @@
+import re
+import json
+from typing import Any, List
+
+
 def strip_json_markdown_block(text: str) -> str:
     lines = text.strip().splitlines()
 
@@ -10,3 +15,58 @@ def strip_json_markdown_block(text: str) -> str:
         lines = lines[:-1]
 
     return "\n".join(lines).strip()
+
+
+class JsonArrayStream:
+    """Yields the objects or arrays in a JSON array field as each one completes, from text that arrives in pieces"""
+    
+    def __init__(self, key: str):
+        self.key = key
+        self.text = ""
+        self.position = 0
+        self.in_array = False
+        self.done = False
+        self.depth = 0
+        self.in_string = False
+        self.escaped = False
+        self.object_start = None
+    
+    def feed(self, chunk: str) -> List[Any]:
+        """Add text and return the array items completed by it"""
+        self.text += chunk
+        objects = []
+        
+        if not self.in_array:
+            match = re.search(r'"' + re.escape(self.key) + r'"\s*:\s*\[', self.text)
+            if not match:
+                return objects
+            self.in_array = True
+            self.position = match.end()
+        
+        while self.position < len(self.text) and not self.done:
+            char = self.text[self.position]
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif char == "\\":
+                    self.escaped = True
+                elif char == '"':
+                    self.in_string = False
+            elif char == '"':
+                self.in_string = True
+            elif char in "{[":
+                if self.depth == 0:
+                    self.object_start = self.position
+                self.depth += 1
+            elif char in "}]":
+                if self.depth == 0:
+                    # The array itself has closed
+                    self.done = True
+                else:
+                    self.depth -= 1
+                    if self.depth == 0 and self.object_start is not None:
+                        objects.append(json.loads(self.text[self.object_start:self.position + 1]))
+                        self.object_start = None
+            self.position += 1
+        
+        return objects
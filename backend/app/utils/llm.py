@@ -0,0 +1,203 @@
+import os
+import json
+import time
+import asyncio
+from collections import deque
+from typing import Any, AsyncIterator, Callable, Deque, Dict, List, Optional
+
+from utils import metrics
+from utils.circuit_breaker import CircuitBreaker, CircuitOpenError
+from utils.extractjson import strip_json_markdown_block
+from utils.profiling import phase
+
+LLM_HEDGING_ENABLED = os.getenv("LLM_HEDGING_ENABLED", "true").lower() == "true"
+# Hedge only once enough latency samples exist to estimate the p95
+LLM_HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+# Upper bound on the share of calls that may send a duplicate request
+LLM_HEDGE_MAX_RATE = float(os.getenv("LLM_HEDGE_MAX_RATE", "0.1"))
+LLM_LATENCY_WINDOW = int(os.getenv("LLM_LATENCY_WINDOW", "200"))
+# Calls slower than this share of their deadline count as failures for the circuit breaker
+LLM_BREAKER_SLOW_FRACTION = float(os.getenv("LLM_BREAKER_SLOW_FRACTION", "0.8"))
+
+# Hard per-agent deadlines in seconds, overridable with LLM_DEADLINE_<AGENT>
+DEFAULT_DEADLINES = {
+    "goal_parser": 30.0,
+    "goal_parser_batch": 60.0,
+    "planner": 90.0,
+    "progress_updater": 30.0
+}
+
+_latencies: Dict[str, Deque[float]] = {}
+
+# One breaker for the shared Gemini provider
+llm_breaker = CircuitBreaker(
+    "llm",
+    failure_rate_threshold=float(os.getenv("LLM_BREAKER_FAILURE_RATE", "0.5")),
+    window_size=int(os.getenv("LLM_BREAKER_WINDOW", "20")),
+    min_calls=int(os.getenv("LLM_BREAKER_MIN_CALLS", "10")),
+    open_seconds=float(os.getenv("LLM_BREAKER_OPEN_SECONDS", "30"))
+)
+
+def llm_available() -> bool:
+    """Whether a new LLM call would currently be admitted by the circuit breaker"""
+    return not llm_breaker.rejects_requests()
+
+class LLMTimeoutError(TimeoutError):
+    pass
+
+def is_json_response(response: Any) -> bool:
+    """Check that a model response carries parseable JSON"""
+    try:
+        json.loads(strip_json_markdown_block(response.content))
+        return True
+    except (ValueError, AttributeError, TypeError):
+        return False
+
+def _percentile(samples: List[float], fraction: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+class HedgedLLM:
+    """Wraps a chat model with a hard deadline and a hedged duplicate request past the p95 latency"""
+    
+    def __init__(self, agent: str, llm: Any, deadline: Optional[float] = None,
+                 validate: Callable[[Any], bool] = is_json_response):
+        self.agent = agent
+        self.llm = llm
+        self.deadline = deadline or float(
+            os.getenv(f"LLM_DEADLINE_{agent.upper()}", DEFAULT_DEADLINES.get(agent, 60.0))
+        )
+        self.validate = validate
+        self.latencies = _latencies.setdefault(agent, deque(maxlen=LLM_LATENCY_WINDOW))
+    
+    def _hedge_delay(self) -> Optional[float]:
+        """Seconds to wait before hedging, None when hedging is not allowed for this call"""
+        
+        if not LLM_HEDGING_ENABLED or len(self.latencies) < LLM_HEDGE_MIN_SAMPLES:
+            return None
+        calls = metrics.get_counter(f"llm.{self.agent}.calls")
+        if calls and metrics.get_counter(f"llm.{self.agent}.hedged") / calls >= LLM_HEDGE_MAX_RATE:
+            return None
+        return _percentile(list(self.latencies), 0.95)
+    
+    def _record_latency(self, elapsed: float) -> None:
+        self.latencies.append(elapsed)
+        samples = list(self.latencies)
+        metrics.set_gauge(f"llm.{self.agent}.latency_p50", _percentile(samples, 0.5))
+        metrics.set_gauge(f"llm.{self.agent}.latency_p95", _percentile(samples, 0.95))
+        metrics.set_gauge(f"llm.{self.agent}.latency_p99", _percentile(samples, 0.99))
+    
+    async def _timed(self, messages: List[Any]) -> Any:
+        started = time.monotonic()
+        response = await self.llm.ainvoke(messages)
+        return response, time.monotonic() - started
+    
+    async def ainvoke(self, messages: List[Any]) -> Any:
+        """Invoke the model through the circuit breaker"""
+        
+        if not llm_breaker.allow_request():
+            raise CircuitOpenError("AI service is temporarily unavailable")
+        
+        started = time.monotonic()
+        try:
+            with phase("llm"):
+                response = await self._hedged_invoke(messages, started)
+        except asyncio.CancelledError:
+            llm_breaker.release()
+            raise
+        except Exception:
+            llm_breaker.record_failure()
+            raise
+        
+        llm_breaker.record_success(slow=time.monotonic() - started >= self.deadline * LLM_BREAKER_SLOW_FRACTION)
+        return response
+    
+    async def astream(self, messages: List[Any]) -> AsyncIterator[str]:
+        """Stream the model's text through the circuit breaker, under the same overall deadline; never hedged"""
+        
+        if not llm_breaker.allow_request():
+            raise CircuitOpenError("AI service is temporarily unavailable")
+        
+        metrics.incr(f"llm.{self.agent}.calls")
+        metrics.incr(f"llm.{self.agent}.streamed")
+        started = time.monotonic()
+        chunks = self.llm.astream(messages).__aiter__()
+        try:
+            with phase("llm"):
+                while True:
+                    remaining = started + self.deadline - time.monotonic()
+                    try:
+                        chunk = await asyncio.wait_for(chunks.__anext__(), max(remaining, 0))
+                    except StopAsyncIteration:
+                        break
+                    except asyncio.TimeoutError:
+                        metrics.incr(f"llm.{self.agent}.timeouts")
+                        raise LLMTimeoutError(f"LLM stream for {self.agent} timed out after {self.deadline:g}s")
+                    yield chunk.content
+        except (asyncio.CancelledError, GeneratorExit):
+            llm_breaker.release()
+            raise
+        except Exception:
+            metrics.incr(f"llm.{self.agent}.errors")
+            llm_breaker.record_failure()
+            raise
+        finally:
+            aclose = getattr(chunks, "aclose", None)
+            if aclose is not None:
+                await aclose()
+        
+        elapsed = time.monotonic() - started
+        self._record_latency(elapsed)
+        llm_breaker.record_success(slow=elapsed >= self.deadline * LLM_BREAKER_SLOW_FRACTION)
+    
+    async def _hedged_invoke(self, messages: List[Any], started: float) -> Any:
+        """Return the first valid response of the primary or hedged request"""
+        
+        metrics.incr(f"llm.{self.agent}.calls")
+        hedge_delay = self._hedge_delay()
+        pending = {asyncio.ensure_future(self._timed(messages))}
+        hedge = None
+        last_error: Exception = None
+        
+        try:
+            while pending:
+                now = time.monotonic()
+                wait_for = started + self.deadline - now
+                if hedge is None and hedge_delay is not None:
+                    wait_for = min(wait_for, started + hedge_delay - now)
+                
+                done, pending = await asyncio.wait(
+                    pending, timeout=max(wait_for, 0), return_when=asyncio.FIRST_COMPLETED
+                )
+                
+                for task in done:
+                    if task.exception() is not None:
+                        last_error = task.exception()
+                        continue
+                    response, elapsed = task.result()
+                    if self.validate(response):
+                        self._record_latency(elapsed)
+                        if task is hedge:
+                            metrics.incr(f"llm.{self.agent}.hedge_wins")
+                        return response
+                    last_error = ValueError("LLM returned an invalid response")
+                
+                if time.monotonic() - started >= self.deadline:
+                    break
+                
+                # Past the p95 with no usable answer yet: send one duplicate request
+                if not done and hedge is None and hedge_delay is not None:
+                    hedge = asyncio.ensure_future(self._timed(messages))
+                    pending.add(hedge)
+                    metrics.incr(f"llm.{self.agent}.hedged")
+            
+            if pending or last_error is None:
+                metrics.incr(f"llm.{self.agent}.timeouts")
+                raise LLMTimeoutError(f"LLM call for {self.agent} timed out after {self.deadline:g}s")
+            
+            metrics.incr(f"llm.{self.agent}.errors")
+            raise last_error
+        
+        finally:
+            for task in pending:
+                task.cancel()
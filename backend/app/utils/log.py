@@ -0,0 +1,127 @@
+import os
+import sys
+import json
+import copy
+import queue
+import atexit
+import random
+import logging
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any, Dict, Optional
+
+from utils import metrics
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+# Per-category overrides, e.g. "payload=DEBUG,db=WARNING,payload.planner=DEBUG"
+LOG_LEVELS = os.getenv("LOG_LEVELS", "")
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")  # json, text
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+# Prompts, messages and raw model output are logged under "payload.<source>" at DEBUG
+LOG_PAYLOAD_MAX_CHARS = int(os.getenv("LOG_PAYLOAD_MAX_CHARS", "2000"))
+LOG_PAYLOAD_SAMPLE_RATE = float(os.getenv("LOG_PAYLOAD_SAMPLE_RATE", "1.0"))
+
+_RESERVED = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+
+_listener: Optional[QueueListener] = None
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line, with any `extra` fields kept as top-level keys"""
+    
+    def format(self, record: logging.LogRecord) -> str:
+        entry: Dict[str, Any] = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage()
+        }
+        entry.update({key: value for key, value in vars(record).items() if key not in _RESERVED})
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+class TextFormatter(logging.Formatter):
+    """Plain lines for local development, with `extra` fields appended as key=value"""
+    
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)s %(name)s: %(message)s")
+    
+    def format(self, record: logging.LogRecord) -> str:
+        extras = " ".join(f"{key}={value}" for key, value in vars(record).items() if key not in _RESERVED)
+        line = super().format(record)
+        return f"{line} {extras}" if extras else line
+
+class NonBlockingQueueHandler(QueueHandler):
+    """Hands records to the writer thread; drops them instead of blocking when the queue is full"""
+    
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Only resolve the message and traceback here; formatting and I/O happen on the writer thread
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+    
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            metrics.incr("log.dropped")
+
+def _parse_levels(spec: str) -> Dict[str, str]:
+    levels = {}
+    for item in spec.split(","):
+        if "=" in item:
+            category, level = item.split("=", 1)
+            levels[category.strip()] = level.strip().upper()
+    return levels
+
+def setup_logging() -> None:
+    """Route all logging through a bounded queue drained by a background writer thread"""
+    
+    global _listener
+    if _listener is not None:
+        return
+    
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setFormatter(JsonFormatter() if LOG_FORMAT == "json" else TextFormatter())
+    
+    log_queue: "queue.Queue[logging.LogRecord]" = queue.Queue(LOG_QUEUE_SIZE)
+    root = logging.getLogger()
+    root.handlers = [NonBlockingQueueHandler(log_queue)]
+    root.setLevel(LOG_LEVEL)
+    for category, level in _parse_levels(LOG_LEVELS).items():
+        logging.getLogger(category).setLevel(level)
+    
+    _listener = QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(shutdown_logging)
+
+def shutdown_logging() -> None:
+    """Flush queued records and stop the writer thread"""
+    
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+def get_logger(name: str) -> logging.Logger:
+    return logging.getLogger(name)
+
+def _truncate(text: str) -> str:
+    if len(text) <= LOG_PAYLOAD_MAX_CHARS:
+        return text
+    return f"{text[:LOG_PAYLOAD_MAX_CHARS]}... [{len(text) - LOG_PAYLOAD_MAX_CHARS} more chars]"
+
+def log_payload(source: str, label: str, payload: Any, **fields: Any) -> None:
+    """Log a large payload at DEBUG, sampled and truncated; costs nothing unless enabled"""
+    
+    logger = logging.getLogger(f"payload.{source}")
+    if not logger.isEnabledFor(logging.DEBUG):
+        return
+    if LOG_PAYLOAD_SAMPLE_RATE < 1.0 and random.random() >= LOG_PAYLOAD_SAMPLE_RATE:
+        return
+    text = payload if isinstance(payload, str) else json.dumps(payload, default=str)
+    logger.debug(label, extra={**fields, "payload": _truncate(text), "payload_chars": len(text)})
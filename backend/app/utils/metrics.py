@@ -0,0 +1,26 @@
+from collections import defaultdict
+from typing import Dict, Any
+
+# In-process metrics, exposed through GET /metrics
+_counters: Dict[str, float] = defaultdict(float)
+_gauges: Dict[str, float] = {}
+
+def incr(name: str, value: float = 1) -> float:
+    """Increment a counter and return its new value"""
+    _counters[name] += value
+    return _counters[name]
+
+def get_counter(name: str) -> float:
+    """Get the current value of a counter"""
+    return _counters.get(name, 0)
+
+def set_gauge(name: str, value: float) -> None:
+    """Set a gauge to an absolute value"""
+    _gauges[name] = value
+
+def snapshot() -> Dict[str, Any]:
+    """Get all metrics"""
+    return {
+        "counters": dict(_counters),
+        "gauges": dict(_gauges)
+    }
@@ -0,0 +1,239 @@
+"""Opt-in per-request profiling.
+
+A request is profiled when it carries a valid signed X-Profile header or is
+picked by PROFILE_SAMPLE_RATE, and its path is in PROFILE_PATHS. While it
+runs, a thread samples the event loop thread's stack every
+PROFILE_INTERVAL_MS. Two files are written to PROFILE_DIR, named by the id
+returned in the X-Profile-Id response header:
+  <id>.folded  collapsed stacks ("frame;frame;frame count"), for flamegraph.pl or speedscope
+  <id>.json    wall time per phase (auth, db, llm, send) and sample counts by category
+
+Sign a request, from backend/app, with PROFILE_SECRET set:
+    python -m utils.profiling POST /api/create
+"""
+import os
+import sys
+import hmac
+import json
+import time
+import uuid
+import random
+import hashlib
+import asyncio
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, Optional
+
+from pymongo import monitoring
+
+from utils import metrics
+from utils.log import get_logger
+
+logger = get_logger(__name__)
+
+# Header signing key; the header trigger is off when unset
+PROFILE_SECRET = os.getenv("PROFILE_SECRET", "")
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_PATHS = [path.strip() for path in os.getenv(
+    "PROFILE_PATHS", "/api/create,/api/create/batch,/api/progress/ai-update,/api/progress/bulk-ai-update"
+).split(",") if path.strip()]
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+PROFILE_TOKEN_MAX_AGE_SECONDS = int(os.getenv("PROFILE_TOKEN_MAX_AGE_SECONDS", "300"))
+
+# Without a secret or a sample rate the middleware and the command listener are not installed at all
+PROFILING_CONFIGURED = bool(PROFILE_SECRET) or PROFILE_SAMPLE_RATE > 0
+
+PROFILE_HEADER = b"x-profile"
+
+# Sampled frames are put in the first category whose marker appears in their file path
+CATEGORIES = [
+    ("db", ("pymongo", "motor", "bson")),
+    ("llm", ("langchain", "google", "grpc", "httpx", "utils/llm.py")),
+    ("auth", ("jose", "passlib", "bcrypt", "utils/auth.py")),
+    ("serialization", ("pydantic", "json", "fastapi/encoders.py")),
+    ("framework", ("starlette", "fastapi", "uvicorn")),
+]
+
+_current: ContextVar[Optional["RequestProfile"]] = ContextVar("request_profile", default=None)
+# The sampler sees the whole event loop thread, so only one request is profiled at a time
+_busy = threading.Lock()
+
+def sign(method: str, path: str, timestamp: Optional[int] = None) -> str:
+    """X-Profile header value for a request: "<timestamp>.<hmac>" """
+    
+    timestamp = int(time.time()) if timestamp is None else timestamp
+    digest = hmac.new(PROFILE_SECRET.encode(), f"{method} {path} {timestamp}".encode(), hashlib.sha256).hexdigest()
+    return f"{timestamp}.{digest}"
+
+def _valid_signature(value: str, method: str, path: str) -> bool:
+    timestamp, _, digest = value.partition(".")
+    if not PROFILE_SECRET or not timestamp.isdigit():
+        return False
+    if abs(time.time() - int(timestamp)) > PROFILE_TOKEN_MAX_AGE_SECONDS:
+        return False
+    return hmac.compare_digest(sign(method, path, int(timestamp)).partition(".")[2], digest)
+
+class RequestProfile:
+    """Sampled stacks and phase timings of one request"""
+    
+    def __init__(self, method: str, path: str, thread_id: int):
+        self.id = f"{time.strftime('%Y%m%dT%H%M%S')}-{path.strip('/').replace('/', '_') or 'root'}-{uuid.uuid4().hex[:8]}"
+        self.method = method
+        self.path = path
+        self.thread_id = thread_id
+        self.stacks: Counter = Counter()
+        self.categories: Counter = Counter()
+        self.phases: Dict[str, float] = {}
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.sampler = threading.Thread(target=self._sample, name=f"profiler-{self.id}", daemon=True)
+        self.started = time.perf_counter()
+        self.elapsed = 0.0
+    
+    def add_phase(self, name: str, seconds: float) -> None:
+        with self.lock:
+            self.phases[name] = self.phases.get(name, 0.0) + seconds
+    
+    def _sample(self) -> None:
+        interval = PROFILE_INTERVAL_MS / 1000
+        while not self.stopped.wait(interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack: List[str] = []
+            category = None
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                if category is None:
+                    path = code.co_filename.replace("\\", "/")
+                    category = next((name for name, markers in CATEGORIES if any(m in path for m in markers)), None)
+                frame = frame.f_back
+            # A loop blocked in its selector has nothing to run: the request is waiting on I/O
+            idle = stack[0].startswith("select (selectors.py")
+            self.stacks[";".join(reversed(stack))] += 1
+            self.categories["io_wait" if idle else category or "app"] += 1
+    
+    def start(self) -> None:
+        self.sampler.start()
+    
+    def stop(self) -> None:
+        self.elapsed = time.perf_counter() - self.started
+        self.stopped.set()
+        self.sampler.join()
+    
+    def report(self, status: Optional[int]) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "method": self.method,
+            "path": self.path,
+            "status": status,
+            "total_seconds": round(self.elapsed, 6),
+            # Wall time; concurrent calls within the request add up, and auth includes its own DB lookup
+            "phases_seconds": {name: round(seconds, 6) for name, seconds in sorted(self.phases.items())},
+            "sample_interval_ms": PROFILE_INTERVAL_MS,
+            "samples": sum(self.categories.values()),
+            "samples_by_category": dict(self.categories.most_common())
+        }
+    
+    def write(self, status: Optional[int]) -> str:
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        base = os.path.join(PROFILE_DIR, self.id)
+        with open(f"{base}.folded", "w") as file:
+            file.writelines(f"{stack} {count}\n" for stack, count in self.stacks.items())
+        with open(f"{base}.json", "w") as file:
+            json.dump(self.report(status), file, indent=2)
+        return base
+
+@contextmanager
+def phase(name: str) -> Iterator[None]:
+    """Time a block as a phase of the profiled request; a no-op when nothing is being profiled"""
+    
+    profile = _current.get()
+    if profile is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        profile.add_phase(name, time.perf_counter() - started)
+
+class CommandTimingListener(monitoring.CommandListener):
+    """Adds server round-trip time to the profiled request's db phase"""
+    
+    def _record(self, event) -> None:
+        # Motor runs PyMongo in executor threads with a copy of the caller's context, so the profile is visible here
+        profile = _current.get()
+        if profile is not None:
+            profile.add_phase("db", event.duration_micros / 1e6)
+    
+    def started(self, event):
+        pass
+    
+    def succeeded(self, event):
+        self._record(event)
+    
+    def failed(self, event):
+        self._record(event)
+
+class ProfilingMiddleware:
+    """ASGI middleware that profiles selected requests; other requests only pay a path check"""
+    
+    def __init__(self, app):
+        self.app = app
+    
+    def _selected(self, scope) -> bool:
+        if scope["type"] != "http" or scope["path"] not in PROFILE_PATHS:
+            return False
+        for name, value in scope["headers"]:
+            if name == PROFILE_HEADER:
+                if _valid_signature(value.decode("latin-1"), scope["method"], scope["path"]):
+                    return True
+                metrics.incr("profiling.rejected_signatures")
+                return False
+        return PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE
+    
+    async def __call__(self, scope, receive, send):
+        if not self._selected(scope):
+            return await self.app(scope, receive, send)
+        if not _busy.acquire(blocking=False):
+            metrics.incr("profiling.skipped_busy")
+            return await self.app(scope, receive, send)
+        
+        profile = RequestProfile(scope["method"], scope["path"], threading.get_ident())
+        token = _current.set(profile)
+        status = None
+        send_started = None
+        
+        async def send_wrapper(message):
+            nonlocal status, send_started
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                send_started = time.perf_counter()
+                message = {**message, "headers": [*message.get("headers", []), (b"x-profile-id", profile.id.encode())]}
+            await send(message)
+            if message["type"] == "http.response.body" and not message.get("more_body") and send_started:
+                profile.add_phase("send", time.perf_counter() - send_started)
+        
+        profile.start()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            profile.stop()
+            _current.reset(token)
+            _busy.release()
+            try:
+                path = await asyncio.to_thread(profile.write, status)
+                metrics.incr("profiling.requests")
+                logger.info("Request profiled", extra={"profile": path, "seconds": round(profile.elapsed, 3)})
+            except Exception as e:
+                logger.warning("Writing request profile failed: %s", e)
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3 or not PROFILE_SECRET:
+        sys.exit(__doc__)
+    print(f"X-Profile: {sign(sys.argv[1].upper(), sys.argv[2])}")
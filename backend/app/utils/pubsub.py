@@ -0,0 +1,56 @@
+import os
+import time
+import asyncio
+from collections import defaultdict
+from typing import Dict, Any, Set
+
+from utils import metrics
+
+PUBSUB_QUEUE_SIZE = int(os.getenv("PUBSUB_QUEUE_SIZE", "100"))
+
+class PubSub:
+    """In-process fan-out of events to the connections of each user"""
+    
+    def __init__(self, queue_size: int = PUBSUB_QUEUE_SIZE):
+        self.queue_size = queue_size
+        self.subscribers: Dict[str, Set[asyncio.Queue]] = defaultdict(set)
+        self.connections = 0
+    
+    def subscribe(self, user_id: str) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        self.subscribers[user_id].add(queue)
+        self.connections += 1
+        metrics.set_gauge("realtime.connections", self.connections)
+        metrics.set_gauge("realtime.subscribed_users", len(self.subscribers))
+        return queue
+    
+    def unsubscribe(self, user_id: str, queue: asyncio.Queue) -> None:
+        queues = self.subscribers.get(user_id)
+        if queues is None or queue not in queues:
+            return
+        queues.discard(queue)
+        if not queues:
+            del self.subscribers[user_id]
+        self.connections -= 1
+        metrics.set_gauge("realtime.connections", self.connections)
+        metrics.set_gauge("realtime.subscribed_users", len(self.subscribers))
+    
+    def publish(self, user_id: str, event: Dict[str, Any]) -> int:
+        """Deliver an event to every connection of a user, dropping the oldest event for slow clients"""
+        
+        queues = self.subscribers.get(user_id)
+        if not queues:
+            return 0
+        
+        started = time.perf_counter()
+        for queue in queues:
+            if queue.full():
+                queue.get_nowait()
+                metrics.incr("realtime.events_dropped")
+            queue.put_nowait(event)
+        
+        metrics.incr("realtime.events_delivered", len(queues))
+        metrics.incr("realtime.fanout_seconds", time.perf_counter() - started)
+        return len(queues)
+
+pubsub = PubSub()
@@ -0,0 +1,70 @@
+"""Summarize `python -X importtime` for the API entry point.
+
+Usage (from the repository root):
+    python backend/benchmarks/import_time.py
+    python backend/benchmarks/import_time.py --module graph.workflow --top 30
+    python backend/benchmarks/import_time.py --forbid langchain,langgraph
+
+With --forbid the script exits non-zero if any of the listed packages is
+imported, which keeps the AI stack out of worker startup.
+"""
+import argparse
+import os
+import re
+import subprocess
+import sys
+
+APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app")
+LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)")
+
+def measure(module: str):
+    """Run a fresh interpreter and parse its import timings"""
+    
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=APP_DIR, capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        sys.exit(f"import {module} failed:\n{result.stderr[-2000:]}")
+    
+    entries = []
+    for line in result.stderr.splitlines():
+        match = LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            entries.append({
+                "name": name,
+                "self_us": int(self_us),
+                "cumulative_us": int(cumulative_us),
+                "depth": (len(indent) - 1) // 2
+            })
+    return entries
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--module", default="main")
+    parser.add_argument("--top", type=int, default=20)
+    parser.add_argument("--forbid", default="", help="comma separated top-level packages that must not be imported")
+    args = parser.parse_args()
+    
+    entries = measure(args.module)
+    top_level = [entry for entry in entries if entry["depth"] == 0]
+    total_us = sum(entry["cumulative_us"] for entry in top_level)
+    
+    packages = {}
+    for entry in entries:
+        root = entry["name"].split(".")[0]
+        packages[root] = packages.get(root, 0) + entry["self_us"]
+    
+    print(f"import {args.module}: {total_us / 1000:.1f} ms across {len(entries)} modules\n")
+    print(f"{'package':<32}{'self ms':>10}")
+    for name, self_us in sorted(packages.items(), key=lambda item: item[1], reverse=True)[:args.top]:
+        print(f"{name:<32}{self_us / 1000:>10.1f}")
+    
+    forbidden = [name for name in args.forbid.split(",") if name]
+    imported = sorted(name for name in forbidden if name in packages)
+    if imported:
+        sys.exit(f"\nforbidden packages imported at startup: {', '.join(imported)}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""Compare the planner's json and compact output formats.
+
+Usage (from the repository root):
+    python backend/benchmarks/planner_format.py                  # encoded size of a synthetic plan
+    python backend/benchmarks/planner_format.py --tasks 200 --count-tokens
+    python backend/benchmarks/planner_format.py --live --runs 3  # real planner calls, needs GOOGLE_API_KEY
+
+Offline, a synthetic plan is encoded the way each format asks the model to
+write it, and the sizes are compared (tokens are estimated at 4 characters
+each unless --count-tokens asks Gemini to count them). With --live the
+planner is called for the same goal in both formats, and wall-clock time
+and the output tokens reported by the model are compared.
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+
+from agents import planner, milestones
+
+START = datetime(2026, 1, 1)
+GOAL = {
+    "main_objective": "Read 'Designing Data-Intensive Applications' and take notes on every chapter",
+    "target_metrics": [{"metric": "Pages read", "target": "600", "unit": "pages"}],
+    "timeline": "100 days",
+    "key_milestones": ["Part I", "Part II", "Part III"],
+    "success_criteria": "Every chapter read and summarised"
+}
+
+def synthetic_tasks(count: int):
+    return [
+        {
+            "title": f"Read pages {index * 6 + 1}-{index * 6 + 6} and summarise",
+            "description": f"Read the next six pages of chapter {index // 10 + 1} and write a short summary of the key ideas.",
+            "target_date": (START + timedelta(days=index)).date().isoformat(),
+            "unit": "pages",
+            "target_value": 6.0,
+            "priority": ("high", "medium", "low")[index % 3]
+        }
+        for index in range(count)
+    ]
+
+def encode_json(tasks) -> str:
+    # Models write this format pretty-printed, as in the prompt
+    return json.dumps({"tasks": tasks, "plan_summary": "Read the book in 100 days."}, indent=4)
+
+def encode_compact(tasks) -> str:
+    rows = [
+        [task["title"], task["description"], (datetime.fromisoformat(task["target_date"]) - START).days,
+         task["unit"], task["target_value"], task["priority"][0]]
+        for task in tasks
+    ]
+    return json.dumps({"rows": rows, "plan_summary": "Read the book in 100 days."}, separators=(",", ":"))
+
+def count_tokens(text: str, exact: bool) -> int:
+    if not exact:
+        return len(text) // 4
+    from langchain_google_genai import ChatGoogleGenerativeAI
+    return ChatGoogleGenerativeAI(model="gemini-2.0-flash", google_api_key=os.getenv("GOOGLE_API_KEY")).get_num_tokens(text)
+
+def offline(args) -> None:
+    tasks = synthetic_tasks(args.tasks)
+    encoded = {"json": encode_json(tasks), "compact": encode_compact(tasks)}
+    expanded = planner.expand_rows(json.loads(encoded["compact"])["rows"], START, START + timedelta(days=args.tasks))
+    assert [task["target_date"] for task in expanded] == [task["target_date"] for task in tasks]
+    
+    label = "tokens" if args.count_tokens else "~tokens"
+    sizes = {name: (len(text), count_tokens(text, args.count_tokens)) for name, text in encoded.items()}
+    for name, (chars, tokens) in sizes.items():
+        print(f"{name:8} {chars:8,} chars {tokens:8,} {label}")
+    print(f"compact/json: {sizes['compact'][1] / sizes['json'][1]:.2f} of the output tokens")
+
+class UsageRecorder:
+    """Passes calls to the chat model and keeps the output token counts it reports"""
+    
+    def __init__(self, llm):
+        self.llm = llm
+        self.output_tokens = []
+    
+    async def ainvoke(self, messages):
+        response = await self.llm.ainvoke(messages)
+        usage = getattr(response, "usage_metadata", None) or {}
+        self.output_tokens.append(usage.get("output_tokens", 0))
+        return response
+
+async def live(args) -> None:
+    state = {
+        "parsed_goal": GOAL, "plan_type": "study",
+        "start_date": START.isoformat(), "end_date": (START + timedelta(days=100)).isoformat()
+    }
+    # A 100-day plan would otherwise be created as milestones, with only the first one's tasks
+    milestones.HIERARCHICAL_PLANS_ENABLED = False
+    for output_format in ("json", "compact"):
+        planner.PLANNER_OUTPUT_FORMAT = output_format
+        agent = planner.PlannerAgent()
+        recorder = UsageRecorder(agent.llm.llm)
+        agent.llm.llm = recorder
+        timings, task_counts = [], []
+        for _ in range(args.runs):
+            started = time.perf_counter()
+            result = await agent.create_plan(dict(state))
+            timings.append(time.perf_counter() - started)
+            task_counts.append(len(result.get("planned_tasks") or []))
+            if result.get("status") == "error":
+                print(f"{output_format}: {result['error']}")
+        print(f"{output_format:8} median {statistics.median(timings):6.1f}s, "
+              f"{statistics.median(recorder.output_tokens):7,.0f} output tokens, "
+              f"{statistics.median(task_counts):4.0f} tasks")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tasks", type=int, default=120)
+    parser.add_argument("--count-tokens", action="store_true", help="count tokens with Gemini instead of estimating")
+    parser.add_argument("--live", action="store_true", help="call the planner in both formats")
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+    if args.live:
+        asyncio.run(live(args))
+    else:
+        offline(args)
+
+if __name__ == "__main__":
+    main()
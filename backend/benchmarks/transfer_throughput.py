@@ -0,0 +1,119 @@
+"""Measure export and import throughput of db.transfer on a synthetic user.
+
+Usage (from the repository root, with `uri` set as for the API):
+    python backend/benchmarks/transfer_throughput.py
+    python backend/benchmarks/transfer_throughput.py --docs 100000 --gzip
+
+The dataset (plans, tasks and progress logs totalling --docs documents) is
+written to a scratch database, which is dropped afterwards unless --keep is
+given. Peak RSS is reported to check that memory stays flat as --docs grows.
+"""
+import argparse
+import asyncio
+import os
+import resource
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+
+from bson import ObjectId
+
+from db import connection
+from db import transfer
+
+TASKS_PER_PLAN = 50
+LOGS_PER_TASK = 19  # With one plan and 50 tasks, 1000 documents per plan
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+async def seed(user_id: str, docs: int, batch_size: int) -> int:
+    """Insert a synthetic user dataset of roughly `docs` documents"""
+    
+    plans = connection.get_collection("plans")
+    tasks = connection.get_collection("tasks")
+    logs = connection.get_collection("progress_logs")
+    start = datetime(2025, 1, 1)
+    per_plan = 1 + TASKS_PER_PLAN * (1 + LOGS_PER_TASK)
+    written = 0
+    
+    for plan_number in range(max(1, docs // per_plan)):
+        plan_id = ObjectId()
+        await plans.insert_one({
+            "_id": plan_id, "user_id": user_id, "title": f"Plan {plan_number}", "plan_type": "study",
+            "description": "Synthetic benchmark plan", "start_date": start, "end_date": start + timedelta(days=365),
+            "created_at": start, "is_active": True, "workflow_status": "completed", "version": 0, "updated_at": start
+        })
+        task_docs, log_docs = [], []
+        for task_number in range(TASKS_PER_PLAN):
+            task_id = ObjectId()
+            task_docs.append({
+                "_id": task_id, "plan_id": plan_id, "user_id": user_id, "title": f"Task {task_number}",
+                "description": "Read 20 pages", "target_date": start + timedelta(days=task_number * 7),
+                "status": "in_progress", "unit": "pages", "target_value": 20.0, "current_value": 5.0,
+                "created_at": start, "version": 0, "updated_at": start
+            })
+            log_docs.extend({
+                "task_id": str(task_id), "user_id": user_id, "date": start + timedelta(days=log_number),
+                "status": "in_progress", "value": float(log_number), "note": "Synthetic progress",
+                "created_at": start + timedelta(days=log_number)
+            } for log_number in range(LOGS_PER_TASK))
+        await tasks.insert_many(task_docs)
+        for offset in range(0, len(log_docs), batch_size):
+            await logs.insert_many(log_docs[offset:offset + batch_size])
+        written += 1 + len(task_docs) + len(log_docs)
+    
+    return written
+
+async def run(args) -> None:
+    await connection.init_db()
+    connection.db.database = connection.db.client[args.database]
+    transfer.TRANSFER_BATCH_SIZE = args.batch_size
+    source_user, target_user = "bench-source", "bench-target"
+    path = os.path.join(tempfile.gettempdir(), "transfer-bench.ndjson" + (".gz" if args.gzip else ""))
+    
+    try:
+        started = time.perf_counter()
+        written = await seed(source_user, args.docs, args.batch_size)
+        print(f"seeded {written} documents in {time.perf_counter() - started:.1f}s")
+        
+        started = time.perf_counter()
+        stream = transfer.export_user_data(source_user)
+        if args.gzip:
+            stream = transfer.gzip_stream(stream)
+        with open(path, "wb") as file:
+            async for chunk in stream:
+                file.write(chunk)
+        elapsed = time.perf_counter() - started
+        size_mb = os.path.getsize(path) / (1024 * 1024)
+        print(f"export: {written / elapsed:,.0f} docs/s, {size_mb:.1f} MB, peak RSS {peak_rss_mb():.0f} MB")
+        
+        started = time.perf_counter()
+        stats = await transfer.import_user_data(target_user, transfer.file_chunks(path))
+        elapsed = time.perf_counter() - started
+        imported = stats["plans"] + stats["tasks"] + stats["progress_logs"]
+        print(f"import: {imported / elapsed:,.0f} docs/s ({stats}), peak RSS {peak_rss_mb():.0f} MB")
+    
+    finally:
+        if os.path.exists(path):
+            os.remove(path)
+        if not args.keep:
+            await connection.db.client.drop_database(args.database)
+        await connection.close_db()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--docs", type=int, default=1_000_000)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--gzip", action="store_true")
+    parser.add_argument("--database", default="agentic_planner_transfer_bench")
+    parser.add_argument("--keep", action="store_true", help="keep the scratch database")
+    asyncio.run(run(parser.parse_args()))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""Plans stored by the workflow are found and adapted for a similar goal"""
+import asyncio
+from types import SimpleNamespace
+
+from bson import ObjectId
+
+from agents import plan_library
+from agents.plan_library import PlanLibrary
+
+class FakeCursor:
+    def __init__(self, documents):
+        self.documents = documents
+    
+    def limit(self, count):
+        return FakeCursor(self.documents[:count])
+    
+    async def to_list(self, length):
+        return list(self.documents)
+
+class FakeCollection:
+    """The part of a Motor collection the plan library uses, with equality and $in filters"""
+    
+    def __init__(self):
+        self.documents = []
+    
+    def _matches(self, document, query):
+        for key, condition in query.items():
+            value = document.get(key)
+            if isinstance(condition, dict) and "$in" in condition:
+                values = value if isinstance(value, list) else [value]
+                if not set(values) & set(condition["$in"]):
+                    return False
+            elif value != condition:
+                return False
+        return True
+    
+    def find(self, query, projection=None):
+        return FakeCursor([document for document in self.documents if self._matches(document, query)])
+    
+    async def find_one(self, query):
+        return next((document for document in self.documents if self._matches(document, query)), None)
+    
+    async def insert_one(self, document):
+        document = {"_id": ObjectId(), **document}
+        self.documents.append(document)
+        return SimpleNamespace(inserted_id=document["_id"])
+    
+    async def update_one(self, query, update):
+        return SimpleNamespace(modified_count=1)
+
+GOAL = {
+    "main_objective": "Read 300 pages of a history book",
+    "target_metrics": [{"metric": "Pages read", "target": "300", "unit": "pages"}]
+}
+
+def test_remembered_plan_is_adapted_for_api_dates(monkeypatch):
+    monkeypatch.setattr(plan_library, "PLAN_LIBRARY_ENABLED", True)
+    library = PlanLibrary.__new__(PlanLibrary)
+    library.collection = FakeCollection()
+    generated = {
+        "plan_id": "plan-1", "user_id": "user-1", "plan_type": "study", "parsed_goal": GOAL,
+        "start_date": "2026-01-01T00:00:00.000Z", "end_date": "2026-01-31T00:00:00.000Z",
+        "plan_summary": "Read 300 pages in a month",
+        "planned_tasks": [
+            {"title": "Read 150 pages", "description": "", "target_date": "2026-01-16",
+             "unit": "pages", "target_value": 150.0, "priority": "medium"},
+            {"title": "Read 150 pages", "description": "", "target_date": "2026-01-31",
+             "unit": "pages", "target_value": 150.0, "priority": "medium"}
+        ]
+    }
+    
+    asyncio.run(library.remember(generated))
+    assert len(library.collection.documents) == 1
+    
+    new_goal = {**GOAL, "target_metrics": [{"metric": "Pages read", "target": "320", "unit": "pages"}]}
+    state = asyncio.run(library.plan_from_library({
+        "plan_id": "plan-2", "user_id": "user-1", "plan_type": "study", "parsed_goal": new_goal,
+        "start_date": "2026-03-01T00:00:00.000Z", "end_date": "2026-03-31T00:00:00.000Z", "status": "goal_parsed"
+    }))
+    
+    assert state["status"] == "plan_created"
+    assert [task["target_date"] for task in state["planned_tasks"]] == ["2026-03-16", "2026-03-31"]
+    assert [task["target_value"] for task in state["planned_tasks"]] == [160.0, 160.0]
@@ -0,0 +1,94 @@
+"""Plans created with API-shaped dates, which carry a UTC offset (toISOString() ends in "Z")"""
+import asyncio
+import json
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+from agents import planner, milestones
+from utils.dates import parse_utc
+
+def api_date(day: datetime) -> str:
+    return day.strftime("%Y-%m-%dT%H:%M:%S.000Z")
+
+class FakeLLM:
+    """Answers skeleton prompts with the given phases and phase prompts with one task at the phase start"""
+    
+    def __init__(self, phases):
+        self.phases = phases
+    
+    async def ainvoke(self, messages):
+        prompt = messages[0].content
+        if "Split the goal's timeline" in prompt:
+            return SimpleNamespace(content=json.dumps({"phases": self.phases}))
+        phase_start = prompt.split("Phase duration: ")[1][:10]
+        return SimpleNamespace(content=json.dumps({"tasks": [{
+            "title": "Work", "description": "", "target_date": phase_start,
+            "unit": None, "target_value": None, "priority": "medium"
+        }]}))
+
+def phases_over(start: datetime, count: int, days: int):
+    return [
+        {
+            "title": f"Skeleton {index + 1}", "milestone": "", "focus": "",
+            "start_date": (start + timedelta(days=index * days)).date().isoformat(),
+            "end_date": (start + timedelta(days=(index + 1) * days)).date().isoformat()
+        }
+        for index in range(count)
+    ]
+
+def agent_with(phases) -> planner.PlannerAgent:
+    agent = planner.PlannerAgent.__new__(planner.PlannerAgent)
+    agent.llm = FakeLLM(phases)
+    return agent
+
+def test_parse_utc_returns_naive_utc():
+    assert parse_utc("2026-03-01T22:30:00.000Z") == datetime(2026, 3, 1, 22, 30)
+    assert parse_utc("2026-03-01T22:30:00+02:00") == datetime(2026, 3, 1, 20, 30)
+    assert parse_utc("2026-03-01") == datetime(2026, 3, 1)
+
+def test_milestone_plan_accepts_api_dates(monkeypatch):
+    monkeypatch.setattr(planner, "PLANNER_OUTPUT_FORMAT", "json")
+    monkeypatch.setattr(milestones, "HIERARCHICAL_PLANS_ENABLED", True)
+    start = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(days=1)
+    state = {
+        "parsed_goal": {"main_objective": "Read a long book"}, "plan_type": "study",
+        "start_date": api_date(start), "end_date": api_date(start + timedelta(days=84))
+    }
+    
+    result = asyncio.run(agent_with(phases_over(start, 4, 21)).create_plan(state))
+    
+    assert result["status"] == "plan_created", result.get("error")
+    assert len(result["milestones"]) == 4
+    assert result["milestones"][0]["state"] == milestones.EXPANDED
+    assert result["planned_tasks"]
+
+def test_segmented_plan_keeps_skeleton_for_api_dates(monkeypatch):
+    monkeypatch.setattr(planner, "PLANNER_OUTPUT_FORMAT", "json")
+    monkeypatch.setattr(milestones, "HIERARCHICAL_PLANS_ENABLED", False)
+    start = datetime(2026, 1, 1)
+    state = {
+        "parsed_goal": {"main_objective": "Train for a marathon"}, "plan_type": "fitness",
+        "start_date": api_date(start), "end_date": api_date(start + timedelta(days=180))
+    }
+    
+    result = asyncio.run(agent_with(phases_over(start, 6, 30)).create_plan(state))
+    
+    assert result["status"] == "plan_created", result.get("error")
+    # The model's phases are used, not the even fallback
+    assert "Skeleton 1" in result["plan_summary"]
+    assert [task["target_date"] for task in result["planned_tasks"]][:2] == ["2026-01-01", "2026-01-31"]
+
+def test_phases_and_tasks_clamped_to_api_dates():
+    agent = agent_with([])
+    start, end = parse_utc("2026-01-01T00:00:00.000Z"), parse_utc("2026-03-01T00:00:00.000Z")
+    
+    phases = agent._validate_phases(phases_over(start - timedelta(days=10), 3, 30), start, end)
+    tasks = agent._clamp_tasks([
+        {"title": "Early", "target_date": "2025-12-20"},
+        {"title": "Offset", "target_date": "2026-01-15T23:00:00-05:00"},
+        {"title": "Late", "target_date": "2026-05-01"}
+    ], start, end)
+    
+    assert [phase["title"] for phase in phases] == ["Skeleton 1", "Skeleton 2", "Skeleton 3"]
+    assert phases[0]["start"] == start and phases[-1]["end"] == end
+    assert [task["target_date"] for task in tasks] == ["2026-01-01", "2026-01-16", "2026-03-01"]
@@ -0,0 +1,52 @@
+"""Buffered progress survives a flush being cancelled, as at shutdown"""
+import asyncio
+from types import SimpleNamespace
+
+from bson import ObjectId
+
+from agents import progress_buffer as buffer_module
+from agents.progress_buffer import ProgressWriteBuffer
+
+class SlowCollection:
+    """Records writes; the first one hangs until cancelled"""
+    
+    def __init__(self):
+        self.inserted = []
+        self.bulk_writes = []
+        self.started = asyncio.Event()
+        self.hang = True
+    
+    async def insert_many(self, documents, ordered=True):
+        self.started.set()
+        if self.hang:
+            self.hang = False
+            await asyncio.sleep(3600)
+        self.inserted.extend(documents)
+    
+    async def bulk_write(self, operations, ordered=True):
+        self.bulk_writes.extend(operations)
+    
+    def find(self, query, projection=None):
+        return SimpleNamespace(to_list=lambda length: asyncio.sleep(0, result=[]))
+
+def test_cancelled_flush_is_written_by_close(monkeypatch):
+    collection = SlowCollection()
+    monkeypatch.setattr(buffer_module, "get_collection", lambda name: collection)
+    
+    async def scenario():
+        buffer = ProgressWriteBuffer(max_events=100, interval=3600)
+        task_id = str(ObjectId())
+        log_id = buffer.add(task_id, "user-1", "in_progress", delta=5)
+        
+        flush = asyncio.create_task(buffer.flush())
+        await collection.started.wait()
+        flush.cancel()
+        await asyncio.gather(flush, return_exceptions=True)
+        
+        await buffer.close()
+        return log_id
+    
+    log_id = asyncio.run(scenario())
+    
+    assert [str(log["_id"]) for log in collection.inserted] == [log_id]
+    assert len(collection.bulk_writes) == 1
@@ -0,0 +1,47 @@
+"""Velocity-based rescheduling only ever stretches a plan and keeps its totals"""
+from datetime import datetime, timedelta
+
+from agents.rescheduler import compute_schedule
+
+START = datetime(2026, 1, 1)
+PLAN = {"start_date": START, "end_date": START + timedelta(days=100)}
+
+def reading_tasks(read_by_day_20: float):
+    # Ten 10-page tasks every 10 days; the first two are due by day 20
+    tasks = []
+    for index in range(10):
+        current = min(max(read_by_day_20 - index * 10, 0), 10) if index < 2 else 0
+        tasks.append({
+            "_id": f"t{index}", "version": 1, "unit": "pages", "target_value": 10.0, "current_value": current,
+            "status": "completed" if current >= 10 else "in_progress" if current else "pending",
+            "target_date": START + timedelta(days=10 * (index + 1))
+        })
+    return tasks
+
+def apply(tasks, updates):
+    fields = {update["_id"]: update["fields"] for update in updates}
+    return [{**task, **fields.get(task["_id"], {})} for task in tasks]
+
+def test_behind_schedule_is_stretched_with_the_total_kept():
+    tasks = reading_tasks(read_by_day_20=10)
+    updates = compute_schedule(PLAN, tasks, START + timedelta(days=20))
+    after = apply(tasks, updates)
+    
+    assert updates
+    assert "t0" not in {update["_id"] for update in updates}
+    assert all(new["target_date"] >= old["target_date"] for old, new in zip(tasks, after))
+    assert max(task["target_date"] for task in after) <= PLAN["end_date"]
+    assert round(sum(task["target_value"] for task in after), 2) == 100.0
+    assert all(update["version"] == 1 for update in updates)
+
+def test_ahead_of_schedule_is_left_alone():
+    tasks = reading_tasks(read_by_day_20=20)
+    assert compute_schedule(PLAN, tasks, START + timedelta(days=15)) == []
+
+def test_overdue_task_without_progress_is_moved_ahead():
+    tasks = reading_tasks(read_by_day_20=0)
+    now = START + timedelta(days=12)
+    updates = compute_schedule(PLAN, tasks, now)
+    
+    assert [update["_id"] for update in updates] == ["t0"]
+    assert updates[0]["fields"]["target_date"] > now